@@ -1,14 +1,30 @@
 #include <iostream>
+#include <cstdint>
 #include <vector>
 #include <string>
 #include <sstream>
-#include <set>
 #include <map>
-#include <stack>
 #include <optional>
-#include <tuple>
+#include <functional>
 #include <algorithm>
 #include <stdexcept>
+#include <deque>
+#include <memory>
+#include <thread>
+#include <mutex>
+#include <condition_variable>
+#include <atomic>
+#include <chrono>
+#include <climits>
+#include <cstring>
+#if defined(_MSC_VER)
+#include <intrin.h>
+#endif
+#if defined(_WIN32)
+#include <cstdio>
+#include <io.h>
+#include <fcntl.h>
+#endif
 
 // Coord type
 using Coord = std::pair<int, int>;
@@ -47,12 +63,12 @@ std::vector<int> _parse_ints(const std::string& line) {
     return parts;
 }
 
-std::pair<int, std::vector<std::vector<int>>> parse_input() {
+std::pair<int, std::vector<std::vector<int>>> parse_input(std::istream& in = std::cin) {
     std::string line;
     int K;
 
     // Read K
-    if (!std::getline(std::cin, line)) {
+    if (!std::getline(in, line)) {
         throw std::runtime_error("һб K");
     }
     try {
@@ -63,7 +79,7 @@ std::pair<int, std::vector<std::vector<int>>> parse_input() {
     }
 
     // Read first row of matrix
-    if (!std::getline(std::cin, line)) {
+    if (!std::getline(in, line)) {
         throw std::runtime_error("ȡʧ");
     }
     std::vector<int> first_row;
@@ -82,7 +98,7 @@ std::pair<int, std::vector<std::vector<int>>> parse_input() {
     std::vector<std::vector<int>> grid = { first_row };
 
     for (int i = 0; i < m - 1; ++i) {
-        if (!std::getline(std::cin, line)) {
+        if (!std::getline(in, line)) {
             throw std::runtime_error("㣬 " + std::to_string(m) + " УУ");
         }
         try {
@@ -107,10 +123,188 @@ std::pair<int, std::vector<std::vector<int>>> parse_input() {
     return { K, grid };
 }
 
+// Row/column bitmask for boards up to 128x128: bit i is column i of a row (or row i of a column)
+struct Bits128 {
+    uint64_t lo = 0, hi = 0;
+
+    bool test(int i) const { return i < 64 ? (lo >> i) & 1 : (hi >> (i - 64)) & 1; }
+    void set(int i) {
+        if (i < 64) lo |= 1ULL << i;
+        else hi |= 1ULL << (i - 64);
+    }
+    void reset(int i) {
+        if (i < 64) lo &= ~(1ULL << i);
+        else hi &= ~(1ULL << (i - 64));
+    }
+    bool any() const { return (lo | hi) != 0; }
+    int count() const { return _popcount64(lo) + _popcount64(hi); }
+    // Index of the lowest set bit (requires any())
+    int lowest() const { return lo ? _ctz64(lo) : 64 + _ctz64(hi); }
+
+    Bits128 operator&(const Bits128& o) const { return { lo & o.lo, hi & o.hi }; }
+    Bits128 operator|(const Bits128& o) const { return { lo | o.lo, hi | o.hi }; }
+    Bits128 operator^(const Bits128& o) const { return { lo ^ o.lo, hi ^ o.hi }; }
+    Bits128 andnot(const Bits128& o) const { return { lo & ~o.lo, hi & ~o.hi }; }
+    Bits128 shl1() const { return { lo << 1, (hi << 1) | (lo >> 63) }; }
+    Bits128 shr1() const { return { (lo >> 1) | (hi << 63), hi >> 1 }; }
+    // Bits adjacent (i-1 / i+1) to any set bit
+    Bits128 spread() const { return shl1() | shr1(); }
+    // Bits 0..n-1 in reverse order (bit i -> bit n-1-i)
+    Bits128 reversed(int n) const {
+        Bits128 out;
+        for (Bits128 b = *this; b.any(); ) {
+            int i = b.lowest();
+            b.reset(i);
+            out.set(n - 1 - i);
+        }
+        return out;
+    }
+
+    static int _popcount64(uint64_t x) {
+#if defined(_MSC_VER)
+        return (int)__popcnt64(x);
+#else
+        return __builtin_popcountll(x);
+#endif
+    }
+    static int _ctz64(uint64_t x) {
+#if defined(_MSC_VER)
+        unsigned long idx;
+        _BitScanForward64(&idx, x);
+        return (int)idx;
+#else
+        return __builtin_ctzll(x);
+#endif
+    }
+};
+
+// Search statistics (--stats). Each solver copy counts its own; copies are merged with +=.
+// A rule "fires" for every cell it assigns and has a "conflict" whenever it refuses an
+// assignment or finds a line it can no longer satisfy (a hint conflict may also be counted
+// under the rule that refused one of the hint's cells).
+struct SearchStats {
+    enum Rule { ROW, COL, DIAG, HINT, STRAIGHT, FLEET, RULE_COUNT };
+    enum Reject { REJ_COUNTS, REJ_DIAG, REJ_STRAIGHT, REJ_HINT, REJ_FLEET, REJECT_COUNT };
+    enum Phase { PROPAGATE, CHOOSE_VAR, FINAL_CHECK, FLEET_FITS, PHASE_COUNT };
+    static constexpr const char* RULE_NAMES[RULE_COUNT] = { "row", "col", "diagonal", "hint", "straight", "fleet" };
+    static constexpr const char* REJECT_NAMES[REJECT_COUNT] = { "counts", "diagonal", "straight", "hint", "fleet" };
+
+    long long nodes = 0;        // enumerate_all calls
+    long long backtracks = 0;   // nodes that ended in a contradiction or a rejected board
+    long long decisions = 0;    // branching assignments tried
+    long long final_checks = 0;
+    size_t max_trail = 0;       // most cells assigned at once on a search path
+    long long fires[RULE_COUNT] = {};
+    long long conflicts[RULE_COUNT] = {};
+    long long rejects[REJECT_COUNT] = {};   // _final_check rejections by reason
+    long long memo_probes = 0;  // transposition table lookups (--memo)
+    long long memo_hits = 0;    // subtrees answered from the table instead of searched
+    long long memo_stores = 0;
+    long long row_states = 0;   // profiles of the row sweep count (--count-method)
+    long long sym_prunes = 0;   // nodes cut because no completion is canonical (--symmetry)
+    std::chrono::steady_clock::duration phase_time[PHASE_COUNT] = {};
+    bool timing = false;        // measure phase times (two clock reads per phase entry)
+
+    void clear() {
+        bool t = timing;
+        *this = SearchStats();
+        timing = t;
+    }
+
+    SearchStats& operator+=(const SearchStats& o) {
+        nodes += o.nodes;
+        backtracks += o.backtracks;
+        decisions += o.decisions;
+        final_checks += o.final_checks;
+        max_trail = std::max(max_trail, o.max_trail);
+        for (int i = 0; i < RULE_COUNT; ++i) {
+            fires[i] += o.fires[i];
+            conflicts[i] += o.conflicts[i];
+        }
+        for (int i = 0; i < REJECT_COUNT; ++i) rejects[i] += o.rejects[i];
+        memo_probes += o.memo_probes;
+        memo_hits += o.memo_hits;
+        memo_stores += o.memo_stores;
+        row_states += o.row_states;
+        sym_prunes += o.sym_prunes;
+        for (int i = 0; i < PHASE_COUNT; ++i) phase_time[i] += o.phase_time[i];
+        return *this;
+    }
+
+    // One line of JSON; phase times are summed over threads, `total_ms` is wall time
+    std::string to_json(long long solutions, double total_ms, int threads) const {
+        static const char* PHASES[PHASE_COUNT] = { "propagate", "choose_var", "final_check", "fleet_fits" };
+        auto ms = [](std::chrono::steady_clock::duration d) {
+            return std::chrono::duration_cast<std::chrono::microseconds>(d).count() / 1000.0;
+        };
+        std::ostringstream js;
+        js << "{\"nodes\":" << nodes << ",\"backtracks\":" << backtracks << ",\"decisions\":" << decisions
+           << ",\"solutions\":" << solutions << ",\"max_trail_depth\":" << max_trail << ",\"propagation\":{";
+        for (int i = 0; i < RULE_COUNT; ++i)
+            js << (i ? "," : "") << '"' << RULE_NAMES[i] << "\":{\"fires\":" << fires[i] << ",\"conflicts\":" << conflicts[i] << '}';
+        js << "},\"final_check\":{\"calls\":" << final_checks << ",\"rejected\":{";
+        for (int i = 0; i < REJECT_COUNT; ++i) js << (i ? "," : "") << '"' << REJECT_NAMES[i] << "\":" << rejects[i];
+        js << "}},\"memo\":{\"probes\":" << memo_probes << ",\"hits\":" << memo_hits  << ",\"stores\":" << memo_stores
+           << "},\"row_states\":" << row_states << ",\"symmetry_prunes\":" << sym_prunes << ",\"time_ms\":{\"total\":" << total_ms;
+        if (timing)
+            for (int i = 0; i < PHASE_COUNT; ++i) js << ",\"" << PHASES[i] << "\":" << ms(phase_time[i]);
+        js << "},\"threads\":" << threads << '}';
+        return js.str();
+    }
+};
+
+// Adds the time spent in a scope to one phase of `stats` (only when stats.timing is set)
+struct PhaseTimer {
+    SearchStats& stats;
+    SearchStats::Phase phase;
+    std::chrono::steady_clock::time_point t0;
+
+    PhaseTimer(SearchStats& stats, SearchStats::Phase phase) : stats(stats), phase(phase) {
+        if (stats.timing) t0 = std::chrono::steady_clock::now();
+    }
+    ~PhaseTimer() {
+        if (stats.timing) stats.phase_time[phase] += std::chrono::steady_clock::now() - t0;
+    }
+};
+
+// A solved board packed into n*n bits: bit r*n+c (row-major, least significant bit first
+// within each word) is set for a ship cell, clear for water
+using PackedBoard = std::vector<uint64_t>;
+
+inline bool packed_ship(const uint64_t* bits, size_t i) { return (bits[i >> 6] >> (i & 63)) & 1; }
+
 class BattleshipDirectionalSolver {
 public:
-    BattleshipDirectionalSolver(int K, const std::vector<std::vector<int>>& matrix) : K(K), M(matrix) {
+    static const int MAX_N = 128;
+
+    // One branching decision of the search: cell (r, c) set to val, one of `branches`
+    // values the cell could take at that node
+    struct Decision {
+        int r, c, val, branches;
+    };
+
+    SearchStats stats;
+
+    // Progress estimate (--progress): every node gets the weight of its parent divided by the
+    // parent's number of branches (the root weighs 1), and `explored` adds up the weight of
+    // every finished subtree, so it approaches 1 as the search completes
+    double explored = 0;
+    // Called every TICK_NODES nodes when set (progress reports, publishing to other threads)
+    std::function<void()> tick;
+    static const long long TICK_NODES = 1024;
+
+    // One slot of the transposition table (--memo), see _memo_key
+    struct MemoEntry {
+        uint64_t key = 0, check = 0;    // check == 0: empty slot
+        long long count = 0;            // solutions in the subtree
+        uint32_t work = 0;              // nodes it took to search, for replacement
+    };
+
+    BattleshipDirectionalSolver(int K, const std::vector<std::vector<int>>& matrix) : K(K) {
         n = (int)matrix.size() - 1;
+        if (n > MAX_N) {
+            throw std::runtime_error("̹n Ϊ " + std::to_string(MAX_N));
+        }
 
         // Initialize row_target and col_target
         for (int i = 0; i < n; ++i) {
@@ -118,67 +312,36 @@ public:
             col_target.push_back(_nonneg(matrix[0][i + 1]));
         }
 
-        // Initialize board and dir_hint
-        board.assign(n, std::vector<int>(n, -1));
-        dir_hint.assign(n, std::vector<std::optional<char>>(n, std::nullopt));
+        // Initialize bitboards and dir_hint
+        ship.assign(n, Bits128());
+        water.assign(n, Bits128());
+        col_ship.assign(n, Bits128());
+        col_water.assign(n, Bits128());
+        adj_bits.assign(n, Bits128());
+        for (int i = 0; i < n; ++i) {
+            full.set(i);
+            if (i > 0) adj_bits[i].set(i - 1);
+            if (i + 1 < n) adj_bits[i].set(i + 1);
+        }
+        dir_hint.assign(n * n, 0);
+        unknown_total = n * n;
         // Hints: 'U','D','L','R'  'S' (solo, ҽˮ)
 
         for (int r = 0; r < n; ++r) {
             for (int c = 0; c < n; ++c) {
                 int v = matrix[r + 1][c + 1];
-                if (v >= -1 && v <= 6) {
-                    if (v == 1) {
-                        board[r][c] = 1;
-                    }
-                    else if (v == 0) {
-                        board[r][c] = 0;
-                    }
-                    else if (v == -1) {
-                        board[r][c] = -1;
-                    }
-                    else if (v == 2) {
-                        board[r][c] = 0;
-                        dir_hint[r][c] = 'U';
-                    }
-                    else if (v == 3) {
-                        board[r][c] = 0;
-                        dir_hint[r][c] = 'D';
-                    }
-                    else if (v == 4) {
-                        board[r][c] = 0;
-                        dir_hint[r][c] = 'L';
-                    }
-                    else if (v == 5) {
-                        board[r][c] = 0;
-                        dir_hint[r][c] = 'R';
-                    }
-                    else if (v == 6) {
-                        board[r][c] = 0;
-                        dir_hint[r][c] = 'S'; // 񽢣ڽˮ
-                    }
-                }
-                else {
+                if (v < -1 || v > 6) {
                     throw std::runtime_error("ڲӽ -1/0/1/2/3/4/5/6");
                 }
-            }
-        }
-
-        // Initialize counters
-        row_zero.assign(n, 0);
-        row_unknown.assign(n, 0);
-        col_zero.assign(n, 0);
-        col_unknown.assign(n, 0);
-
-        for (int r = 0; r < n; ++r) {
-            for (int c = 0; c < n; ++c) {
-                int v = board[r][c];
-                if (v == 0) {
-                    row_zero[r]++;
-                    col_zero[c]++;
+                if (v == 1) {
+                    _put(r, c, 1);
                 }
-                else if (v == -1) {
-                    row_unknown[r]++;
-                    col_unknown[c]++;
+                else if (v == 0 || v >= 2) {
+                    _put(r, c, 0);
+                    if (v >= 2) {
+                        dir_hint[r * n + c] = "UDLRS"[v - 2];
+                        hint_cells.push_back(r * n + c);
+                    }
                 }
             }
         }
@@ -191,217 +354,205 @@ public:
             if (!(0 <= col_target[i] && col_target[i] <= n)) {
                 throw std::runtime_error("" + std::to_string(i + 1) + "ʾЧ: " + std::to_string(col_target[i]));
             }
-            if (row_zero[i] > row_target[i]) {
+            if (row_zero(i) > row_target[i]) {
                 throw std::runtime_error("" + std::to_string(i + 1) + "֪սʾ");
             }
-            if (col_zero[i] > col_target[i]) {
+            if (col_zero(i) > col_target[i]) {
                 throw std::runtime_error("" + std::to_string(i + 1) + "֪սʾ");
             }
         }
 
         // Expected fleet
-        expected_fleet = _expected_fleet(K);
-        int total_target_cells = 0;
-        for (int t : row_target) total_target_cells += t;
-
-        int expected_cells = 0;
-        if (!expected_fleet.empty()) {
-            for (const auto& kv : expected_fleet) {
-                expected_cells += kv.first * kv.second;
-            }
-        }
-
+        std::map<int, int> expected_fleet = _expected_fleet(K);
         // ʼýӹУ飨 expected_cells ܺǷһ£
         enforce_fleet = !expected_fleet.empty();
+        expected_count.assign(std::max(n, K) + 1, 0);
+        for (const auto& kv : expected_fleet) expected_count[kv.first] = kv.second;
+        closed_count.assign(expected_count.size(), 0);
+        if (enforce_fleet) _seed_closed_ships();
 
         // Initial diagonal check
         for (int r = 0; r < n; ++r) {
             for (int c = 0; c < n; ++c) {
-                if (board[r][c] == 0 && _has_diag_zero(r, c)) {
+                if (ship[r].test(c) && _has_diag_zero(r, c)) {
                     throw std::runtime_error("ʼΥԽڹ(" + std::to_string(r + 1) + "," + std::to_string(c + 1) + ")");
                 }
             }
         }
+
+        // Every cell is assigned at most once per search path
+        trail.reserve(n * n);
+        cell_queue.reserve(n * n);
+        row_queued.assign(n, 0);
+        col_queued.assign(n, 0);
     }
 
     int mark() { return (int)trail.size(); }
 
     void undo(int mk) {
         while ((int)trail.size() > mk) {
-            auto [r, c, prev, d_r0, d_ru, d_c0, d_cu] = trail.back();
+            int packed = trail.back();
             trail.pop_back();
-
-            if (d_r0) row_zero[r] -= d_r0;
-            row_unknown[r] -= d_ru;
-            if (d_c0) col_zero[c] -= d_c0;
-            col_unknown[c] -= d_cu;
-
-            board[r][c] = prev;
+            int r = packed >> 8, c = packed & 0xff;
+            ship[r].reset(c);
+            water[r].reset(c);
+            col_ship[c].reset(r);
+            col_water[c].reset(r);
+            ++unknown_total;
+        }
+        while (!fleet_trail.empty() && fleet_trail.back().first > mk) {
+            closed_count[fleet_trail.back().second]--;
+            fleet_trail.pop_back();
         }
+        // Back at the initial clues, which were never propagated as a whole
+        if (trail.empty()) recheck_all = true;
     }
 
     bool assign(int r, int c, int val) {
-        int cur = board[r][c];
+        int cur = cell(r, c);
         if (cur == val) return true;
         if (cur != -1) return false;
 
         // Capacity constraints
         if (val == 0) {
-            if (row_zero[r] + 1 > row_target[r]) return false;
-            if (col_zero[c] + 1 > col_target[c]) return false;
+            if (row_zero(r) + 1 > row_target[r]) return _conflict(SearchStats::ROW);
+            if (col_zero(c) + 1 > col_target[c]) return _conflict(SearchStats::COL);
             // Diagonal prohibition
-            for (const auto& nb : neighbors_diag(r, c)) {
-                if (board[nb.first][nb.second] == 0) return false;
-            }
+            if (_has_diag_zero(r, c)) return _conflict(SearchStats::DIAG);
         }
         else {
-            if (row_zero[r] + (row_unknown[r] - 1) < row_target[r]) return false;
-            if (col_zero[c] + (col_unknown[c] - 1) < col_target[c]) return false;
+            if (row_zero(r) + (row_unknown(r) - 1) < row_target[r]) return _conflict(SearchStats::ROW);
+            if (col_zero(c) + (col_unknown(c) - 1) < col_target[c]) return _conflict(SearchStats::COL);
         }
 
         int mk = mark();
         _apply_set(r, c, val);
 
-        // If set to 0, check straight line local validity
+        // If set to 0, check straight line local validity of the cell and its ship neighbours
         if (val == 0) {
-            if (!_check_straight_local(r, c)) {
+            if (!_check_straight_local(r, c)
+                || (r > 0 && !_check_straight_local(r - 1, c))
+                || (r + 1 < n && !_check_straight_local(r + 1, c))
+                || (c > 0 && !_check_straight_local(r, c - 1))
+                || (c + 1 < n && !_check_straight_local(r, c + 1))) {
                 undo(mk);
-                return false;
-            }
-            for (const auto& nb : neighbors4(r, c)) {
-                int rr = nb.first, cc = nb.second;
-                if (board[rr][cc] == 0 && !_check_straight_local(rr, cc)) {
-                    undo(mk);
-                    return false;
-                }
+                return _conflict(SearchStats::STRAIGHT);
             }
         }
+        if (enforce_fleet && !_track_fleet(r, c, val)) {
+            undo(mk);
+            return _conflict(SearchStats::FLEET);
+        }
         return true;
     }
 
+    // Event-driven fixpoint: only the rows, columns, cells and hints touched by an
+    // assignment since the last fixpoint are re-checked
     bool propagate() {
-        bool changed = true;
-        while (changed) {
-            changed = false;
-
-            // Row constraints
-            for (int r = 0; r < n; ++r) {
-                int need = row_target[r] - row_zero[r];
-                int rem = row_unknown[r];
-                if (need < 0 || need > rem) return false;
-
-                if (rem > 0) {
-                    if (need == 0) {
-                        for (int c = 0; c < n; ++c) {
-                            if (board[r][c] == -1) {
-                                if (!assign(r, c, 1)) return false;
-                                changed = true;
-                            }
-                        }
-                    }
-                    else if (need == rem) {
-                        for (int c = 0; c < n; ++c) {
-                            if (board[r][c] == -1) {
-                                if (!assign(r, c, 0)) return false;
-                                changed = true;
-                            }
-                        }
-                    }
-                }
+        if (recheck_all) {
+            recheck_all = false;
+            _queue_everything();
+            // Initial clues may already bend a ship; later ships are checked by assign
+            if (!_all_straight()) {
+                _conflict(SearchStats::STRAIGHT);
+                return _fail_propagation();
             }
+        }
 
-            // Column constraints
-            for (int c = 0; c < n; ++c) {
-                int need = col_target[c] - col_zero[c];
-                int rem = col_unknown[c];
-                if (need < 0 || need > rem) return false;
-
-                if (rem > 0) {
-                    if (need == 0) {
-                        for (int r = 0; r < n; ++r) {
-                            if (board[r][c] == -1) {
-                                if (!assign(r, c, 1)) return false;
-                                changed = true;
-                            }
-                        }
-                    }
-                    else if (need == rem) {
-                        for (int r = 0; r < n; ++r) {
-                            if (board[r][c] == -1) {
-                                if (!assign(r, c, 0)) return false;
-                                changed = true;
-                            }
+        while (true) {
+            if (!cell_queue.empty()) {
+                int packed = cell_queue.back();
+                cell_queue.pop_back();
+                int r = packed >> 8, c = packed & 0xff;
+
+                // Diagonal prohibition: unknown cells diagonal to a new ship -> set to 1
+                if (ship[r].test(c)) {
+                    for (int rr = r - 1; rr <= r + 1; rr += 2) {
+                        if (rr < 0 || rr >= n) continue;
+                        Bits128 hit = _unknown_row(rr) & adj_bits[c];
+                        stats.fires[SearchStats::DIAG] += hit.count();
+                        while (hit.any()) {
+                            int cc = hit.lowest();
+                            hit.reset(cc);
+                            if (!assign(rr, cc, 1)) return _fail_propagation();
                         }
                     }
                 }
-            }
 
-            // Diagonal prohibition: unknown with diagonal 0 -> set to 1
-            for (int r = 0; r < n; ++r) {
-                for (int c = 0; c < n; ++c) {
-                    if (board[r][c] == -1) {
-                        for (const auto& nb : neighbors_diag(r, c)) {
-                            if (board[nb.first][nb.second] == 0) {
-                                if (!assign(r, c, 1)) return false;
-                                changed = true;
-                                break;
-                            }
-                        }
-                    }
+                // Directional hints on the cell itself or an orthogonal neighbour
+                if (!hint_cells.empty()) {
+                    if (dir_hint[r * n + c] && !_enforce_hint(r, c)) return _fail_propagation();
+                    if (r > 0 && dir_hint[(r - 1) * n + c] && !_enforce_hint(r - 1, c)) return _fail_propagation();
+                    if (r + 1 < n && dir_hint[(r + 1) * n + c] && !_enforce_hint(r + 1, c)) return _fail_propagation();
+                    if (c > 0 && dir_hint[r * n + c - 1] && !_enforce_hint(r, c - 1)) return _fail_propagation();
+                    if (c + 1 < n && dir_hint[r * n + c + 1] && !_enforce_hint(r, c + 1)) return _fail_propagation();
                 }
             }
-
-            // Directional cell enforcement (includes new 'S')
-            for (int r = 0; r < n; ++r) {
-                for (int c = 0; c < n; ++c) {
-                    if (dir_hint[r][c].has_value()) {
-                        int mk = mark();
-                        if (!_enforce_directional_cell(r, c)) {
-                            undo(mk);
-                            return false;
-                        }
-                        if ((int)trail.size() > mk) changed = true;
+            else if (!row_queue.empty()) {
+                int r = row_queue.back();
+                row_queue.pop_back();
+                row_queued[r] = 0;
+
+                // Row constraints
+                int need = row_target[r] - row_zero(r);
+                int rem = row_unknown(r);
+                if (need < 0 || need > rem) {
+                    _conflict(SearchStats::ROW);
+                    return _fail_propagation();
+                }
+                if (rem > 0 && (need == 0 || need == rem)) {
+                    int val = (need == 0) ? 1 : 0;
+                    stats.fires[SearchStats::ROW] += rem;
+                    for (Bits128 unk = _unknown_row(r); unk.any(); ) {
+                        int c = unk.lowest();
+                        unk.reset(c);
+                        if (!assign(r, c, val)) return _fail_propagation();
                     }
                 }
             }
-
-            // Local straight line validity
-            for (int r = 0; r < n; ++r) {
-                for (int c = 0; c < n; ++c) {
-                    if (board[r][c] == 0 && !_check_straight_local(r, c)) return false;
+            else if (!col_queue.empty()) {
+                int c = col_queue.back();
+                col_queue.pop_back();
+                col_queued[c] = 0;
+
+                // Column constraints
+                int need = col_target[c] - col_zero(c);
+                int rem = col_unknown(c);
+                if (need < 0 || need > rem) {
+                    _conflict(SearchStats::COL);
+                    return _fail_propagation();
+                }
+                if (rem > 0 && (need == 0 || need == rem)) {
+                    int val = (need == 0) ? 1 : 0;
+                    stats.fires[SearchStats::COL] += rem;
+                    for (Bits128 unk = _unknown_col(c); unk.any(); ) {
+                        int r = unk.lowest();
+                        unk.reset(r);
+                        if (!assign(r, c, val)) return _fail_propagation();
+                    }
                 }
             }
-
-            // Pruning
-            for (int r = 0; r < n; ++r) {
-                if (row_zero[r] > row_target[r]) return false;
-                if (row_zero[r] + row_unknown[r] < row_target[r]) return false;
-            }
-            for (int c = 0; c < n; ++c) {
-                if (col_zero[c] > col_target[c]) return false;
-                if (col_zero[c] + col_unknown[c] < col_target[c]) return false;
+            else {
+                return true;
             }
         }
-        return true;
     }
 
     std::optional<Coord> choose_var() {
         std::optional<Coord> best_rc;
-        std::optional<std::pair<int, int>> best_key;
+        std::pair<int, int> best_key;
 
         for (int r = 0; r < n; ++r) {
-            for (int c = 0; c < n; ++c) {
-                if (board[r][c] != -1) continue;
-
-                std::vector<int> domain;
-                if (_can_be(r, c, 0)) domain.push_back(0);
-                if (_can_be(r, c, 1)) domain.push_back(1);
+            int ru = row_unknown(r);
+            for (Bits128 unk = _unknown_row(r); unk.any(); ) {
+                int c = unk.lowest();
+                unk.reset(c);
 
-                if (domain.empty()) return std::make_pair(r, c);
+                int domain = (int)_can_be(r, c, 0) + (int)_can_be(r, c, 1);
+                if (domain == 0) return std::make_pair(r, c);
 
-                int heuristic = row_unknown[r] + col_unknown[c];
-                std::pair<int, int> key = { (int)domain.size(), heuristic };
-                if (!best_key.has_value() || key < best_key.value()) {
+                std::pair<int, int> key = { domain, ru + col_unknown(c) };
+                if (!best_rc.has_value() || key < best_key) {
                     best_key = key;
                     best_rc = std::make_pair(r, c);
                 }
@@ -410,352 +561,978 @@ public:
         return best_rc;
     }
 
-    bool is_complete() {
-        for (int r = 0; r < n; ++r)
-            for (int c = 0; c < n; ++c)
-                if (board[r][c] == -1) return false;
-        return true;
-    }
+    bool is_complete() { return unknown_total == 0; }
 
-    void enumerate_all(std::vector<std::vector<std::vector<int>>>& solutions, std::optional<int> limit = std::nullopt) {
-        if (limit.has_value() && solutions.size() >= (size_t)limit.value()) return;
+    // Visitor-based enumeration: on_solution is called for every solution while the
+    // board holds it (read it via cell()/snapshot()); return false to stop the search.
+    // Returns false if the search was stopped by the visitor.
+    bool enumerate_all(const std::function<bool()>& on_solution) {
+        if (cancel_flag && cancel_flag->load(std::memory_order_relaxed)) return false;
 
+        stats.nodes++;
+        if (tick && stats.nodes % TICK_NODES == 0) tick();
         int mk0 = mark();
-        if (!propagate()) {
+        bool ok;
+        {
+            PhaseTimer timer(stats, SearchStats::PROPAGATE);
+            ok = _propagate_canonical();
+        }
+        if (!ok) {
+            stats.backtracks++;
+            explored += weight;
             undo(mk0);
-            return;
+            return true;
         }
+        if (trail.size() > stats.max_trail) stats.max_trail = trail.size();
 
         if (is_complete()) {
-            if (_final_check()) {
-                std::vector<std::vector<int>> sol(n, std::vector<int>(n));
-                for (int r = 0; r < n; ++r)
-                    for (int c = 0; c < n; ++c)
-                        sol[r][c] = board[r][c];
-                solutions.push_back(sol);
+            bool cont = true;
+            if (_accept_solution()) {
+                found++;
+                cont = on_solution();
             }
+            explored += weight;
             undo(mk0);
-            return;
+            return cont;
         }
 
-        auto rc = choose_var();
+        if (enforce_fleet && !_fleet_fits_timed()) {
+            stats.backtracks++;
+            explored += weight;
+            undo(mk0);
+            return true;
+        }
+
+        // The same residual subproblem may already have been searched to the end
+        uint64_t key = 0, check = 0;
+        long long found0 = found, nodes0 = stats.nodes;
+        bool probed = memo_size && sym.empty() && stats.nodes >= memo_resume;
+        if (probed) {
+            _memo_key(key, check);
+            stats.memo_probes++;
+            _memo_review();
+            if (const MemoEntry* hit = _memo_find(key, check)) {
+                stats.memo_hits++;
+                memo_window_saved += hit->work;
+                bool cont = true;
+                for (long long i = 0; i < hit->count && cont; ++i) {
+                    found++;
+                    cont = on_solution();
+                }
+                explored += weight;
+                undo(mk0);
+                return cont;
+            }
+        }
+
+        std::optional<Coord> rc;
+        {
+            PhaseTimer timer(stats, SearchStats::CHOOSE_VAR);
+            rc = choose_var();
+        }
         if (!rc.has_value()) {
-            if (_final_check()) {
-                std::vector<std::vector<int>> sol(n, std::vector<int>(n));
-                for (int r = 0; r < n; ++r)
-                    for (int c = 0; c < n; ++c)
-                        sol[r][c] = board[r][c];
-                solutions.push_back(sol);
+            bool cont = true;
+            if (_accept_solution()) {
+                found++;
+                cont = on_solution();
             }
+            explored += weight;
             undo(mk0);
-            return;
+            return cont;
         }
 
         int r = rc->first, c = rc->second;
+        bool can[2] = { _can_be(r, c, 0), _can_be(r, c, 1) };
+        double node_weight = weight;
+        double child_weight = node_weight / std::max(1, can[0] + can[1]);
+        if (!can[0] && !can[1]) explored += node_weight;
         for (int val : {0, 1}) {
-            if (limit.has_value() && solutions.size() >= (size_t)limit.value()) break;
-            if (!_can_be(r, c, val)) continue;
+            if (!can[val]) continue;
 
+            stats.decisions++;
             int mk1 = mark();
             if (assign(r, c, val)) {
-                enumerate_all(solutions, limit);
+                weight = child_weight;
+                bool cont = enumerate_all(on_solution);
+                weight = node_weight;
+                if (!cont) {
+                    undo(mk0);
+                    return false;
+                }
+            }
+            else {
+                explored += child_weight;
             }
             undo(mk1);
         }
 
+        if (probed && (memo_counts || found == found0))
+            _memo_store(key, check, found - found0, stats.nodes - nodes0);
         undo(mk0);
+        return true;
     }
 
-    int getN() const { return n; }
+    // Split the search tree into independent subproblems: the decision prefixes of all
+    // live nodes `depth` branchings below the root (and of solutions found above that
+    // depth), in the order enumerate_all would visit them
+    std::vector<std::vector<Decision>> split(int depth) {
+        std::vector<std::vector<Decision>> out;
+        std::vector<Decision> path;
+        _split(depth, path, out);
+        return out;
+    }
 
-private:
-    int K;
-    std::vector<std::vector<int>> M;
-    int n;
-    std::vector<int> row_target;
-    std::vector<int> col_target;
-    std::vector<std::vector<int>> board; // -1 unknown, 0 ship, 1 water
-    std::vector<std::vector<std::optional<char>>> dir_hint; // U,D,L,R,S
-    std::vector<int> row_zero, row_unknown, col_zero, col_unknown;
-    std::vector<std::tuple<int, int, int, int, int, int, int>> trail; // r,c,prev, d_r0,d_ru,d_c0,d_cu
-    std::map<int, int> expected_fleet;
-    bool enforce_fleet = false;
+    // Enumerate the subtree below a prefix returned by split(); enumerating every prefix
+    // in order yields exactly the solutions (and order) of enumerate_all
+    bool enumerate_subtree(const std::vector<Decision>& prefix, const std::function<bool()>& on_solution) {
+        int mk0 = mark();
+        double prefix_weight = 1;
+        for (const auto& d : prefix) {
+            if (!_propagate_canonical() || !assign(d.r, d.c, d.val)) {
+                undo(mk0);
+                return true;
+            }
+            prefix_weight /= d.branches;
+        }
+        weight = prefix_weight;
+        bool cont = enumerate_all(on_solution);
+        weight = 1;
+        undo(mk0);
+        return cont;
+    }
 
-    int _nonneg(int x) {
-        if (x < 0) throw std::runtime_error("/ʾΪǸ");
-        return x;
+    void enumerate_all(std::vector<std::vector<std::vector<int>>>& solutions, std::optional<int> limit = std::nullopt) {
+        if (limit.has_value() && solutions.size() >= (size_t)limit.value()) return;
+        enumerate_all([&]() {
+            solutions.push_back(snapshot());
+            return !(limit.has_value() && solutions.size() >= (size_t)limit.value());
+        });
     }
 
-    std::vector<Coord> neighbors4(int r, int c) {
-        std::vector<Coord> res;
-        if (r > 0) res.push_back({ r - 1, c });
-        if (r + 1 < n) res.push_back({ r + 1, c });
-        if (c > 0) res.push_back({ r, c - 1 });
-        if (c + 1 < n) res.push_back({ r, c + 1 });
-        return res;
+    // -1 unknown, 0 ship, 1 water
+    int cell(int r, int c) const {
+        if (ship[r].test(c)) return 0;
+        if (water[r].test(c)) return 1;
+        return -1;
     }
 
-    std::vector<Coord> neighbors_diag(int r, int c) {
-        std::vector<Coord> res;
-        if (r > 0 && c > 0) res.push_back({ r - 1, c - 1 });
-        if (r > 0 && c + 1 < n) res.push_back({ r - 1, c + 1 });
-        if (r + 1 < n && c > 0) res.push_back({ r + 1, c - 1 });
-        if (r + 1 < n && c + 1 < n) res.push_back({ r + 1, c + 1 });
-        return res;
+    // Cells fixed by propagation before any branching (-1 where propagation alone does not
+    // decide; all -1 when the root is already contradictory)
+    std::vector<std::vector<int>> root_deductions() const {
+        BattleshipDirectionalSolver root(*this);
+        if (!root.propagate()) return std::vector<std::vector<int>>(n, std::vector<int>(n, -1));
+        return root.snapshot();
     }
 
-    bool _has_diag_zero(int r, int c) {
-        for (const auto& nb : neighbors_diag(r, c)) {
-            if (board[nb.first][nb.second] == 0) return true;
+    // --deduce: propagation at the root only, no search. `cells` gets the cells it fixes (-1
+    // where undecided). Returns "ok", "solved" (every cell fixed and the board passes the final
+    // check) or "contradiction <rule>", with the rule named as in SearchStats::to_json (a
+    // rejected final board as "final_<reason>", no room left for the longest missing ship as
+    // "fleet"); cells is all -1 on a contradiction.
+    std::string deduce(std::vector<std::vector<int>>& cells) const {
+        BattleshipDirectionalSolver root(*this);
+        cells.assign(n, std::vector<int>(n, -1));
+        if (!root.propagate()) {
+            for (int i = 0; i < SearchStats::RULE_COUNT; ++i)
+                if (root.stats.conflicts[i] > stats.conflicts[i])
+                    return std::string("contradiction ") + SearchStats::RULE_NAMES[i];
+            return "contradiction";
         }
-        return false;
+        if (root.is_complete()) {
+            if (!root._final_check()) {
+                for (int i = 0; i < SearchStats::REJECT_COUNT; ++i)
+                    if (root.stats.rejects[i] > stats.rejects[i])
+                        return std::string("contradiction final_") + SearchStats::REJECT_NAMES[i];
+                return "contradiction";
+            }
+            cells = root.snapshot();
+            return "solved";
+        }
+        if (enforce_fleet && !root._fleet_fits()) return "contradiction fleet";
+        cells = root.snapshot();
+        return "ok";
     }
 
-    void _apply_set(int r, int c, int val) {
-        int prev = board[r][c];
-        int d_r0 = (val == 0) ? 1 : 0;
-        int d_c0 = (val == 0) ? 1 : 0;
-        int d_ru = (prev == -1) ? -1 : 0;
-        int d_cu = (prev == -1) ? -1 : 0;
-
-        trail.emplace_back(r, c, prev, d_r0, d_ru, d_c0, d_cu);
-        board[r][c] = val;
-
-        if (d_r0) row_zero[r] += d_r0;
-        if (d_c0) col_zero[c] += d_c0;
-        if (d_ru) row_unknown[r] += d_ru;
-        if (d_cu) col_unknown[c] += d_cu;
+    std::vector<std::vector<int>> snapshot() const {
+        std::vector<std::vector<int>> board(n, std::vector<int>(n));
+        for (int r = 0; r < n; ++r)
+            for (int c = 0; c < n; ++c)
+                board[r][c] = cell(r, c);
+        return board;
     }
 
-    bool _check_straight_local(int r, int c) {
-        if (board[r][c] != 0) return true;
-
-        int horiz = 0;
-        if (c > 0 && board[r][c - 1] == 0) horiz++;
-        if (c + 1 < n && board[r][c + 1] == 0) horiz++;
-
-        int vert = 0;
-        if (r > 0 && board[r - 1][c] == 0) vert++;
-        if (r + 1 < n && board[r + 1][c] == 0) vert++;
+    // Solved board as n*n bits (see PackedBoard)
+    PackedBoard pack() const {
+        PackedBoard bits(((size_t)n * n + 63) / 64, 0);
+        for (int r = 0; r < n; ++r) {
+            for (Bits128 b = ship[r]; b.any(); ) {
+                int c = b.lowest();
+                b.reset(c);
+                size_t i = (size_t)r * n + c;
+                bits[i >> 6] |= uint64_t(1) << (i & 63);
+            }
+        }
+        return bits;
+    }
 
-        // No bending or T-shapes
-        if (horiz > 0 && vert > 0) return false;
-        if (horiz > 2 || vert > 2) return false;
-        return true;
+    // --heatmap: add 1 to heat[r*n+c] for every ship cell of the solved board
+    void add_ship_counts(std::vector<long long>& heat) const {
+        for (int r = 0; r < n; ++r)
+            for (Bits128 b = ship[r]; b.any(); ) {
+                int c = b.lowest();
+                b.reset(c);
+                heat[(size_t)r * n + c]++;
+            }
     }
 
-    bool _enforce_directional_cell(int r, int c) {
-        if (!dir_hint[r][c].has_value()) return true;
+    int getN() const { return n; }
 
-        char d = dir_hint[r][c].value();
+    // Cooperative cancellation: enumerate_all stops as soon as *flag becomes true
+    void set_cancel_flag(const std::atomic<bool>* flag) { cancel_flag = flag; }
+
+    // Transposition table of finished subtrees with `slots` entries (rounded down to a power
+    // of two; 0 disables it), allocated on the first search. A subtree without solutions is
+    // skipped when its subproblem comes up again. With `counts` the visitor must not look at
+    // the board: a known subtree is then answered by calling it once per stored solution.
+    // Each copy of the solver (e.g. every worker thread) fills its own table.
+    void set_memo(size_t slots, bool counts) {
+        memo_size = slots >= 2 ? 2 : 0;
+        while (memo_size && memo_size * 2 <= slots) memo_size *= 2;
+        memo_counts = counts;
+        memo_slots.clear();
+        memo_filled = 0;
+        memo_window_probes = memo_window_saved = memo_resume = 0;
+    }
 
-        // Ensure self is ship (0)
-        if (board[r][c] == 1) return false;
-        if (board[r][c] == -1) {
-            if (!assign(r, c, 0)) return false;
+    // Symmetries of the square besides the identity: cell (r, c) of the image of a board is
+    // the board's cell _sym_cell(t, r, c), t = 1..7
+    static constexpr const char* SYMMETRY_NAMES[8] = {
+        "identity", "hflip", "vflip", "rot180", "transpose", "antitranspose", "rot90", "rot270" };
+
+    // --symmetry: from now on only search for canonical solutions (see _break_symmetry) under
+    // the symmetries that map the puzzle onto itself: row/column targets, known cells and hints,
+    // with hint directions turned along. Each solution is then found once per orbit, as the
+    // canonical member; the others are its images (see symmetric_images). The transposition
+    // table is not used meanwhile, since which solutions of a subtree are canonical depends on
+    // the cells outside it. Call before searching; returns the names of the symmetries found
+    // (none: the search is unchanged).
+    std::vector<std::string> set_symmetry() {
+        sym.clear();
+        sym_fixed.clear();
+        std::vector<std::string> names;
+        if (n < 2) return names;
+        for (int t = 1; t < 8; ++t) {
+            if (!_maps_onto_itself(t)) continue;
+            std::vector<Bits128> fixed(n);
+            for (int r = 0; r < n; ++r)
+                for (int c = 0; c < n; ++c)
+                    if (_sym_cell(t, r, c) == Coord(r, c)) fixed[r].set(c);
+            sym.push_back(t);
+            sym_fixed.push_back(std::move(fixed));
+            names.push_back(SYMMETRY_NAMES[t]);
         }
+        return names;
+    }
 
-        // Define expectations
-        std::optional<Coord> need; // required neighbor that must be ship
-        std::vector<Coord> forbid; // neighbors that must be water
+    // The distinct images of a solved board under the symmetries of set_symmetry, the board
+    // itself first: its orbit
+    std::vector<PackedBoard> symmetric_images(const PackedBoard& board) const {
+        std::vector<PackedBoard> images{ board };
+        for (int t : sym) {
+            PackedBoard image(board.size(), 0);
+            for (int r = 0; r < n; ++r)
+                for (int c = 0; c < n; ++c) {
+                    auto [sr, sc] = _sym_cell(t, r, c);
+                    size_t i = (size_t)r * n + c;
+                    if (packed_ship(board.data(), (size_t)sr * n + sc)) image[i >> 6] |= uint64_t(1) << (i & 63);
+                }
+            if (std::find(images.begin(), images.end(), image) == images.end()) images.push_back(std::move(image));
+        }
+        return images;
+    }
 
-        if (d == 'U') {
-            if (r == 0) return false;
-            need = std::make_pair(r - 1, c);
-            if (r + 1 < n) forbid.push_back({ r + 1, c });
-            if (c > 0) forbid.push_back({ r, c - 1 });
-            if (c + 1 < n) forbid.push_back({ r, c + 1 });
+private:
+    int K;
+    int n;
+    std::vector<int> row_target;
+    std::vector<int> col_target;
+    // Board as bitboards: ship[r] / water[r] hold row r, col_ship[c] / col_water[c] the
+    // transposed copy of column c; a cell in neither mask is unknown
+    std::vector<Bits128> ship, water, col_ship, col_water;
+    Bits128 full;                    // bits 0..n-1
+    std::vector<Bits128> adj_bits;   // adj_bits[i] = bits i-1 and i+1
+    int unknown_total = 0;
+    std::vector<char> dir_hint;      // r*n+c -> 0 or U,D,L,R,S
+    std::vector<int> hint_cells;     // r*n+c of hinted cells, row-major
+    std::vector<int> trail;          // (r << 8) | c of every assigned cell, in order
+    // Propagation work list: cells assigned since the last fixpoint, and rows/columns to re-check
+    std::vector<int> cell_queue, row_queue, col_queue;
+    std::vector<char> row_queued, col_queued;
+    bool recheck_all = true;         // the whole board is unchecked (initial state)
+    std::vector<int> expected_count; // ship length -> expected number of ships
+    // Ships already closed off by water/edges on the current path, by length; fleet_trail
+    // holds (trail size when closed, length) so undo can take them back
+    std::vector<int> closed_count;
+    std::vector<std::pair<int, int>> fleet_trail;
+    bool enforce_fleet = false;
+    const std::atomic<bool>* cancel_flag = nullptr;
+    double weight = 1;      // weight of the node being searched, see `explored`
+    // Transposition table (set_memo): buckets of two slots, memo_size slots in all (0: off)
+    std::vector<MemoEntry> memo_slots;
+    size_t memo_size = 0;
+    size_t memo_filled = 0;     // slots in use
+    static const size_t MEMO_INITIAL_SLOTS = 4096;
+    // Probing pauses (see _memo_review) until stats.nodes reaches memo_resume
+    long long memo_window_probes = 0, memo_window_saved = 0, memo_resume = 0;
+    static const long long MEMO_WINDOW = 4096, MEMO_MIN_GAIN = 4, MEMO_PAUSE_NODES = 8 * MEMO_WINDOW;
+    bool memo_counts = false;
+    long long found = 0;    // solutions accepted so far, to count the solutions of a subtree
+    std::vector<Bits128> memo_reach;    // _memo_key scratch
+    // set_symmetry: the symmetries t kept, and per symmetry the cells it maps onto themselves
+    // (bit c of row r), which always equal their image
+    std::vector<int> sym;
+    std::vector<std::vector<Bits128>> sym_fixed;
+
+    // Same node sequence as enumerate_all, cut off at `depth`
+    void _split(int depth, std::vector<Decision>& path, std::vector<std::vector<Decision>>& out) {
+        int mk0 = mark();
+        if (!_propagate_canonical()) {
+            undo(mk0);
+            return;
         }
-        else if (d == 'D') {
-            if (r + 1 == n) return false;
-            need = std::make_pair(r + 1, c);
-            if (r > 0) forbid.push_back({ r - 1, c });
-            if (c > 0) forbid.push_back({ r, c - 1 });
-            if (c + 1 < n) forbid.push_back({ r, c + 1 });
+        if (depth == 0 || is_complete()) {
+            out.push_back(path);
+            undo(mk0);
+            return;
         }
-        else if (d == 'L') {
-            if (c == 0) return false;
-            need = std::make_pair(r, c - 1);
-            if (c + 1 < n) forbid.push_back({ r, c + 1 });
-            if (r > 0) forbid.push_back({ r - 1, c });
-            if (r + 1 < n) forbid.push_back({ r + 1, c });
+        if (enforce_fleet && !_fleet_fits()) {
+            undo(mk0);
+            return;
         }
-        else if (d == 'R') {
-            if (c + 1 == n) return false;
-            need = std::make_pair(r, c + 1);
-            if (c > 0) forbid.push_back({ r, c - 1 });
-            if (r > 0) forbid.push_back({ r - 1, c });
-            if (r + 1 < n) forbid.push_back({ r + 1, c });
+
+        auto rc = choose_var();
+        if (!rc.has_value()) {
+            out.push_back(path);
+            undo(mk0);
+            return;
         }
-        else if (d == 'S') {
-            // ڽˮ need
-            if (r > 0) forbid.push_back({ r - 1, c });
-            if (r + 1 < n) forbid.push_back({ r + 1, c });
-            if (c > 0) forbid.push_back({ r, c - 1 });
-            if (c + 1 < n) forbid.push_back({ r, c + 1 });
+
+        int r = rc->first, c = rc->second;
+        bool can[2] = { _can_be(r, c, 0), _can_be(r, c, 1) };
+        for (int val : {0, 1}) {
+            if (!can[val]) continue;
+
+            int mk1 = mark();
+            if (assign(r, c, val)) {
+                path.push_back({ r, c, val, can[0] + can[1] });
+                _split(depth - 1, path, out);
+                path.pop_back();
+            }
+            undo(mk1);
         }
+        undo(mk0);
+    }
 
-        // Enforce required neighbor if any
-        if (need.has_value()) {
-            int nr = need->first;
-            int nc = need->second;
-            if (board[nr][nc] == 1) return false;
-            if (board[nr][nc] == -1) {
-                if (!assign(nr, nc, 0)) return false;
+    // Key of the residual subproblem at the current node: the unknown cells, the ship cells
+    // within K cells (along a row or column) of an unknown or one of its 8 neighbours, the
+    // remaining row/column counts and the closed ships. Nodes with the same key have the same
+    // completions: the rules look at most one cell past an unknown (diagonals, straightness,
+    // hints, whose cells never change), along ship runs of at most K cells that reach it, or at
+    // counts; everything further away was checked when it was assigned. A complete board never
+    // comes up twice in this search (siblings differ in the branching cell), so hashing the
+    // whole board (Zobrist) would never hit. Two independent 64-bit hashes; both must match.
+    void _memo_key(uint64_t& key, uint64_t& check) {
+        // Ship cells among the unknowns and their 8 neighbours, followed along their rows...
+        memo_reach.resize(n);
+        auto near = [&](int r) {
+            Bits128 u = _unknown_row(r);
+            return u | u.spread();
+        };
+        Bits128 above, here = near(0);
+        for (int r = 0; r < n; ++r) {
+            Bits128 below = r + 1 < n ? near(r + 1) : Bits128();
+            Bits128 h = ship[r] & (above | here | below);
+            for (Bits128 g = h; g.any(); h = h | g) g = (g.spread() & ship[r]).andnot(h);
+            memo_reach[r] = h;
+            above = here;
+            here = below;
+        }
+        // ...and along their columns (a run is never longer than K)
+        for (int k = 1; k < K; ++k) {
+            bool grew = false;
+            for (int r = 0; r < n; ++r) {
+                Bits128 v;
+                if (r > 0) v = v | memo_reach[r - 1];
+                if (r + 1 < n) v = v | memo_reach[r + 1];
+                v = (v & ship[r]).andnot(memo_reach[r]);
+                if (v.any()) {
+                    memo_reach[r] = memo_reach[r] | v;
+                    grew = true;
+                }
             }
+            if (!grew) break;
         }
 
-        // Other adjacencies must be water
-        for (const auto& frfc : forbid) {
-            int fr = frfc.first, fc = frfc.second;
-            if (board[fr][fc] == 0) return false;
-            if (board[fr][fc] == -1) {
-                if (!assign(fr, fc, 1)) return false;
+        // Each step is a bijection of the state for a given word; the final mix spreads the
+        // high bits into the low ones that pick the bucket
+        uint64_t a = 0x243f6a8885a308d3ULL, b = 0x13198a2e03707344ULL;
+        auto mix = [&](uint64_t w) {
+            a = (a ^ w) * 0x9e3779b97f4a7c15ULL;
+            b = (b + w) * 0xff51afd7ed558ccdULL;
+        };
+        for (int r = 0; r < n; ++r) {
+            Bits128 u = _unknown_row(r);
+            Bits128 s = memo_reach[r];
+            mix(u.lo);
+            mix(s.lo);
+            if (n > 64) {
+                mix(u.hi);
+                mix(s.hi);
             }
+            mix((uint64_t)(row_target[r] - row_zero(r)) | (uint64_t)(col_target[r] - col_zero(r)) << 16);
         }
+        for (size_t L = 1; L < closed_count.size(); ++L) mix((uint64_t)closed_count[L]);
+        a ^= a >> 32;
+        a *= 0xc4ceb9fe1a85ec53ULL;
+        key = a ^ (a >> 29);
+        check = b | 1;
+    }
 
-        return true;
+    // Every MEMO_WINDOW probes: when the hits of the window saved less than one node for every
+    // MEMO_MIN_GAIN probes, the table is not paying for its keys here; skip it for a while
+    void _memo_review() {
+        if (++memo_window_probes < MEMO_WINDOW) return;
+        if (memo_window_saved * MEMO_MIN_GAIN < memo_window_probes) memo_resume = stats.nodes + MEMO_PAUSE_NODES;
+        memo_window_probes = memo_window_saved = 0;
     }
 
-    bool _can_be(int r, int c, int val) {
-        if (board[r][c] != -1) return board[r][c] == val;
+    const MemoEntry* _memo_find(uint64_t key, uint64_t check) {
+        if (memo_slots.empty()) memo_slots.assign(std::min(memo_size, MEMO_INITIAL_SLOTS), MemoEntry());
+        const MemoEntry* bucket = &memo_slots[key & (memo_slots.size() - 2)];
+        for (int i = 0; i < 2; ++i)
+            if (bucket[i].check == check && bucket[i].key == key) return &bucket[i];
+        return nullptr;
+    }
 
-        if (val == 0) {
-            if (row_zero[r] + 1 > row_target[r]) return false;
-            if (col_zero[c] + 1 > col_target[c]) return false;
+    void _memo_store(uint64_t key, uint64_t check, long long count, long long work) {
+        stats.memo_stores++;
+        _memo_put({ key, check, count, (uint32_t)std::min<long long>(work, UINT32_MAX) });
+        // The table starts small (short searches never pay for a big one) and doubles
+        // whenever half of it is in use, up to memo_size slots
+        if (memo_filled * 2 > memo_slots.size() && memo_slots.size() < memo_size) {
+            std::vector<MemoEntry> old(memo_slots.size() * 2);
+            old.swap(memo_slots);
+            memo_filled = 0;
+            for (const MemoEntry& e : old)
+                if (e.check) _memo_put(e);
+        }
+    }
 
-            // Diagonal prohibition
-            for (const auto& nb : neighbors_diag(r, c)) {
-                if (board[nb.first][nb.second] == 0) return false;
-            }
+    // Replacement: the first slot of a bucket keeps the subtree that took the most nodes to
+    // search, the second one takes whatever does not go into the first
+    void _memo_put(const MemoEntry& e) {
+        MemoEntry* bucket = &memo_slots[e.key & (memo_slots.size() - 2)];
+        if (bucket[0].check == e.check && bucket[0].key == e.key) {
+            bucket[0] = e;
+            return;
+        }
+        if (!bucket[1].check) memo_filled++;
+        if (e.work >= bucket[0].work) {
+            bucket[1] = bucket[0];
+            bucket[0] = e;
+        }
+        else {
+            bucket[1] = e;
+        }
+    }
 
-            // Local straight line check
-            int horiz = 0;
-            if (c > 0 && board[r][c - 1] == 0) horiz++;
-            if (c + 1 < n && board[r][c + 1] == 0) horiz++;
+    int _nonneg(int x) {
+        if (x < 0) throw std::runtime_error("/ʾΪǸ");
+        return x;
+    }
 
-            int vert = 0;
-            if (r > 0 && board[r - 1][c] == 0) vert++;
-            if (r + 1 < n && board[r + 1][c] == 0) vert++;
+    int row_zero(int r) const { return ship[r].count(); }
+    int col_zero(int c) const { return col_ship[c].count(); }
+    int row_unknown(int r) const { return n - (ship[r] | water[r]).count(); }
+    int col_unknown(int c) const { return n - (col_ship[c] | col_water[c]).count(); }
+    Bits128 _unknown_row(int r) const { return full.andnot(ship[r] | water[r]); }
+    Bits128 _unknown_col(int c) const { return full.andnot(col_ship[c] | col_water[c]); }
 
-            if (horiz > 0 && vert > 0) return false;
-            if (horiz > 2 || vert > 2) return false;
-            return true;
+    bool _has_diag_zero(int r, int c) const {
+        return (r > 0 && (ship[r - 1] & adj_bits[c]).any())
+            || (r + 1 < n && (ship[r + 1] & adj_bits[c]).any());
+    }
+
+    bool _has_vert_zero(int r, int c) const {
+        return (r > 0 && ship[r - 1].test(c)) || (r + 1 < n && ship[r + 1].test(c));
+    }
+
+    // Set a cell without recording it on the trail (initial clues only)
+    void _put(int r, int c, int val) {
+        if (val == 0) {
+            ship[r].set(c);
+            col_ship[c].set(r);
         }
         else {
-            if (row_zero[r] + (row_unknown[r] - 1) < row_target[r]) return false;
-            if (col_zero[c] + (col_unknown[c] - 1) < col_target[c]) return false;
-            return true;
+            water[r].set(c);
+            col_water[c].set(r);
         }
+        --unknown_total;
     }
 
-    bool _final_check() {
-        // Row and column counts
-        for (int r = 0; r < n; ++r) if (row_zero[r] != row_target[r]) return false;
-        for (int c = 0; c < n; ++c) if (col_zero[c] != col_target[c]) return false;
-
-        // Diagonal non-adjacency
-        for (int r = 0; r < n; ++r)
-            for (int c = 0; c < n; ++c)
-                if (board[r][c] == 0 && _has_diag_zero(r, c)) return false;
+    void _apply_set(int r, int c, int val) {
+        trail.push_back((r << 8) | c);
+        _put(r, c, val);
+        _queue_cell(r, c);
+    }
 
-        // Component linearity and continuity
-        auto compsOpt = _collect_components();
-        if (!compsOpt.has_value()) return false;
+    void _queue_cell(int r, int c) {
+        cell_queue.push_back((r << 8) | c);
+        if (!row_queued[r]) {
+            row_queued[r] = 1;
+            row_queue.push_back(r);
+        }
+        if (!col_queued[c]) {
+            col_queued[c] = 1;
+            col_queue.push_back(c);
+        }
+    }
 
-        // Direction consistency (re-validate hints)
+    void _queue_everything() {
         for (int r = 0; r < n; ++r)
             for (int c = 0; c < n; ++c)
-                if (dir_hint[r][c].has_value())
-                    if (!_enforce_directional_cell(r, c)) return false;
-
-        // Fleet matchingϸƥ䣩
-        if (enforce_fleet) {
-            std::map<int, int> got;
-            for (const auto& comp : compsOpt.value()) {
-                int L = (int)comp.size();
-                got[L] = got.count(L) ? got[L] + 1 : 1;
-            }
-            // ֹδеĳ
-            for (const auto& kv : got) {
-                if (!expected_fleet.count(kv.first)) return false;
+                if (cell(r, c) != -1 || dir_hint[r * n + c]) _queue_cell(r, c);
+        for (int i = 0; i < n; ++i) {
+            if (!row_queued[i]) {
+                row_queued[i] = 1;
+                row_queue.push_back(i);
             }
-            // һƥ
-            for (const auto& kv : expected_fleet) {
-                int L = kv.first, cnt = kv.second;
-                if (!got.count(L) || got[L] != cnt) return false;
+            if (!col_queued[i]) {
+                col_queued[i] = 1;
+                col_queue.push_back(i);
             }
         }
-        return true;
     }
 
-    std::optional<std::vector<std::set<Coord>>> _collect_components() {
-        std::vector<std::vector<bool>> seen(n, std::vector<bool>(n, false));
-        std::vector<std::set<Coord>> comps;
+    // Drop pending work after a contradiction (the caller undoes the assignments)
+    bool _fail_propagation() {
+        cell_queue.clear();
+        for (int r : row_queue) row_queued[r] = 0;
+        for (int c : col_queue) col_queued[c] = 0;
+        row_queue.clear();
+        col_queue.clear();
+        return false;
+    }
 
-        for (int r = 0; r < n; ++r) {
-            for (int c = 0; c < n; ++c) {
-                if (board[r][c] != 0 || seen[r][c]) continue;
-
-                std::set<Coord> comp;
-                std::stack<Coord> st;
-                st.push({ r, c });
-                seen[r][c] = true;
-
-                while (!st.empty()) {
-                    auto [cr, cc] = st.top();
-                    st.pop();
-                    comp.insert({ cr, cc });
-
-                    for (const auto& nb : neighbors4(cr, cc)) {
-                        int nr = nb.first, nc = nb.second;
-                        if (!seen[nr][nc] && board[nr][nc] == 0) {
-                            seen[nr][nc] = true;
-                            st.push({ nr, nc });
-                        }
-                    }
+    // propagate(), then symmetry breaking (set_symmetry) and propagation again for as long as
+    // it assigns cells
+    bool _propagate_canonical() {
+        while (true) {
+            if (!propagate()) return false;
+            if (sym.empty()) return true;
+            int mk = mark();
+            if (!_break_symmetry()) {
+                stats.sym_prunes++;
+                return _fail_propagation();
+            }
+            if (mark() == mk) return true;
+        }
+    }
+
+    // Cell (r, c) under symmetry t (see SYMMETRY_NAMES); also defined beyond the board
+    Coord _sym_cell(int t, int r, int c) const {
+        int m = n - 1;
+        switch (t) {
+        case 1: return { r, m - c };
+        case 2: return { m - r, c };
+        case 3: return { m - r, m - c };
+        case 4: return { c, r };
+        case 5: return { m - c, m - r };
+        case 6: return { c, m - r };
+        default: return { m - c, r };
+        }
+    }
+
+    // Row r of the image of the current board under symmetry t, as ship / water masks
+    void _sym_row(int t, int r, Bits128& s, Bits128& w) const {
+        int line = (t == 2 || t == 3 || t == 5 || t == 6) ? n - 1 - r : r;
+        s = t >= 4 ? col_ship[line] : ship[line];
+        w = t >= 4 ? col_water[line] : water[line];
+        if (t & 1) {
+            s = s.reversed(n);
+            w = w.reversed(n);
+        }
+    }
+
+    // Whether the image of every solution under symmetry t is a solution: every row and
+    // column of the image is read from a line with the same target, and every known cell and
+    // hint from a cell with the same clue (a hint pointing the way t turns it)
+    bool _maps_onto_itself(int t) const {
+        int m = n - 1;
+        for (int i = 0; i < n; ++i) {
+            Coord a = _sym_cell(t, i, 0), b = _sym_cell(t, i, m);
+            if (row_target[i] != (a.first == b.first ? row_target[a.first] : col_target[a.second])) return false;
+            a = _sym_cell(t, 0, i), b = _sym_cell(t, m, i);
+            if (col_target[i] != (a.first == b.first ? row_target[a.first] : col_target[a.second])) return false;
+        }
+        for (int r = 0; r < n; ++r)
+            for (int c = 0; c < n; ++c) {
+                auto [sr, sc] = _sym_cell(t, r, c);
+                if (cell(r, c) != cell(sr, sc)) return false;
+                char d = dir_hint[r * n + c], turned = d;
+                if (d && d != 'S') {
+                    int dr = d == 'U' ? -1 : d == 'D' ? 1 : 0;
+                    int dc = d == 'L' ? -1 : d == 'R' ? 1 : 0;
+                    auto [tr, tc] = _sym_cell(t, r + dr, c + dc);
+                    tr -= sr;
+                    tc -= sc;
+                    turned = tr < 0 ? 'U' : tr > 0 ? 'D' : tc < 0 ? 'L' : 'R';
                 }
+                if (dir_hint[sr * n + sc] != turned) return false;
+            }
+        return true;
+    }
 
-                if (!_component_is_straight_and_contiguous(comp)) return std::nullopt;
-                comps.push_back(comp);
+    // Lex-leader symmetry breaking: a solution is canonical when, read row by row with water
+    // before ship, it is not greater than its image under any symmetry of set_symmetry, so
+    // every orbit has exactly one. For each symmetry the board is compared with its image up
+    // to the first cell not known in both (cells fixed by the symmetry always agree): a board
+    // already greater is cut off, and at that cell a value that would make it greater is ruled
+    // out (an unknown cell facing water in the image becomes water, a ship facing an unknown
+    // cell makes that image cell a ship). Returns false when no completion is canonical.
+    bool _break_symmetry() {
+        for (size_t k = 0; k < sym.size(); ++k) {
+            int t = sym[k];
+            for (int r = 0; r < n; ++r) {
+                Bits128 s, w;
+                _sym_row(t, r, s, w);
+                Bits128 known = (ship[r] | water[r]) & (s | w);
+                Bits128 diff = (ship[r] ^ s) & known;
+                Bits128 open = full.andnot(known | sym_fixed[k][r]);
+                if (!diff.any() && !open.any()) continue;
+                int c = (diff | open).lowest();
+                if (diff.test(c)) {
+                    if (ship[r].test(c)) return false;
+                    break;
+                }
+                auto [sr, sc] = _sym_cell(t, r, c);
+                if (cell(r, c) == -1 && cell(sr, sc) == 1) {
+                    if (!assign(r, c, 1)) return false;
+                }
+                else if (cell(r, c) == 0 && cell(sr, sc) == -1) {
+                    if (!assign(sr, sc, 0)) return false;
+                }
+                break;
             }
         }
-        return comps;
+        return true;
+    }
+
+    bool _enforce_hint(int r, int c) {
+        int mk = mark();
+        if (_enforce_directional_cell(r, c)) {
+            stats.fires[SearchStats::HINT] += mark() - mk;
+            return true;
+        }
+        undo(mk);
+        return _conflict(SearchStats::HINT);
+    }
+
+    // Count a contradiction found by `rule`; always false
+    bool _conflict(SearchStats::Rule rule) {
+        stats.conflicts[rule]++;
+        return false;
+    }
+
+    // _final_check with statistics
+    bool _accept_solution() {
+        PhaseTimer timer(stats, SearchStats::FINAL_CHECK);
+        stats.final_checks++;
+        if (_final_check()) return true;
+        stats.backtracks++;
+        return false;
+    }
+
+    bool _fleet_fits_timed() {
+        PhaseTimer timer(stats, SearchStats::FLEET_FITS);
+        if (_fleet_fits()) return true;
+        return _conflict(SearchStats::FLEET);
+    }
+
+    bool _check_straight_local(int r, int c) const {
+        if (!ship[r].test(c)) return true;
+        // No bending or T-shapes
+        return !((ship[r] & adj_bits[c]).any() && _has_vert_zero(r, c));
+    }
+
+    // No ship cell has both a horizontal and a vertical ship neighbour
+    bool _all_straight() const {
+        for (int r = 0; r < n; ++r) {
+            Bits128 vert;
+            if (r > 0) vert = vert | ship[r - 1];
+            if (r + 1 < n) vert = vert | ship[r + 1];
+            if ((ship[r] & ship[r].spread() & vert).any()) return false;
+        }
+        return true;
     }
 
-    bool _component_is_straight_and_contiguous(const std::set<Coord>& comp) {
-        if (comp.empty()) return true;
-        if (comp.size() == 1) return true;
+    bool _enforce_directional_cell(int r, int c) {
+        char d = dir_hint[r * n + c];
+        if (!d) return true;
 
-        std::set<int> rows, cols;
-        for (const auto& p : comp) {
-            rows.insert(p.first);
-            cols.insert(p.second);
+        // Ensure self is ship (0)
+        int self = cell(r, c);
+        if (self == 1) return false;
+        if (self == -1) {
+            if (!assign(r, c, 0)) return false;
         }
 
-        if (rows.size() == 1) {
-            std::vector<int> cs;
-            cs.reserve(comp.size());
-            for (const auto& p : comp) cs.push_back(p.second);
-            std::sort(cs.begin(), cs.end());
-            for (size_t i = 1; i < cs.size(); ++i)
-                if (cs[i] != cs[i - 1] + 1) return false;
-            return true;
+        // Required neighbor that must be ship; 'S' () has none
+        int nr = -1, nc = -1;
+        if (d == 'U') {
+            if (r == 0) return false;
+            nr = r - 1; nc = c;
+        }
+        else if (d == 'D') {
+            if (r + 1 == n) return false;
+            nr = r + 1; nc = c;
+        }
+        else if (d == 'L') {
+            if (c == 0) return false;
+            nr = r; nc = c - 1;
+        }
+        else if (d == 'R') {
+            if (c + 1 == n) return false;
+            nr = r; nc = c + 1;
+        }
+
+        // Enforce required neighbor if any
+        if (nr >= 0) {
+            int v = cell(nr, nc);
+            if (v == 1) return false;
+            if (v == -1) {
+                if (!assign(nr, nc, 0)) return false;
+            }
+        }
+
+        // Other adjacencies must be water
+        static const int DR[4] = { -1, 1, 0, 0 };
+        static const int DC[4] = { 0, 0, -1, 1 };
+        for (int k = 0; k < 4; ++k) {
+            int fr = r + DR[k], fc = c + DC[k];
+            if (fr < 0 || fr >= n || fc < 0 || fc >= n) continue;
+            if (fr == nr && fc == nc) continue;
+            int v = cell(fr, fc);
+            if (v == 0) return false;
+            if (v == -1) {
+                if (!assign(fr, fc, 1)) return false;
+            }
         }
 
-        if (cols.size() == 1) {
-            std::vector<int> rs;
-            rs.reserve(comp.size());
-            for (const auto& p : comp) rs.push_back(p.first);
-            std::sort(rs.begin(), rs.end());
-            for (size_t i = 1; i < rs.size(); ++i)
-                if (rs[i] != rs[i - 1] + 1) return false;
+        return true;
+    }
+
+    bool _can_be(int r, int c, int val) const {
+        int cur = cell(r, c);
+        if (cur != -1) return cur == val;
+
+        if (val == 0) {
+            if (row_zero(r) + 1 > row_target[r]) return false;
+            if (col_zero(c) + 1 > col_target[c]) return false;
+
+            // Diagonal prohibition
+            if (_has_diag_zero(r, c)) return false;
+
+            // Local straight line check
+            return !((ship[r] & adj_bits[c]).any() && _has_vert_zero(r, c));
+        }
+        else {
+            if (row_zero(r) + (row_unknown(r) - 1) < row_target[r]) return false;
+            if (col_zero(c) + (col_unknown(c) - 1) < col_target[c]) return false;
             return true;
         }
+    }
+
+    bool _is_water_or_edge(int r, int c) const {
+        return r < 0 || r >= n || c < 0 || c >= n || water[r].test(c);
+    }
+
+    // A lone ship cell is a finished length-1 ship once all four neighbours are water
+    bool _closed_single(int r, int c) const {
+        return _is_water_or_edge(r - 1, c) && _is_water_or_edge(r + 1, c)
+            && _is_water_or_edge(r, c - 1) && _is_water_or_edge(r, c + 1);
+    }
+
+    bool _record_closed(int L) {
+        closed_count[L]++;
+        fleet_trail.emplace_back((int)trail.size(), L);
+        return closed_count[L] <= expected_count[L];
+    }
+
+    // Ship run in row r from column a to b (a < b): record it if both ends are closed
+    bool _check_row_run(int r, int a, int b) {
+        if (_is_water_or_edge(r, a - 1) && _is_water_or_edge(r, b + 1)) return _record_closed(b - a + 1);
+        return true;
+    }
+
+    // Ship run in column c from row t to u (t < u): record it if both ends are closed
+    bool _check_col_run(int c, int t, int u) {
+        if (_is_water_or_edge(t - 1, c) && _is_water_or_edge(u + 1, c)) return _record_closed(u - t + 1);
+        return true;
+    }
+
+    // Ship cell (r, c) next to a new water cell: its row run (the water is beside it, `horizontal`)
+    // or column run may now be closed
+    bool _check_segment_end(int r, int c, bool horizontal) {
+        if (horizontal) {
+            int a = c, b = c;
+            while (a > 0 && ship[r].test(a - 1)) --a;
+            while (b + 1 < n && ship[r].test(b + 1)) ++b;
+            if (a < b) return _check_row_run(r, a, b);
+        }
+        else {
+            int t = r, u = r;
+            while (t > 0 && ship[t - 1].test(c)) --t;
+            while (u + 1 < n && ship[u + 1].test(c)) ++u;
+            if (t < u) return _check_col_run(c, t, u);
+        }
+        return _closed_single(r, c) ? _record_closed(1) : true;
+    }
+
+    // Fleet bookkeeping after assigning (r, c): a ship segment longer than K, or more
+    // closed ships of some length than the fleet has, ends this branch
+    bool _track_fleet(int r, int c, int val) {
+        if (val == 0) {
+            int a = c, b = c, t = r, u = r;
+            while (a > 0 && ship[r].test(a - 1)) --a;
+            while (b + 1 < n && ship[r].test(b + 1)) ++b;
+            while (t > 0 && ship[t - 1].test(c)) --t;
+            while (u + 1 < n && ship[u + 1].test(c)) ++u;
+            if (b - a + 1 > K || u - t + 1 > K) return false;
+            if (a < b) return _check_row_run(r, a, b);
+            if (t < u) return _check_col_run(c, t, u);
+            return _closed_single(r, c) ? _record_closed(1) : true;
+        }
+        // New water can close the ship segments that end next to it
+        if (r > 0 && ship[r - 1].test(c) && !_check_segment_end(r - 1, c, false)) return false;
+        if (r + 1 < n && ship[r + 1].test(c) && !_check_segment_end(r + 1, c, false)) return false;
+        if (c > 0 && ship[r].test(c - 1) && !_check_segment_end(r, c - 1, true)) return false;
+        if (c + 1 < n && ship[r].test(c + 1) && !_check_segment_end(r, c + 1, true)) return false;
+        return true;
+    }
+
+    // Ships already closed by the initial clues (recorded at trail position 0, never undone)
+    void _seed_closed_ships() {
+        std::vector<int> got(closed_count.size(), 0);
+        for (int i = 0; i < n; ++i) {
+            _count_runs(ship[i], got, &water[i]);
+            _count_runs(col_ship[i], got, &col_water[i]);
+            for (Bits128 s = ship[i]; s.any(); ) {
+                int c = s.lowest();
+                s.reset(c);
+                if (_closed_single(i, c)) got[1]++;
+            }
+        }
+        for (size_t L = 1; L < got.size(); ++L) {
+            for (int k = 0; k < got[L]; ++k) {
+                closed_count[L]++;
+                fleet_trail.emplace_back(0, (int)L);
+            }
+        }
+    }
+
+    // Line mask (water/ship) has a stretch of >= len non-water cells with an unknown in it
+    bool _has_slot(const Bits128& wat, const Bits128& shp, int len) const {
+        int run = 0;
+        bool open = false;
+        for (int i = 0; i < n; ++i) {
+            if (wat.test(i)) {
+                run = 0;
+                open = false;
+                continue;
+            }
+            ++run;
+            if (!shp.test(i)) open = true;
+            if (open && run >= len) return true;
+        }
+        return false;
+    }
+
+    // Capacity bound at branch nodes: no length over quota, and the longest ship still
+    // missing must fit in some row or column
+    bool _fleet_fits() const {
+        int longest = 0;
+        for (int L = (int)closed_count.size() - 1; L >= 1; --L) {
+            if (closed_count[L] > expected_count[L]) return false;
+            if (!longest && closed_count[L] < expected_count[L]) longest = L;
+        }
+        if (longest == 0) return true;
+        for (int i = 0; i < n; ++i) {
+            if (_has_slot(water[i], ship[i], longest)) return true;
+            if (_has_slot(col_water[i], col_ship[i], longest)) return true;
+        }
+        return false;
+    }
+
+    // Add the lengths of the maximal runs (>= 2 cells) in a row/column mask to got; with
+    // closed_by, only runs whose two ends are board edges or set in closed_by are counted
+    void _count_runs(const Bits128& bits, std::vector<int>& got, const Bits128* closed_by = nullptr) const {
+        int len = 0;
+        for (int i = 0; i <= n; ++i) {
+            if (i < n && bits.test(i)) {
+                ++len;
+                continue;
+            }
+            if (len >= 2) {
+                int start = i - len;
+                if (!closed_by || ((start == 0 || closed_by->test(start - 1)) && (i == n || closed_by->test(i))))
+                    got[len]++;
+            }
+            len = 0;
+        }
+    }
 
+    bool _reject(SearchStats::Reject reason) {
+        stats.rejects[reason]++;
         return false;
     }
 
+    bool _final_check() {
+        // Row and column counts
+        for (int r = 0; r < n; ++r) if (row_zero(r) != row_target[r]) return _reject(SearchStats::REJ_COUNTS);
+        for (int c = 0; c < n; ++c) if (col_zero(c) != col_target[c]) return _reject(SearchStats::REJ_COUNTS);
+
+        // Diagonal non-adjacency
+        for (int r = 0; r + 1 < n; ++r)
+            if ((ship[r] & ship[r + 1].spread()).any()) return _reject(SearchStats::REJ_DIAG);
+
+        // Component linearity: with no bends every component is a straight contiguous run
+        if (!_all_straight()) return _reject(SearchStats::REJ_STRAIGHT);
+
+        // Direction consistency (re-validate hints)
+        for (int idx : hint_cells)
+            if (!_enforce_directional_cell(idx / n, idx % n)) return _reject(SearchStats::REJ_HINT);
+
+        // Fleet matchingϸƥ䣩
+        if (enforce_fleet) {
+            std::vector<int> got(expected_count.size(), 0);
+            for (int r = 0; r < n; ++r) {
+                _count_runs(ship[r], got);
+                _count_runs(col_ship[r], got);
+                // Single-cell ships: no ship neighbour in either direction
+                Bits128 vert;
+                if (r > 0) vert = vert | ship[r - 1];
+                if (r + 1 < n) vert = vert | ship[r + 1];
+                got[1] += ship[r].andnot(ship[r].spread() | vert).count();
+            }
+            // һƥ䣨ֹδеĳȣ
+            for (size_t L = 1; L < got.size(); ++L) {
+                if (got[L] != expected_count[L]) return _reject(SearchStats::REJ_FLEET);
+            }
+        }
+        return true;
+    }
+
     std::map<int, int> _expected_fleet(int K) {
         // Expected fleet: length L ships count is K-L+1, L=1..K
         std::map<int, int> expected;
@@ -770,35 +1547,1301 @@ private:
     }
 };
 
-int main() {
-    try {
-        auto [K, grid] = parse_input();
-        BattleshipDirectionalSolver solver(K, grid);
+// Exact solution count by a sweep over the rows (--count-method), for count-only searches
+// with more solutions than the search can visit one by one. After each row only its
+// "profile" matters for the rows below: the row's ship cells, the length of the vertical
+// segment ending in each lone ship cell (one with no ship beside it), the ships each column
+// still needs and, with the fleet rule, the ships closed so far per length. Boards with the
+// same profile are merged with their number, so the work grows with the number of distinct
+// profiles instead of the number of solutions. Boards up to 64 columns.
+class RowProfileCounter {
+public:
+    static const size_t MAX_MASKS = 1 << 15;
+
+    long long states = 0;   // profiles created over all rows
+
+    RowProfileCounter(int K, const std::vector<std::vector<int>>& grid) : K(K) {
+        n = (int)grid.size() - 1;
+        // Same fleet as BattleshipDirectionalSolver::_expected_fleet
+        int total_cells = 0;
+        for (int L = 1; L <= K; ++L) total_cells += L * (K - L + 1);
+        fleet = K >= 1 && total_cells <= n * n;
+        if (n > 64) return;
+        uint64_t all = n == 64 ? ~uint64_t(0) : (uint64_t(1) << n) - 1;
+        for (int c = 0; c < n; ++c) col_target.push_back(grid[0][c + 1]);
+        rows.resize(n);
+        for (int r = 0; r < n; ++r) {
+            Row& row = rows[r];
+            row.target = grid[r + 1][0];
+            for (int c = 0; c < n; ++c) {
+                int v = grid[r + 1][c + 1];
+                uint64_t bit = uint64_t(1) << c, left = bit >> 1, right = (bit << 1) & all;
+                if (v == 1) row.water |= bit;
+                if (v == 0 || v >= 2) row.ship |= bit;
+                if (v < 2) continue;
+                // Directional hints: the neighbour the hint points to is a ship, the others water
+                char d = "UDLRS"[v - 2];
+                if ((d == 'U' && r == 0) || (d == 'D' && r + 1 == n) || (d == 'L' && c == 0) || (d == 'R' && c + 1 == n))
+                    impossible = true;
+                (d == 'L' ? row.ship : row.water) |= left;
+                (d == 'R' ? row.ship : row.water) |= right;
+                (d == 'U' ? row.above_ship : row.above_water) |= bit;
+                (d == 'D' ? row.below_ship : row.below_water) |= bit;
+            }
+            if (row.ship & row.water) impossible = true;
+        }
+    }
+
+    // Number of solutions, or nullopt when a row has more than max_states profiles or
+    // MAX_MASKS candidate ship masks, the count does not fit in a long long, the board is too
+    // wide or *cancel is set. progress (optional) is called after each row with the profiles created so
+    // far and the fraction of rows done.
+    std::optional<long long> count(size_t max_states, const std::atomic<bool>* cancel,
+                                   const std::function<void(long long, double)>& progress) {
+        if (n > 64) return std::nullopt;
+        if (impossible) return 0;
+        for (Row& row : rows) {
+            if (!_row_masks(row, MAX_MASKS)) return std::nullopt;
+        }
+
+        // Profile layout (bytes): per column 0 (water), the vertical length so far (lone ship
+        // cell) or RUN (part of a horizontal ship); per column the ships still needed; with the
+        // fleet rule, the closed ships of length 1..K
+        bytes = 2 * n + (fleet ? K : 0);
+        Layer layer((bytes + 7) / 8), next(layer.words);
+        packed.assign(layer.words, 0);
+        std::vector<char> prof(bytes, 0);
+        for (int c = 0; c < n; ++c) prof[n + c] = (char)col_target[c];
+        layer.add(_pack(prof), 1);
+
+        std::vector<std::pair<uint64_t, std::vector<const Mask*>>> fits;   // row above -> masks
+        for (int r = 0; r <= n; ++r) {
+            if (cancel && cancel->load(std::memory_order_relaxed)) return std::nullopt;
+            if (layer.size == 0) return 0;
+            // Row n is a row of water below the board: it closes the last segments
+            static const std::vector<Mask> none = { Mask() };
+            const std::vector<Mask>& masks = r < n ? rows[r].masks : none;
+            uint64_t above_ship = r < n ? rows[r].above_ship : 0, above_water = r < n ? rows[r].above_water : 0;
+            uint64_t below_ship = r > 0 ? rows[r - 1].below_ship : 0, below_water = r > 0 ? rows[r - 1].below_water : 0;
+            int rows_left = std::max(0, n - 1 - r);
+
+            next.clear();
+            fits.clear();
+            for (size_t i = 0; i < layer.capacity(); ++i) {
+                unsigned long long ways = layer.ways[i];
+                if (!ways) continue;
+                uint64_t prev = _unpack(&layer.keys[i * layer.words], prof);
+                auto it = std::find_if(fits.begin(), fits.end(), [&](const auto& f) { return f.first == prev; });
+                if (it == fits.end()) {
+                    std::vector<const Mask*> ok;
+                    uint64_t lone_prev = _lone(prev);
+                    if ((above_ship & ~prev) == 0 && (above_water & prev) == 0) {
+                        for (const Mask& m : masks) {
+                            if (m.bits & ((prev << 1) | (prev >> 1))) continue;     // diagonal
+                            if (m.bits & prev & ~lone_prev) continue;               // below a horizontal ship
+                            if (m.bits & prev & ~m.lone) continue;                  // bend
+                            if ((below_ship & ~m.bits) || (below_water & m.bits)) continue;
+                            ok.push_back(&m);
+                        }
+                    }
+                    fits.emplace_back(prev, std::move(ok));
+                    it = fits.end() - 1;
+                }
+                for (const Mask* m : it->second) {
+                    if (!_step(*m, prev, prof, rows_left, next, ways)) return std::nullopt;
+                }
+                if (next.size > max_states) return std::nullopt;
+            }
+            states += (long long)next.size;
+            std::swap(layer, next);
+            if (progress) progress(states, (double)(r + 1) / (n + 1));
+        }
 
-        std::vector<std::vector<std::vector<int>>> solutions;
-        solver.enumerate_all(solutions);
+        // Every column is filled; the fleet must be complete
+        unsigned long long total = 0;
+        for (size_t i = 0; i < layer.capacity(); ++i) {
+            unsigned long long ways = layer.ways[i];
+            if (!ways) continue;
+            _unpack(&layer.keys[i * layer.words], prof);
+            bool ok = true;
+            for (int L = 1; L <= K && fleet; ++L)
+                if (prof[2 * n + L - 1] != K - L + 1) ok = false;
+            if (ok && (total += ways) < ways) return std::nullopt;
+        }
+        if (total > (unsigned long long)LLONG_MAX) return std::nullopt;
+        return (long long)total;
+    }
 
-        if (solutions.empty()) {
-            std::cout << "No solution" << std::endl;
-            return 0;
+private:
+    // A ship mask for one row: its lone cells and the lengths of its longer runs
+    struct Mask {
+        uint64_t bits = 0, lone = 0;
+        std::vector<int> runs;
+    };
+    struct Row {
+        int target = 0;
+        uint64_t ship = 0, water = 0;               // known cells (and hint neighbours)
+        uint64_t above_ship = 0, above_water = 0;   // required in the row above
+        uint64_t below_ship = 0, below_water = 0;   // required in the row below
+        std::vector<Mask> masks;
+    };
+
+    // Profiles of one row with their number of partial boards: open addressing over packed
+    // keys of `words` words, ways == 0 marks an empty slot
+    struct Layer {
+        int words;
+        size_t size = 0;
+        std::vector<uint64_t> keys;
+        std::vector<unsigned long long> ways;
+
+        explicit Layer(int words) : words(words), keys((size_t)words * 1024), ways(1024) {}
+        size_t capacity() const { return ways.size(); }
+        void clear() {
+            std::fill(ways.begin(), ways.end(), 0);
+            size = 0;
+        }
+        // Add `w` boards with profile `key`; false if the sum overflows
+        bool add(const uint64_t* key, unsigned long long w) {
+            if ((size + 1) * 2 > capacity()) _grow();
+            size_t mask = capacity() - 1, i = _hash(key) & mask;
+            for (;; i = (i + 1) & mask) {
+                uint64_t* k = &keys[i * words];
+                if (!ways[i]) {
+                    std::copy(key, key + words, k);
+                    ways[i] = w;
+                    ++size;
+                    return true;
+                }
+                if (std::equal(key, key + words, k)) return (ways[i] += w) >= w;
+            }
         }
+        uint64_t _hash(const uint64_t* key) const {
+            uint64_t h = 0x243f6a8885a308d3ULL;
+            for (int j = 0; j < words; ++j) h = (h ^ key[j]) * 0x9e3779b97f4a7c15ULL;
+            return h ^ (h >> 31);
+        }
+        void _grow() {
+            Layer bigger(words);
+            bigger.keys.assign(keys.size() * 2, 0);
+            bigger.ways.assign(ways.size() * 2, 0);
+            for (size_t i = 0; i < capacity(); ++i)
+                if (ways[i]) bigger.add(&keys[i * words], ways[i]);
+            std::swap(*this, bigger);
+        }
+    };
+
+    static const char RUN = 127;
+
+    int K;
+    int n;
+    int bytes = 0;                  // profile size, see count()
+    bool fleet = false;
+    bool impossible = false;
+    std::vector<int> col_target;
+    std::vector<Row> rows;
+    std::vector<uint64_t> packed;   // _pack output
+
+    static uint64_t _lone(uint64_t bits) { return bits & ~((bits << 1) | (bits >> 1)); }
+
+    const uint64_t* _pack(const std::vector<char>& prof) {
+        std::fill(packed.begin(), packed.end(), 0);
+        std::memcpy(packed.data(), prof.data(), bytes);
+        return packed.data();
+    }
+
+    // Fills prof from a packed key and returns the ship cells of the row
+    uint64_t _unpack(const uint64_t* key, std::vector<char>& prof) const {
+        std::memcpy(prof.data(), key, bytes);
+        uint64_t bits = 0;
+        for (int c = 0; c < n; ++c)
+            if (prof[c]) bits |= uint64_t(1) << c;
+        return bits;
+    }
 
-        std::cout << "Solutions: " << solutions.size() << std::endl;
-        for (size_t idx = 0; idx < solutions.size(); ++idx) {
-            const auto& sol = solutions[idx];
-            for (int r = 0; r < solver.getN(); ++r) {
-                for (int c = 0; c < solver.getN(); ++c) {
-                    if (c > 0) std::cout << " ";
-                    std::cout << sol[r][c];
+    // All ship masks of a row with its target count and known cells (runs of at most K cells
+    // with the fleet rule); false if there are more than `cap`
+    bool _row_masks(Row& row, size_t cap) {
+        row.masks.clear();
+        bool ok = true;
+        std::function<void(int, uint64_t, int, int)> place = [&](int c, uint64_t bits, int left, int run) {
+            if (!ok) return;
+            if (c == n) {
+                if (left) return;
+                if (row.masks.size() >= cap) {
+                    ok = false;
+                    return;
                 }
-                std::cout << std::endl;
+                Mask m;
+                m.bits = bits;
+                m.lone = _lone(bits);
+                for (int i = 0, len = 0; i <= n; ++i) {
+                    if (i < n && (bits >> i) & 1) {
+                        ++len;
+                        continue;
+                    }
+                    if (len >= 2) m.runs.push_back(len);
+                    len = 0;
+                }
+                row.masks.push_back(std::move(m));
+                return;
+            }
+            uint64_t bit = uint64_t(1) << c;
+            if (left < n - c && !(row.ship & bit)) place(c + 1, bits, left, 0);
+            if (left > 0 && !(row.water & bit) && (!fleet || run < K)) place(c + 1, bits | bit, left - 1, run + 1);
+        };
+        place(0, 0, row.target, 0);
+        return ok;
+    }
+
+    // Add the row `m` below profile `prof`; false if a count overflows
+    bool _step(const Mask& m, uint64_t prev, const std::vector<char>& prof, int rows_left, Layer& next,
+               unsigned long long ways) {
+        std::vector<char>& out = scratch;
+        out.assign(prof.begin(), prof.end());
+        char* closed = out.data() + 2 * n - 1;      // closed[L], L = 1..K
+        for (int c = 0; c < n; ++c) {
+            bool here = (m.bits >> c) & 1;
+            char& need = out[n + c];
+            if (here && --need < 0) return true;
+            if (need > rows_left) return true;
+            char v = prof[c];
+            out[c] = 0;
+            if (!here) {
+                // A vertical segment (or lone cell) above ends here
+                if (fleet && v && v != RUN && ++closed[(int)v] > K - v + 1) return true;
+                continue;
+            }
+            if (!((m.lone >> c) & 1)) out[c] = RUN;
+            else if ((prev >> c) & 1) {
+                out[c] = fleet ? v + 1 : 1;
+                if (fleet && out[c] > K) return true;
             }
-            if (idx + 1 < solutions.size()) std::cout << std::endl;
+            else out[c] = 1;
         }
+        if (fleet) {
+            for (int len : m.runs)
+                if (++closed[len] > K - len + 1) return true;
+        }
+        return next.add(_pack(out), ways);
+    }
+
+    std::vector<char> scratch;
+};
+
+// Parallel enumeration over `threads` workers. The tree is split into many more subtrees
+// than threads; each worker owns a copy of `proto` (board, trail and queues) and takes the
+// next unclaimed subtree. Solutions are handed to on_solution on the calling thread in
+// subtree order, i.e. in exactly the order of proto.enumerate_all; the current head subtree
+// is streamed as it runs, later ones are buffered until their turn. on_solution gets the
+// board (null when keep_boards is false) and returns false to stop. `limit` (-1: none)
+// caps the solutions taken from any one subtree, since no more can ever be used.
+// Returns false if stopped by on_solution or by `cancel`.
+// `progress` (optional) is called now and then on the calling thread with the nodes searched
+// and the explored fraction (see BattleshipDirectionalSolver::explored) summed over the workers.
+bool enumerate_parallel(BattleshipDirectionalSolver& proto, int threads, long long limit, bool keep_boards,
+                        const std::atomic<bool>* cancel,
+                        const std::function<bool(const PackedBoard*)>& on_solution,
+                        const std::function<void(long long, double)>& progress) {
+    using Prefix = std::vector<BattleshipDirectionalSolver::Decision>;
+
+    // Deepen the split until there are enough subtrees to balance the load
+    std::vector<Prefix> tasks;
+    size_t want = (size_t)threads * 16;
+    for (int depth = 1; depth <= 24; ++depth) {
+        size_t before = tasks.size();
+        tasks = proto.split(depth);
+        if (tasks.size() >= want || tasks.size() == before) break;
+    }
+    if (tasks.size() <= 1) {
+        if (progress) proto.tick = [&]() { progress(proto.stats.nodes, proto.explored); };
+        return proto.enumerate_all([&]() {
+            if (!keep_boards) return on_solution(nullptr);
+            auto board = proto.pack();
+            return on_solution(&board);
+        });
+    }
+
+    struct TaskResult {
+        std::vector<PackedBoard> boards;
+        long long count = 0;
+        bool done = false;
+    };
+    std::vector<TaskResult> results(tasks.size());
+    std::mutex mu;
+    std::condition_variable cv;
+    std::atomic<size_t> next{ 0 };
+    std::atomic<bool> abort{ false };
+    SearchStats worker_stats;
+
+    // Published by each worker every TICK_NODES nodes and read by the calling thread
+    struct WorkerProgress {
+        std::atomic<long long> nodes{ 0 };
+        std::atomic<double> explored{ 0 };
+    };
+    std::vector<WorkerProgress> published(threads);
+    std::atomic<int> next_worker{ 0 };
+
+    auto worker = [&]() {
+        BattleshipDirectionalSolver solver(proto);
+        solver.stats.clear();
+        solver.explored = 0;
+        solver.set_cancel_flag(&abort);
+        WorkerProgress& mine = published[next_worker++];
+        solver.tick = [&]() {
+            mine.nodes.store(solver.stats.nodes, std::memory_order_relaxed);
+            mine.explored.store(solver.explored, std::memory_order_relaxed);
+        };
+        while (!abort.load()) {
+            size_t i = next++;
+            if (i >= tasks.size()) break;
+            long long local = 0;
+            solver.enumerate_subtree(tasks[i], [&]() {
+                ++local;
+                if (keep_boards) {
+                    auto board = solver.pack();
+                    std::lock_guard<std::mutex> lk(mu);
+                    results[i].boards.push_back(std::move(board));
+                    results[i].count = local;
+                    cv.notify_all();
+                }
+                return limit < 0 || local < limit;
+            });
+            solver.tick();
+            std::lock_guard<std::mutex> lk(mu);
+            results[i].count = local;
+            results[i].done = !abort.load();
+            cv.notify_all();
+        }
+        std::lock_guard<std::mutex> lk(mu);
+        worker_stats += solver.stats;
+    };
+
+    std::vector<std::thread> pool;
+    for (int t = 0; t < threads; ++t) pool.emplace_back(worker);
+
+    // Hand over the solutions in subtree order
+    bool finished = true;
+    {
+        std::unique_lock<std::mutex> lk(mu);
+        size_t head = 0;
+        long long pos = 0;
+        while (head < tasks.size()) {
+            if (cancel && cancel->load()) {
+                finished = false;
+                break;
+            }
+            if (progress) {
+                long long nodes = proto.stats.nodes;
+                double explored = 0;
+                for (const auto& p : published) {
+                    nodes += p.nodes.load(std::memory_order_relaxed);
+                    explored += p.explored.load(std::memory_order_relaxed);
+                }
+                lk.unlock();
+                progress(nodes, explored);
+                lk.lock();
+            }
+            TaskResult& res = results[head];
+            if (pos < res.count && (!keep_boards || pos < (long long)res.boards.size())) {
+                PackedBoard board;
+                if (keep_boards) board = std::move(res.boards[pos]);
+                ++pos;
+                lk.unlock();
+                bool cont = on_solution(keep_boards ? &board : nullptr);
+                lk.lock();
+                if (!cont) {
+                    finished = false;
+                    break;
+                }
+                continue;
+            }
+            if (res.done) {
+                res.boards.clear();
+                res.boards.shrink_to_fit();
+                ++head;
+                pos = 0;
+                continue;
+            }
+            // Wake up now and then to notice cancellation
+            cv.wait_for(lk, std::chrono::milliseconds(50));
+        }
+    }
+    abort = true;
+    for (auto& t : pool) t.join();
+    proto.stats += worker_stats;
+    return finished;
+}
+
+void print_board(const BattleshipDirectionalSolver& solver) {
+    int n = solver.getN();
+    for (int r = 0; r < n; ++r) {
+        for (int c = 0; c < n; ++c) {
+            if (c > 0) std::cout << ' ';
+            std::cout << solver.cell(r, c);
+        }
+        std::cout << '\n';
+    }
+}
+
+void print_board(const uint64_t* bits, int n) {
+    std::string line(2 * (size_t)n - 1, ' ');
+    for (int r = 0; r < n; ++r) {
+        for (int c = 0; c < n; ++c) line[2 * c] = packed_ship(bits, (size_t)r * n + c) ? '0' : '1';
+        std::cout << line << '\n';
+    }
+}
+
+void add_ship_counts(std::vector<long long>& heat, const PackedBoard& board) {
+    for (size_t w = 0; w < board.size(); ++w)
+        for (uint64_t bits = board[w]; bits; bits &= bits - 1)
+            heat[w * 64 + Bits128::_ctz64(bits)]++;
+}
+
+// Report of a search stopped by --time-limit / --node-limit or STOP (see run_job):
+// "Deduced:" with n rows of the cells fixed at the root (0 ship, 1 water, -1 unknown), then
+// "Agreed: <solutions found>" with n rows of the cells that have the same value in all the
+// solutions found so far (-1 where they differ); with no solutions found, Agreed = Deduced.
+// `heat` counts, per cell, the found solutions in which it is a ship; it is empty for a plain
+// count, which does not look at the solutions (Agreed = Deduced as well).
+void print_partial_report(const std::vector<std::vector<int>>& deduced, const std::vector<long long>& heat,
+                          int n, long long count) {
+    std::cout << "Deduced:" << '\n';
+    for (int r = 0; r < n; ++r) {
+        for (int c = 0; c < n; ++c) std::cout << (c > 0 ? " " : "") << deduced[r][c];
+        std::cout << '\n';
+    }
+    std::cout << "Agreed: " << count << '\n';
+    for (int r = 0; r < n; ++r) {
+        for (int c = 0; c < n; ++c) {
+            long long k = heat.empty() ? 0 : heat[(size_t)r * n + c];
+            int v = count == 0 || heat.empty() ? deduced[r][c] : k == count ? 0 : k == 0 ? 1 : -1;
+            std::cout << (c > 0 ? " " : "") << v;
+        }
+        std::cout << '\n';
+    }
+}
+
+// --heatmap block: "Heatmap: <solutions counted>", then n rows with the number of those
+// solutions in which each cell is a ship
+void print_heatmap(const std::vector<long long>& heat, int n, long long count) {
+    std::cout << "Heatmap: " << count << '\n';
+    for (int r = 0; r < n; ++r) {
+        for (int c = 0; c < n; ++c) {
+            if (c > 0) std::cout << ' ';
+            std::cout << heat[(size_t)r * n + c];
+        }
+        std::cout << '\n';
+    }
+}
+
+// Boards kept for the non-stream output, stored back to back as PackedBoards
+struct PackedSolutions {
+    size_t words;
+    size_t count = 0;
+    std::vector<uint64_t> data;
+
+    explicit PackedSolutions(int n) : words(((size_t)n * n + 63) / 64) {}
+    void push(const PackedBoard& board) {
+        data.insert(data.end(), board.begin(), board.end());
+        ++count;
+    }
+    const uint64_t* at(size_t i) const { return data.data() + i * words; }
+};
+
+// --binary output; every integer is little-endian
+//   header   "BSB1", u32 n, u32 K, u64 count (number of solutions; UINT64_MAX with --stream,
+//            where the header is written before the search and the count is only in the trailer)
+//   records  one per solution unless --count-only: u32 byte length, then the PackedBoard as
+//            ceil(n*n/8) bytes (cell r*n+c is bit (r*n+c)%8 of byte (r*n+c)/8)
+//   trailer  u32 0, u64 count, u32 flags (bit 0: stopped by --limit)
+void put_le(std::string& out, uint64_t v, int bytes) {
+    for (int i = 0; i < bytes; ++i) out.push_back((char)((v >> (8 * i)) & 0xff));
+}
+
+void write_binary_header(int n, int K, uint64_t count) {
+    std::string out = "BSB1";
+    put_le(out, (uint64_t)n, 4);
+    put_le(out, (uint64_t)K, 4);
+    put_le(out, count, 8);
+    std::cout.write(out.data(), (std::streamsize)out.size());
+}
+
+void write_binary_board(const uint64_t* bits, int n) {
+    size_t bytes = ((size_t)n * n + 7) / 8;
+    std::string out;
+    out.reserve(4 + bytes);
+    put_le(out, bytes, 4);
+    for (size_t j = 0; j < bytes; ++j) out.push_back((char)((bits[j >> 3] >> ((j & 7) * 8)) & 0xff));
+    std::cout.write(out.data(), (std::streamsize)out.size());
+}
+
+void write_binary_trailer(uint64_t count, bool limited) {
+    std::string out;
+    put_le(out, 0, 4);
+    put_le(out, count, 8);
+    put_le(out, limited ? 1 : 0, 4);
+    std::cout.write(out.data(), (std::streamsize)out.size());
+}
+
+// Engine flags (command line, or the flags of a SOLVE request in server mode)
+//   --stream      print each solution (followed by a blank line) as soon as it is found,
+//                 with "Solutions: N" / "No solution" as the last line
+//   --limit N     stop after N solutions ("Stopped: limit" is printed when the limit cut the search)
+//   --count-only  only print "Solutions: N" / "No solution", never store or print boards
+//   --unique      stop at the second solution and print "Unique: yes|no|none";
+//                 for "no", "Diff: r,c ..." lists the (1-based) cells where the two solutions differ
+//   --threads N   search with N worker threads (0: one per CPU core); output and solution
+//                 order are the same as the single-threaded search
+//   --binary      write the bit-packed binary format above instead of text (not in server mode)
+//   --heatmap     count, per cell, the solutions in which it is a ship instead of storing boards;
+//                 prints a heatmap block (see print_heatmap) before "Solutions: N", and with
+//                 --stream also a partial block every HEATMAP_INTERVAL_MS while the search runs
+//   --stats       after the search, print "STATS <json>" (see SearchStats::to_json) with search
+//                 counters and phase times to stderr (in server mode: inside the job's output)
+//   --progress    every PROGRESS_INTERVAL_MS while searching, print
+//                 "PROGRESS {"nodes":N,"solutions":S,"explored":F,"elapsed_ms":T}" to stderr (in server
+//                 mode: inside the job's output); F in [0, 1] is the estimated explored fraction of
+//                 the search tree (see BattleshipDirectionalSolver::explored)
+//   --time-limit S, --node-limit N
+//                 stop the search after S seconds / N nodes; if it did not finish by then,
+//                 print "Stopped: time|nodes" and the partial report (see print_partial_report)
+//                 before the usual output of the solutions found (not with --binary)
+//   --memo MB     size of the transposition table of finished subtrees per search thread
+//                 (default DEFAULT_MEMO_MB, 0: off; see BattleshipDirectionalSolver::set_memo);
+//                 subtrees without solutions are skipped when they come up again, and with
+//                 --count-only (without --unique / --heatmap / a search budget) known counts are reused
+//   --deduce      no search: print "Deduce: ok|solved|contradiction [rule]" and, unless
+//                 contradictory, "Deduced:" with the n rows of cells fixed by propagation at the
+//                 root (-1 where undecided; see BattleshipDirectionalSolver::deduce); the other
+//                 search flags are ignored
+//   --count-method auto|search|rows
+//                 how --count-only counts (without --unique / --heatmap / a search budget):
+//                 rows: by RowProfileCounter, an error if it gives up; search: by the search;
+//                 auto (default): without --limit, a search that takes more than
+//                 AUTO_SEARCH_NODES nodes switches to rows, and back to the search if rows
+//                 gives up (more than ROW_COUNT_MAX_STATES profiles in a row)
+//   --symmetry expand|orbits
+//                 search only for the canonical solution of each orbit under the symmetries of the
+//                 square that map the puzzle onto itself (see BattleshipDirectionalSolver::set_symmetry;
+//                 no memo meanwhile). expand: every solution is still reported, each canonical one
+//                 followed by its other images, so the order differs from the plain search;
+//                 orbits: one solution per orbit, each preceded by "Orbit: <size>", and
+//                 "Orbits: M" before "Solutions: N" (N counts all solutions, --limit counts
+//                 orbits; not with --unique, --heatmap, --binary or --count-method rows)
+const long long DEFAULT_MEMO_MB = 16;
+const size_t ROW_COUNT_MAX_STATES = 1 << 20;
+const long long AUTO_SEARCH_NODES = 1 << 18;
+
+enum class CountMethod { AUTO, SEARCH, ROWS };
+enum class Symmetry { OFF, EXPAND, ORBITS };
+
+struct SolveOptions {
+    bool stream = false;
+    long long limit = -1;
+    bool count_only = false;
+    bool unique = false;
+    int threads = 1;
+    bool binary = false;
+    bool heatmap = false;
+    bool stats = false;
+    bool progress = false;
+    bool deduce = false;
+    double time_limit = 0;          // seconds, 0: none
+    long long node_limit = 0;       // 0: none
+    long long memo_mb = DEFAULT_MEMO_MB;    // transposition table size, 0: off
+    CountMethod count_method = CountMethod::AUTO;
+    Symmetry symmetry = Symmetry::OFF;
+    bool records_to_stdout = false; // server mode: STATS / PROGRESS lines inside the job's output
+};
+
+const int HEATMAP_INTERVAL_MS = 250;
+const int PROGRESS_INTERVAL_MS = 500;
+
+// Print a STATS / PROGRESS line
+void emit_record(const SolveOptions& opt, const std::string& line) {
+    if (opt.records_to_stdout) std::cout << line << std::endl;
+    else std::cerr << line << std::endl;
+}
+
+SolveOptions parse_options(const std::vector<std::string>& args) {
+    SolveOptions opt;
+    for (size_t i = 0; i < args.size(); ++i) {
+        const std::string& arg = args[i];
+        if (arg == "--stream") {
+            opt.stream = true;
+        }
+        else if (arg == "--limit") {
+            if (i + 1 >= args.size()) throw std::runtime_error("--limit Ҫһ");
+            try {
+                opt.limit = std::stoll(args[++i]);
+            }
+            catch (...) {
+                throw std::runtime_error("--limit Ҫһ");
+            }
+            if (opt.limit <= 0) throw std::runtime_error("--limit Ҫһ");
+        }
+        else if (arg == "--count-only") {
+            opt.count_only = true;
+        }
+        else if (arg == "--unique") {
+            opt.unique = true;
+        }
+        else if (arg == "--binary") {
+            opt.binary = true;
+        }
+        else if (arg == "--heatmap") {
+            opt.heatmap = true;
+        }
+        else if (arg == "--stats") {
+            opt.stats = true;
+        }
+        else if (arg == "--progress") {
+            opt.progress = true;
+        }
+        else if (arg == "--deduce") {
+            opt.deduce = true;
+        }
+        else if (arg == "--time-limit") {
+            if (i + 1 >= args.size()) throw std::runtime_error("--time-limit Ҫһ룩");
+            try {
+                opt.time_limit = std::stod(args[++i]);
+            }
+            catch (...) {
+                throw std::runtime_error("--time-limit Ҫһ룩");
+            }
+            if (!(opt.time_limit > 0)) throw std::runtime_error("--time-limit Ҫһ룩");
+        }
+        else if (arg == "--node-limit") {
+            if (i + 1 >= args.size()) throw std::runtime_error("--node-limit Ҫһ");
+            try {
+                opt.node_limit = std::stoll(args[++i]);
+            }
+            catch (...) {
+                throw std::runtime_error("--node-limit Ҫһ");
+            }
+            if (opt.node_limit <= 0) throw std::runtime_error("--node-limit Ҫһ");
+        }
+        else if (arg == "--memo") {
+            if (i + 1 >= args.size()) throw std::runtime_error("--memo ҪһǸMB");
+            try {
+                opt.memo_mb = std::stoll(args[++i]);
+            }
+            catch (...) {
+                throw std::runtime_error("--memo ҪһǸMB");
+            }
+            if (opt.memo_mb < 0) throw std::runtime_error("--memo ҪһǸMB");
+        }
+        else if (arg == "--count-method") {
+            std::string m = i + 1 < args.size() ? args[++i] : "";
+            if (m == "auto") opt.count_method = CountMethod::AUTO;
+            else if (m == "search") opt.count_method = CountMethod::SEARCH;
+            else if (m == "rows") opt.count_method = CountMethod::ROWS;
+            else throw std::runtime_error("--count-method Ҫ autosearch  rows");
+        }
+        else if (arg == "--symmetry") {
+            std::string m = i + 1 < args.size() ? args[++i] : "";
+            if (m == "expand") opt.symmetry = Symmetry::EXPAND;
+            else if (m == "orbits") opt.symmetry = Symmetry::ORBITS;
+            else throw std::runtime_error("--symmetry Ҫ expand  orbits");
+        }
+        else if (arg == "--threads") {
+            if (i + 1 >= args.size()) throw std::runtime_error("--threads ҪһǸ");
+            try {
+                opt.threads = std::stoi(args[++i]);
+            }
+            catch (...) {
+                throw std::runtime_error("--threads ҪһǸ");
+            }
+            if (opt.threads < 0) throw std::runtime_error("--threads ҪһǸ");
+            if (opt.threads == 0) opt.threads = std::max(1, (int)std::thread::hardware_concurrency());
+        }
+        else {
+            throw std::runtime_error("δ֪: " + arg);
+        }
+    }
+    if (opt.heatmap && (opt.unique || opt.binary))
+        throw std::runtime_error("--heatmap  --unique  --binary ͬʱʹ");
+    if (opt.deduce && opt.binary)
+        throw std::runtime_error("--deduce  --binary ͬʱʹ");
+    if (opt.binary && (opt.time_limit > 0 || opt.node_limit > 0))
+        throw std::runtime_error("--time-limit / --node-limit  --binary ͬʱʹ");
+    if (opt.count_method == CountMethod::ROWS
+        && (!opt.count_only || opt.unique || opt.heatmap || opt.time_limit > 0 || opt.node_limit > 0))
+        throw std::runtime_error("--count-method rows ֻ --count-onlyҲ --unique--heatmap Ԥͬʱʹ");
+    if (opt.symmetry == Symmetry::ORBITS
+        && (opt.unique || opt.heatmap || opt.binary || opt.count_method == CountMethod::ROWS))
+        throw std::runtime_error("--symmetry orbits  --unique--heatmap--binary  --count-method rows ͬʱʹ");
+    return opt;
+}
+
+void print_unique_report(const PackedBoard& first, const PackedBoard& second, int n, long long count) {
+    if (count == 0) {
+        std::cout << "Unique: none" << '\n';
+        return;
+    }
+    if (count == 1) {
+        std::cout << "Unique: yes" << '\n';
+        return;
+    }
+    std::cout << "Unique: no" << '\n';
+    std::cout << "Diff:";
+    for (int r = 0; r < n; ++r)
+        for (int c = 0; c < n; ++c) {
+            size_t i = (size_t)r * n + c;
+            if (packed_ship(first.data(), i) != packed_ship(second.data(), i)) std::cout << ' ' << r + 1 << ',' << c + 1;
+        }
+    std::cout << '\n';
+}
+
+// Solve one puzzle read from `in` and print the result to stdout.
+// Returns false if the job was cancelled through `cancel`. `stop` (server STOP request) ends
+// the search like an exhausted --time-limit, with the partial report.
+bool run_job(std::istream& in, const SolveOptions& opt, const std::atomic<bool>* cancel,
+             const std::atomic<bool>* stop = nullptr) {
+    auto [K, grid] = parse_input(in);
+    BattleshipDirectionalSolver solver(K, grid);
+    solver.stats.timing = opt.stats;
+
+    if (opt.deduce) {
+        std::vector<std::vector<int>> cells;
+        std::string status = solver.deduce(cells);
+        std::cout << "Deduce: " << status << '\n';
+        if (status.rfind("contradiction", 0) != 0) {
+            std::cout << "Deduced:" << '\n';
+            for (const auto& row : cells) {
+                for (size_t c = 0; c < row.size(); ++c) std::cout << (c > 0 ? " " : "") << row[c];
+                std::cout << '\n';
+            }
+        }
+        std::cout << std::flush;
+        return true;
+    }
+
+    // Budgets and STOP are checked on the solver's tick and end the search through
+    // `stop_search`, which then also has to pass on `cancel`. In server mode `stop` is always
+    // given, so it must not decide anything but how the search ends.
+    bool budget = opt.time_limit > 0 || opt.node_limit > 0;
+    bool can_stop = budget || stop != nullptr;
+    // A plain count: nobody looks at the solutions, so stored subtree counts (--memo) and the
+    // row sweep (--count-method) may stand in for them
+    bool plain_count = opt.count_only && !opt.unique && !opt.heatmap && !budget;
+    std::atomic<bool> stop_search{ false };
+    const char* stop_reason = nullptr;
+    std::vector<std::vector<int>> deduced;
+    if (can_stop) deduced = solver.root_deductions();
+    solver.set_cancel_flag(can_stop ? &stop_search : cancel);
+
+    long long limit = opt.unique ? 2 : opt.limit;
+    long long count = 0;
+    int n = solver.getN();
+    PackedSolutions solutions(n);     // non-stream output only
+    PackedBoard first, second;        // --unique only
+    std::vector<long long> heat;      // --heatmap, and for the partial report
+    if (opt.heatmap || (can_stop && !plain_count)) heat.assign((size_t)n * n, 0);
+    auto last_heat = std::chrono::steady_clock::now();
+    solver.set_memo((size_t)opt.memo_mb * 1024 * 1024 / sizeof(BattleshipDirectionalSolver::MemoEntry), plain_count);
+    // --symmetry: the search finds the canonical solution of each orbit, and `images` holds the
+    // orbit of the one being reported (see on_found; a single board when the puzzle has no symmetry)
+    bool symmetric = opt.symmetry != Symmetry::OFF;
+    bool orbits = opt.symmetry == Symmetry::ORBITS;
+    if (symmetric) solver.set_symmetry();
+    std::vector<PackedBoard> images;
+    long long total = 0;              // solutions in all (with orbits, `count` counts orbits)
+    std::vector<size_t> orbit_sizes;  // non-stream output with orbits
+
+    // Called for every solution in search order; `board` is null when the solution is
+    // still on the (single-threaded) solver
+    auto on_solution = [&](const PackedBoard* board) {
+        ++count;
+        total += orbits ? images.size() : 1;
+        if (opt.unique) {
+            if (count == 1) first = board ? *board : solver.pack();
+            else second = board ? *board : solver.pack();
+        }
+        if (!heat.empty()) {
+            if (orbits)
+                for (const auto& image : images) add_ship_counts(heat, image);
+            else if (board) add_ship_counts(heat, *board);
+            else solver.add_ship_counts(heat);
+        }
+        if (opt.heatmap) {
+            auto now = std::chrono::steady_clock::now();
+            if (opt.stream && now - last_heat >= std::chrono::milliseconds(HEATMAP_INTERVAL_MS)) {
+                print_heatmap(heat, n, count);
+                std::cout << std::flush;
+                last_heat = now;
+            }
+        }
+        else if (!opt.count_only) {
+            if (opt.stream && opt.binary) {
+                if (board) write_binary_board(board->data(), n);
+                else write_binary_board(solver.pack().data(), n);
+                std::cout.flush();
+            }
+            else if (opt.stream) {
+                if (orbits) std::cout << "Orbit: " << images.size() << '\n';
+                if (board) print_board(board->data(), n);
+                else print_board(solver);
+                std::cout << std::endl; // blank separator + flush
+            }
+            else if (board) {
+                solutions.push(*board);
+            }
+            else {
+                solutions.push(solver.pack());
+            }
+            if (orbits && !opt.stream) orbit_sizes.push_back(images.size());
+        }
+        return limit < 0 || count < limit;
+    };
+    // Called for every solution the search finds; with --symmetry a canonical one, passed on
+    // with its other images (expand) or alone (orbits)
+    auto on_found = [&](const PackedBoard* board) {
+        if (!symmetric) return on_solution(board);
+        images = solver.symmetric_images(board ? *board : solver.pack());
+        if (orbits) return on_solution(&images[0]);
+        for (const auto& image : images)
+            if (!on_solution(&image)) return false;
+        return true;
+    };
+
+    if (opt.binary && opt.stream) {
+        write_binary_header(n, K, UINT64_MAX);
+        std::cout.flush();
+    }
+
+    auto search_start = std::chrono::steady_clock::now();
+    auto elapsed_ms = [&]() {
+        return std::chrono::duration_cast<std::chrono::microseconds>(
+            std::chrono::steady_clock::now() - search_start).count() / 1000.0;
+    };
+    auto last_progress = search_start;
+    // Called now and then while searching with the nodes searched and the explored fraction
+    std::function<void(long long, double)> on_tick;
+    if (opt.progress || can_stop) {
+        on_tick = [&](long long nodes, double explored) {
+            if (can_stop && !stop_search.load()) {
+                if (cancel && cancel->load()) stop_search = true;
+                else if (stop && stop->load()) stop_reason = "request";
+                else if (opt.node_limit > 0 && nodes >= opt.node_limit) stop_reason = "nodes";
+                else if (opt.time_limit > 0 && elapsed_ms() >= opt.time_limit * 1000) stop_reason = "time";
+                if (stop_reason) stop_search = true;
+            }
+            if (!opt.progress) return;
+            auto now = std::chrono::steady_clock::now();
+            if (now - last_progress < std::chrono::milliseconds(PROGRESS_INTERVAL_MS)) return;
+            last_progress = now;
+            std::ostringstream line;
+            line << "PROGRESS {\"nodes\":" << nodes << ",\"solutions\":" << count
+                 << ",\"explored\":" << std::min(1.0, explored) << ",\"elapsed_ms\":" << elapsed_ms() << '}';
+            emit_record(opt, line.str());
+        };
+    }
+
+    // A plain count can also come from the row sweep (see RowProfileCounter). auto tries it
+    // only after a search of AUTO_SEARCH_NODES nodes did not finish, and searches again (with
+    // the transposition table already filled) when the sweep gives up as well. A STOP request
+    // (server mode) ends any of them like a search budget, keeping the count so far.
+    bool counted = false;
+    bool row_count = plain_count && !orbits;
+    bool auto_rows = row_count && opt.count_method == CountMethod::AUTO && limit < 0;
+    if (auto_rows) {
+        std::atomic<bool> search_budget{ false };
+        solver.set_cancel_flag(&search_budget);
+        solver.tick = [&]() {
+            if (on_tick) on_tick(solver.stats.nodes, solver.explored);
+            if (solver.stats.nodes >= AUTO_SEARCH_NODES || (cancel && cancel->load()) || stop_search.load())
+                search_budget = true;
+        };
+        counted = solver.enumerate_all([&]() { return on_found(nullptr); });
+        if (cancel && cancel->load()) return false;
+        solver.set_cancel_flag(can_stop ? &stop_search : cancel);
+        solver.tick = nullptr;
+        if (!counted && !stop_reason) {
+            count = total = 0;
+            solver.explored = 0;
+        }
+    }
+    if (!counted && !stop_reason && (auto_rows || (row_count && opt.count_method == CountMethod::ROWS))) {
+        RowProfileCounter counter(K, grid);
+        auto rows_total = counter.count(ROW_COUNT_MAX_STATES, can_stop ? &stop_search : cancel, on_tick);
+        if (cancel && cancel->load()) return false;
+        solver.stats.row_states = counter.states;
+        if (rows_total.has_value()) {
+            count = total = limit < 0 ? *rows_total : std::min(*rows_total, limit);
+            counted = true;
+        }
+        else if (opt.count_method == CountMethod::ROWS && !stop_reason) {
+            throw std::runtime_error("мĳһе״̬ " + std::to_string(ROW_COUNT_MAX_STATES)
+                                     + "ѡй̳ 64 ");
+        }
+    }
+
+    if (!counted && opt.threads > 1) {
+        enumerate_parallel(solver, opt.threads, limit, !opt.count_only || opt.unique || !heat.empty() || symmetric,
+                           can_stop ? &stop_search : cancel, on_found, on_tick);
+    }
+    else if (!counted) {
+        if (on_tick) solver.tick = [&]() { on_tick(solver.stats.nodes, solver.explored); };
+        solver.enumerate_all([&]() { return on_found(nullptr); });
+    }
+    if (cancel && cancel->load()) return false;
+
+    if (opt.stats) emit_record(opt, "STATS " + solver.stats.to_json(total, elapsed_ms(), opt.threads));
+
+    if (stop_reason) {
+        std::cout << "Stopped: " << stop_reason << '\n';
+        print_partial_report(deduced, heat, n, total);
+    }
+
+    bool limited = !opt.unique && limit > 0 && count >= limit;
+
+    if (opt.binary) {
+        if (!opt.stream) {
+            write_binary_header(n, K, (uint64_t)count);
+            for (size_t idx = 0; idx < solutions.count; ++idx) write_binary_board(solutions.at(idx), n);
+        }
+        write_binary_trailer((uint64_t)count, limited);
+        std::cout.flush();
+        return true;
+    }
+
+    if (opt.stream || opt.count_only || opt.heatmap) {
+        if (opt.heatmap && count > 0) print_heatmap(heat, n, count);
+        if (opt.unique) print_unique_report(first, second, n, count);
+        if (limited) std::cout << "Stopped: limit" << '\n';
+        if (orbits && count > 0) std::cout << "Orbits: " << count << '\n';
+        if (count == 0) std::cout << "No solution" << std::endl;
+        else std::cout << "Solutions: " << total << std::endl;
+        return true;
+    }
+
+    if (solutions.count == 0) {
+        std::cout << "No solution" << '\n';
+        if (opt.unique) print_unique_report(first, second, n, count);
+        std::cout << std::flush;
+        return true;
+    }
+
+    std::cout << "Solutions: " << total << '\n';
+    if (orbits) std::cout << "Orbits: " << solutions.count << '\n';
+    for (size_t idx = 0; idx < solutions.count; ++idx) {
+        if (orbits) std::cout << "Orbit: " << orbit_sizes[idx] << '\n';
+        print_board(solutions.at(idx), n);
+        if (idx + 1 < solutions.count) std::cout << '\n';
+    }
+    if (opt.unique || limited) std::cout << '\n';
+    if (opt.unique) print_unique_report(first, second, n, count);
+    if (limited) std::cout << "Stopped: limit" << '\n';
+    std::cout << std::flush;
+    return true;
+}
+
+// Server mode (--server): stay alive and answer framed requests read from stdin.
+//   request:  SOLVE <id> <line_count> [flags...]   followed by <line_count> lines of engine input
+//             CANCEL <id>                          cancel a queued or running job
+//             STOP <id>                            end the job's search early but answer it, with
+//                                                  "Stopped: request" and the partial report
+//             QUIT                                 exit after the queued jobs
+//   response: BEGIN <id>, the --stream output of the job (or "ERROR <message>"),
+//             then END <id> ok|cancelled|error
+struct ServerJob {
+    std::string id;
+    std::string text;
+    std::vector<std::string> args;
+    std::string error;
+    std::atomic<bool> cancel{ false };
+    std::atomic<bool> stop{ false };
+};
+
+int run_server() {
+    // std::cin is tied to std::cout: untie it so the reader thread never flushes
+    // std::cout while the main thread is writing a response
+    std::cin.tie(nullptr);
+
+    std::mutex mu;
+    std::condition_variable cv;
+    std::deque<std::shared_ptr<ServerJob>> pending;
+    std::shared_ptr<ServerJob> current;
+    bool closing = false;
+
+    std::thread reader([&]() {
+        std::string line;
+        while (std::getline(std::cin, line)) {
+            if (!line.empty() && line.back() == '\r') line.pop_back();
+            std::istringstream hdr(line);
+            std::string cmd;
+            hdr >> cmd;
+            if (cmd == "SOLVE") {
+                auto job = std::make_shared<ServerJob>();
+                int count = -1;
+                hdr >> job->id >> count;
+                std::string tok;
+                while (hdr >> tok) job->args.push_back(tok);
+                if (job->id.empty() || count < 0) {
+                    job->error = "ͷʽ: " + line;
+                    count = 0;
+                }
+                for (int i = 0; i < count && std::getline(std::cin, line); ++i) {
+                    job->text += line;
+                    job->text += '\n';
+                }
+                std::lock_guard<std::mutex> lk(mu);
+                pending.push_back(job);
+                cv.notify_one();
+            }
+            else if (cmd == "CANCEL") {
+                std::string id;
+                hdr >> id;
+                std::lock_guard<std::mutex> lk(mu);
+                if (current && current->id == id) current->cancel = true;
+                for (auto& job : pending)
+                    if (job->id == id) job->cancel = true;
+            }
+            else if (cmd == "STOP") {
+                std::string id;
+                hdr >> id;
+                std::lock_guard<std::mutex> lk(mu);
+                if (current && current->id == id) current->stop = true;
+                for (auto& job : pending)
+                    if (job->id == id) job->stop = true;
+            }
+            else if (cmd == "QUIT") {
+                break;
+            }
+        }
+        std::lock_guard<std::mutex> lk(mu);
+        closing = true;
+        cv.notify_one();
+    });
+
+    while (true) {
+        std::shared_ptr<ServerJob> job;
+        {
+            std::unique_lock<std::mutex> lk(mu);
+            cv.wait(lk, [&]() { return !pending.empty() || closing; });
+            if (pending.empty()) break;
+            job = pending.front();
+            pending.pop_front();
+            current = job;
+        }
+
+        std::cout << "BEGIN " << job->id << '\n';
+        std::string status = "ok";
+        if (job->cancel) {
+            status = "cancelled";
+        }
+        else if (!job->error.empty()) {
+            std::cout << "ERROR " << job->error << '\n';
+            status = "error";
+        }
+        else {
+            try {
+                SolveOptions opt = parse_options(job->args);
+                if (opt.binary) throw std::runtime_error("--binary  --server ģʽ");
+                opt.stream = true;
+                opt.records_to_stdout = true;
+                std::istringstream in(job->text);
+                if (!run_job(in, opt, &job->cancel, &job->stop)) status = "cancelled";
+            }
+            catch (const std::exception& e) {
+                std::cout << "ERROR " << e.what() << '\n';
+                status = "error";
+            }
+        }
+        std::cout << "END " << job->id << ' ' << status << std::endl;
+
+        std::lock_guard<std::mutex> lk(mu);
+        current.reset();
+    }
+
+    reader.join();
+    return 0;
+}
+
+// Shared-library interface with a C ABI, used from Python through ctypes (BattleShipsNative.py).
+// Build with -DBATTLESHIPS_LIBRARY -shared -fPIC (BattleShipsBuild.py --library); main() is then
+// left out.
+//   bs_create(K, n, matrix)   solver for the (n+1)x(n+1) engine input matrix, row-major (the
+//                             numbers of the engine input after K); NULL on invalid input
+//   bs_solve(h, limit, fn, user)
+//                             enumerate up to `limit` solutions (-1: all) in the order of the
+//                             command line engine; fn(board, user) gets each one as a PackedBoard
+//                             in the byte layout of --binary records (ceil(n*n/8) bytes, valid
+//                             only during the call) and returns 0 to stop
+//   bs_solve_into(h, out, capacity)
+//                             the first `capacity` solutions written one after another into `out`
+//                             (which holds `capacity` boards; a negative capacity is BS_ERROR)
+//   bs_count(h, limit)        number of solutions (at most `limit`, -1: no limit), like --count-only
+//                             with --count-method auto
+//   bs_cancel(h)              safe from any thread: the running call on h returns BS_CANCELLED
+//                             (a cancel between calls cancels the next call)
+//   bs_last_error()           message of the last BS_ERROR / NULL handle on this thread
+// The solve and count functions return the number of solutions, BS_ERROR or BS_CANCELLED.
+// One handle runs one call at a time; separate handles can be used from separate threads.
+#if defined(_WIN32)
+#define BS_API extern "C" __declspec(dllexport)
+#else
+#define BS_API extern "C" __attribute__((visibility("default")))
+#endif
+
+const long long BS_ERROR = -1;
+const long long BS_CANCELLED = -2;
+
+typedef int (*bs_solution_fn)(const unsigned char* board, void* user);
+
+struct bs_solver {
+    int K;
+    std::vector<std::vector<int>> grid;
+    BattleshipDirectionalSolver solver;
+    std::atomic<bool> cancel{ false };
+
+    bs_solver(int K, std::vector<std::vector<int>> g) : K(K), grid(std::move(g)), solver(K, grid) {
+        solver.set_cancel_flag(&cancel);
+    }
+};
+
+thread_local std::string bs_error;
+
+// Runs one call on h: exceptions become BS_ERROR, a cancel during the call BS_CANCELLED
+template <class F>
+long long bs_guard(bs_solver* h, F&& body) {
+    long long result;
+    h->solver.stats = SearchStats();
+    try {
+        result = body();
+    }
+    catch (const std::exception& e) {
+        bs_error = e.what();
+        result = BS_ERROR;
+    }
+    h->solver.explored = 0;
+    h->solver.tick = nullptr;
+    if (h->cancel.exchange(false) && result != BS_ERROR) result = BS_CANCELLED;
+    return result;
+}
+
+BS_API bs_solver* bs_create(int K, int n, const int* matrix) {
+    try {
+        if (n < 1) throw std::runtime_error("̴СΪ");
+        std::vector<std::vector<int>> grid(n + 1, std::vector<int>(n + 1));
+        for (int r = 0; r <= n; ++r)
+            for (int c = 0; c <= n; ++c) grid[r][c] = matrix[r * (n + 1) + c];
+        if (grid[0][0] != -1) throw std::runtime_error("Ͻ(0,0)ӦΪ-1");
+        return new bs_solver(K, std::move(grid));
+    }
+    catch (const std::exception& e) {
+        bs_error = e.what();
+        return nullptr;
+    }
+}
+
+BS_API void bs_free(bs_solver* h) { delete h; }
+
+BS_API int bs_size(const bs_solver* h) { return h->solver.getN(); }
+
+BS_API const char* bs_last_error() { return bs_error.c_str(); }
+
+BS_API void bs_cancel(bs_solver* h) { h->cancel = true; }
+
+BS_API long long bs_solve(bs_solver* h, long long limit, bs_solution_fn fn, void* user) {
+    return bs_guard(h, [&]() {
+        int n = h->solver.getN();
+        size_t bytes = ((size_t)n * n + 7) / 8;
+        std::vector<unsigned char> buf(bytes);
+        long long count = 0;
+        h->solver.set_memo((size_t)DEFAULT_MEMO_MB * 1024 * 1024 / sizeof(BattleshipDirectionalSolver::MemoEntry), false);
+        if (limit == 0) return count;
+        h->solver.enumerate_all([&]() {
+            PackedBoard board = h->solver.pack();
+            for (size_t j = 0; j < bytes; ++j) buf[j] = (unsigned char)(board[j >> 3] >> ((j & 7) * 8));
+            ++count;
+            bool cont = fn(buf.data(), user) != 0;
+            return cont && (limit < 0 || count < limit);
+        });
+        return count;
+    });
+}
+
+BS_API long long bs_solve_into(bs_solver* h, unsigned char* out, long long capacity) {
+    if (capacity < 0) {
+        bs_error = "bs_solve_into  capacity Ϊ";
+        return BS_ERROR;
+    }
+    int n = h->solver.getN();
+    size_t bytes = ((size_t)n * n + 7) / 8;
+    struct Cursor { unsigned char* p; size_t bytes; } cur{ out, bytes };
+    return bs_solve(h, capacity, [](const unsigned char* board, void* user) {
+        auto* c = static_cast<Cursor*>(user);
+        std::memcpy(c->p, board, c->bytes);
+        c->p += c->bytes;
+        return 1;
+    }, &cur);
+}
+
+BS_API long long bs_count(bs_solver* h, long long limit) {
+    return bs_guard(h, [&]() {
+        auto& solver = h->solver;
+        long long count = 0;
+        auto on_solution = [&]() {
+            ++count;
+            return limit < 0 || count < limit;
+        };
+        solver.set_memo((size_t)DEFAULT_MEMO_MB * 1024 * 1024 / sizeof(BattleshipDirectionalSolver::MemoEntry), true);
+        if (limit == 0) return count;
+        // Same plan as --count-method auto (see run_job)
+        if (limit < 0) {
+            std::atomic<bool> budget{ false };
+            solver.set_cancel_flag(&budget);
+            solver.tick = [&]() {
+                if (solver.stats.nodes >= AUTO_SEARCH_NODES || h->cancel.load()) budget = true;
+            };
+            bool finished = solver.enumerate_all(on_solution);
+            solver.set_cancel_flag(&h->cancel);
+            solver.tick = nullptr;
+            if (finished || h->cancel.load()) return count;
+            count = 0;
+            solver.explored = 0;
+            RowProfileCounter counter(h->K, h->grid);
+            auto total = counter.count(ROW_COUNT_MAX_STATES, &h->cancel, nullptr);
+            if (total.has_value()) return *total;
+            if (h->cancel.load()) return count;
+        }
+        solver.enumerate_all(on_solution);
+        return count;
+    });
+}
+
+#ifndef BATTLESHIPS_LIBRARY
+int main(int argc, char* argv[]) {
+    std::ios::sync_with_stdio(false);
+
+    // Flags: see SolveOptions; --server: persistent mode, see run_server().
+    std::vector<std::string> args(argv + 1, argv + argc);
+    if (std::find(args.begin(), args.end(), "--server") != args.end()) {
+        return run_server();
+    }
+
+    SolveOptions opt;
+    try {
+        opt = parse_options(args);
+    }
+    catch (const std::exception& e) {
+        std::cerr << e.what() << std::endl;
+        return 2;
+    }
+#if defined(_WIN32)
+    // --binary: no CRLF translation on stdout
+    if (opt.binary) _setmode(_fileno(stdout), _O_BINARY);
+#endif
+
+    try {
+        run_job(std::cin, opt, nullptr);
     }
     catch (const std::exception& e) {
         std::cerr << "/: " << e.what() << std::endl;
         return 1;
     }
     return 0;
-}
\ No newline at end of file
+}
+#endif
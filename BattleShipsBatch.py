@@ -0,0 +1,235 @@
+"""
+无界面批量求解：读取目录或多谜题文件，用常驻引擎进程池并行求解，结果以 JSON Lines 流式输出。
+
+用法示例：
+    python BattleShipsBatch.py puzzles/ --solver ./battleship_solver --jobs 8 --timeout 60 -o results.jsonl --resume
+
+每行结果：{"id", "status", "solutions", "digest", "wall_time", ...}（--unique 时另有 "unique"）
+    status：ok / timeout / error / crashed
+    digest：所有解文本的 sha256（解顺序由引擎决定，结果稳定）
+    cached：结果取自 --cache 指定的缓存目录时为 true
+    heatmap：--heatmap 时每格为舰体的解数（n×n）
+    stopped、deduced、agreed：--time-limit 用完而搜索未完成时的原因与部分结果（见 SolutionStreamParser）
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from BattleShipsEngine import (EnginePool, PuzzleModel, SolutionCache, SolutionStreamParser, default_solver_name,
+                               split_engine_inputs)
+
+# 结果为以下状态时，--resume 不再重新求解
+FINAL_STATUSES = ("ok", "timeout", "error")
+
+
+def collect_puzzles(paths):
+    """
+    展开输入路径（目录中的 *.txt 按文件名排序），返回 [(puzzle_id, engine_text 或 None, error)]。
+    单谜题文件的 id 为文件名（不含扩展名），多谜题文件为 "文件名#序号"。
+    """
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            for name in sorted(os.listdir(p)):
+                if name.lower().endswith(".txt"):
+                    files.append(os.path.join(p, name))
+        else:
+            files.append(p)
+
+    puzzles = []
+    for path in files:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                chunks = split_engine_inputs(f.read())
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            puzzles.append((stem, None, str(e)))
+            continue
+        if len(chunks) == 1:
+            puzzles.append((stem, chunks[0], None))
+        else:
+            for i, chunk in enumerate(chunks, 1):
+                puzzles.append((f"{stem}#{i}", chunk, None))
+    return puzzles
+
+
+def load_checkpoint(path):
+    # 已有结果文件中处于最终状态的谜题 id
+    done = set()
+    if not path or not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for ln in f:
+            try:
+                rec = json.loads(ln)
+            except ValueError:
+                continue  # 上次中断时可能留下半行
+            if rec.get("status") in FINAL_STATUSES:
+                done.add(rec.get("id"))
+    return done
+
+
+def solve_one(pool, puzzle_id, text, timeout=None, keep_solutions=False, engine_args=()):
+    """求解单个谜题，返回结果字典"""
+    try:
+        n = PuzzleModel.parse_engine_input_text(text)[1]
+    except ValueError as e:
+        return {"id": puzzle_id, "status": "error", "error": str(e), "solutions": 0, "wall_time": 0.0}
+
+    parser = SolutionStreamParser(n)
+    digest = hashlib.sha256()
+    count = [0]
+    sols = []
+
+    def on_line(line):
+        sol = parser.feed(line)
+        if sol is not None:
+            rows = ["".join(str(v) for v in row) for row in sol]
+            digest.update(("\n".join(rows) + "\n\n").encode("ascii"))
+            count[0] += 1
+            if keep_solutions:
+                sols.append(rows)
+
+    job = pool.create_job(text, args=engine_args, on_line=on_line)
+    timer = None
+    if timeout:
+        timer = threading.Timer(timeout, job.cancel)
+        timer.daemon = True
+        timer.start()
+    t0 = time.perf_counter()
+    try:
+        status = pool.run(job)
+    finally:
+        if timer is not None:
+            timer.cancel()
+    wall = time.perf_counter() - t0
+
+    if status == "cancelled":
+        status = "timeout"
+    rec = {
+        "id": puzzle_id,
+        "status": status,
+        # 仅计数模式下没有盘面，以引擎报告的总数为准
+        "solutions": parser.total if parser.total is not None else count[0],
+        "digest": digest.hexdigest(),
+        "wall_time": round(wall, 6),
+    }
+    if parser.unique is not None:
+        rec["unique"] = parser.unique
+    if parser.limited:
+        rec["limited"] = True
+    if parser.heatmap is not None:
+        rec["heatmap"] = parser.heatmap
+    if parser.stopped:
+        rec["stopped"] = parser.stopped
+        rec["deduced"] = parser.deduced
+        rec["agreed"] = parser.agreed
+    if job.cached:
+        rec["cached"] = True
+    if job.error:
+        rec["error"] = job.error
+    if keep_solutions:
+        rec["solution_list"] = sols
+    return rec
+
+
+def run_batch(puzzles, solver, jobs, out, timeout=None, keep_solutions=False, skip=(), engine_args=(), cache=None):
+    """并行求解并逐行写出结果，返回 (完成数, 失败数)"""
+    pending = [(pid, text, err) for pid, text, err in puzzles if pid not in skip]
+    finished = 0
+    failed = 0
+    write_lock = threading.Lock()
+
+    def emit(rec):
+        with write_lock:
+            out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            out.flush()
+
+    pool = EnginePool(solver, size=jobs, cache=cache)
+    try:
+        with ThreadPoolExecutor(max_workers=pool.size) as ex:
+            futures = []
+            for pid, text, err in pending:
+                if text is None:
+                    emit({"id": pid, "status": "error", "error": err, "solutions": 0, "wall_time": 0.0})
+                    failed += 1
+                    continue
+                futures.append(ex.submit(solve_one, pool, pid, text, timeout, keep_solutions, engine_args))
+            for fut in as_completed(futures):
+                rec = fut.result()
+                emit(rec)
+                finished += 1
+                if rec["status"] not in ("ok", "timeout"):
+                    failed += 1
+    finally:
+        pool.close()
+    return finished, failed
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="战舰谜题批量求解（无界面）")
+    ap.add_argument("inputs", nargs="+", help="谜题目录（读取其中 *.txt）或包含一个/多个谜题的文件")
+    ap.add_argument("--solver", default=default_solver_name(), help="引擎可执行文件路径")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="并行引擎进程数（默认 CPU 核数）")
+    ap.add_argument("--timeout", type=float, default=None, help="单个谜题的超时秒数")
+    ap.add_argument("--time-limit", type=float, default=None,
+                    help="引擎搜索时限（秒）：到时停止搜索，结果中给出已确定的格子（与 --timeout 不同，不丢弃结果）")
+    ap.add_argument("-o", "--output", default=None, help="结果 JSON Lines 文件（默认输出到 stdout）")
+    ap.add_argument("--resume", action="store_true", help="跳过输出文件中已完成的谜题，并追加写入")
+    ap.add_argument("--solutions", action="store_true", help="在结果中附带全部解（默认只输出 digest）")
+    ap.add_argument("--cache", metavar="DIR", default=None, help="引擎输出缓存目录：已求解过的谜题直接取缓存结果")
+    mode = ap.add_mutually_exclusive_group()
+    mode.add_argument("--limit", type=int, default=None, help="每个谜题最多求 N 个解")
+    mode.add_argument("--count-only", action="store_true", help="只统计解的数量")
+    mode.add_argument("--unique", action="store_true", help="唯一性检查（找到第二个解即停止）")
+    mode.add_argument("--heatmap", action="store_true", help="统计每格为舰体的解数，不输出盘面")
+    args = ap.parse_args(argv)
+
+    engine_args = []
+    if args.limit:
+        engine_args += ["--limit", str(args.limit)]
+    if args.count_only:
+        engine_args.append("--count-only")
+    if args.unique:
+        engine_args.append("--unique")
+    if args.heatmap:
+        engine_args.append("--heatmap")
+    if args.time_limit:
+        engine_args += ["--time-limit", str(args.time_limit)]
+
+    if not os.path.exists(args.solver):
+        print(f"未找到引擎可执行文件：{args.solver}", file=sys.stderr)
+        return 2
+    if args.resume and not args.output:
+        print("--resume 需要同时指定 --output", file=sys.stderr)
+        return 2
+
+    puzzles = collect_puzzles(args.inputs)
+    skip = load_checkpoint(args.output) if args.resume else set()
+    skipped = sum(1 for pid, _, _ in puzzles if pid in skip)
+
+    cache = SolutionCache(args.cache) if args.cache else None
+
+    t0 = time.perf_counter()
+    if args.output:
+        mode = "a" if args.resume else "w"
+        with open(args.output, mode, encoding="utf-8") as out:
+            finished, failed = run_batch(puzzles, args.solver, args.jobs, out, args.timeout, args.solutions, skip,
+                                         engine_args, cache)
+    else:
+        finished, failed = run_batch(puzzles, args.solver, args.jobs, sys.stdout, args.timeout, args.solutions, skip,
+                                     engine_args, cache)
+    print(f"完成 {finished} 个谜题（跳过 {skipped} 个，失败 {failed} 个），用时 {time.perf_counter() - t0:.2f} 秒",
+          file=sys.stderr)
+    if cache is not None:
+        print(f"缓存命中 {cache.hits} 次，未命中 {cache.misses} 次，命中率 {cache.hit_rate:.0%}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+"""
+引擎基准测试：在谜题语料上运行编译好的引擎，记录耗时、峰值内存与解的数量（JSON），并比较两个引擎。
+
+用法示例：
+    python BattleShipsGen.py -o corpus/ --count 2 --seed 1
+    python BattleShipsBench.py run corpus/ --solver ./battleship_solver --repeat 3 -o base.json
+    python BattleShipsBench.py compare base.json ./battleship_solver_new corpus/   # 结果文件或引擎可执行文件均可
+    python BattleShipsBench.py run --solver ./battleship_solver                    # 未给语料时使用默认生成的语料
+
+compare 在新引擎比基准慢 --threshold（比例）且超过 --min-delta 秒时标记为性能回退，解的数量不同时标记为错误；
+存在任一情况时以退出码 1 结束。
+"""
+import os
+import sys
+import json
+import time
+import shlex
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+
+try:
+    import resource  # 仅 POSIX：与 os.wait4 一起用于统计峰值内存
+except ImportError:
+    resource = None
+
+from BattleShipsBatch import collect_puzzles
+from BattleShipsEngine import PuzzleModel, default_solver_name
+from BattleShipsGen import generate_corpus
+
+# 默认语料：未指定语料时由 BattleShipsGen 按固定种子生成
+DEFAULT_CORPUS_SEED = 0
+
+
+def engine_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _solution_count(out_path):
+    # 只读输出末尾：结尾行为 "Solutions: N" 或 "No solution"
+    with open(out_path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 4096))
+        tail = f.read().decode("utf-8", errors="replace")
+    for line in reversed(tail.splitlines()):
+        if line.startswith("Solutions:"):
+            try:
+                return int(line.split(":", 1)[1])
+            except ValueError:
+                return None
+        if "No solution" in line:
+            return 0
+    # 非流式输出时 "Solutions: N" 在开头
+    with open(out_path, "r", encoding="utf-8", errors="replace") as f:
+        head = f.readline()
+    if head.startswith("Solutions:"):
+        try:
+            return int(head.split(":", 1)[1])
+        except ValueError:
+            return None
+    return None
+
+
+def _watch_hwm(pid, peak, stop):
+    # Linux：轮询 /proc/<pid>/status 的 VmHWM（exec 之后该进程自己的峰值常驻内存，KB）
+    path = f"/proc/{pid}/status"
+    while not stop.is_set():
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        peak[0] = max(peak[0] or 0, int(line.split()[1]))
+                        break
+        except (OSError, ValueError):
+            return
+        stop.wait(0.005)
+
+
+def run_engine_once(solver, text, args=(), timeout=None):
+    """
+    运行一次引擎，返回 {"status", "wall_time", "peak_rss_kb", "solutions"}；超时的进程被强制结束，status 为 timeout。
+    峰值内存：os.wait4 的 ru_maxrss 包含 fork 时继承的本进程内存，只有超过本进程的峰值时才可信；
+    否则在 Linux 上改用轮询得到的 VmHWM。两者都不可用的平台上为 None。
+    """
+    with tempfile.TemporaryFile() as fin, tempfile.NamedTemporaryFile(delete=False) as fout:
+        fin.write(text.encode("utf-8"))
+        fin.seek(0)
+        out_path = fout.name
+        t0 = time.perf_counter()
+        proc = subprocess.Popen([solver] + list(args), stdin=fin, stdout=fout, stderr=subprocess.DEVNULL)
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            proc.kill()
+
+        timer = threading.Timer(timeout, kill) if timeout else None
+        if timer is not None:
+            timer.daemon = True
+            timer.start()
+        hwm = [None]
+        stop = threading.Event()
+        if sys.platform.startswith("linux"):
+            threading.Thread(target=_watch_hwm, args=(proc.pid, hwm, stop), daemon=True).start()
+        rss = None
+        try:
+            if hasattr(os, "wait4") and resource is not None:
+                _, status, usage = os.wait4(proc.pid, 0)
+                proc.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, "waitstatus_to_exitcode") else status
+                # Linux 上单位为 KB，macOS 上为字节
+                scale = 1024 if sys.platform == "darwin" else 1
+                rss = usage.ru_maxrss // scale
+                if rss <= resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale and hwm[0] is not None:
+                    rss = hwm[0]
+            else:
+                proc.wait()
+        finally:
+            stop.set()
+            if timer is not None:
+                timer.cancel()
+        wall = time.perf_counter() - t0
+    try:
+        if timed_out.is_set():
+            status, solutions = "timeout", None
+        elif proc.returncode != 0:
+            status, solutions = "error", None
+        else:
+            status, solutions = "ok", _solution_count(out_path)
+    finally:
+        os.remove(out_path)
+    return {"status": status, "wall_time": round(wall, 6), "peak_rss_kb": rss, "solutions": solutions}
+
+
+def run_benchmark(solver, puzzles, args=(), repeat=1, timeout=None, log=None):
+    """
+    在 [(puzzle_id, 引擎输入文本)] 上运行引擎，每个谜题重复 repeat 次取最短耗时，返回结果字典（可直接写成 JSON）。
+    超时或出错的谜题不再重复。
+    """
+    results = []
+    for pid, text in puzzles:
+        K, n = PuzzleModel.parse_engine_input_text(text)[:2]
+        best = None
+        for _ in range(max(1, repeat)):
+            rec = run_engine_once(solver, text, args, timeout)
+            if best is None or (rec["status"] == "ok" and rec["wall_time"] < best["wall_time"]):
+                best = rec
+            if rec["status"] != "ok":
+                break
+        best = dict(id=pid, n=n, K=K, **best)
+        results.append(best)
+        if log is not None:
+            log(f"{pid:<24} {best['status']:<8} {best['wall_time']:9.3f}s  {best['peak_rss_kb'] or '-':>8} KB  "
+                f"解 {best['solutions'] if best['solutions'] is not None else '-'}")
+    return {
+        "engine": os.path.abspath(solver),
+        "engine_sha256": engine_digest(solver),
+        "args": list(args),
+        "repeat": repeat,
+        "timeout": timeout,
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "cpu_count": os.cpu_count()},
+        "results": results,
+    }
+
+
+def compare_results(base, new, threshold=0.10, min_delta=0.05):
+    """
+    逐个谜题比较两份 run_benchmark 的结果，返回 [(puzzle_id, 基准耗时, 新耗时, 判定)]。
+    判定：ok / faster / regression（变慢超过阈值）/ mismatch（解的数量不同）/ status（状态变化，如新引擎超时）/ missing
+    """
+    new_by_id = {r["id"]: r for r in new["results"]}
+    rows = []
+    for b in base["results"]:
+        n = new_by_id.get(b["id"])
+        if n is None:
+            rows.append((b["id"], b["wall_time"], None, "missing"))
+            continue
+        if b["status"] != n["status"]:
+            verdict = "status"
+        elif b["status"] == "ok" and b["solutions"] != n["solutions"]:
+            verdict = "mismatch"
+        elif n["wall_time"] > b["wall_time"] * (1 + threshold) and n["wall_time"] - b["wall_time"] > min_delta:
+            verdict = "regression"
+        elif b["wall_time"] > n["wall_time"] * (1 + threshold) and b["wall_time"] - n["wall_time"] > min_delta:
+            verdict = "faster"
+        else:
+            verdict = "ok"
+        rows.append((b["id"], b["wall_time"], n["wall_time"], verdict))
+    return rows
+
+
+def load_corpus(paths, seed=DEFAULT_CORPUS_SEED):
+    """语料：给定的目录/文件（同 BattleShipsBatch），未给出时按默认参数生成"""
+    if not paths:
+        return generate_corpus(seed=seed)[0]
+    puzzles = []
+    for pid, text, err in collect_puzzles(paths):
+        if text is None:
+            print(f"跳过 {pid}：{err}", file=sys.stderr)
+        else:
+            puzzles.append((pid, text))
+    return puzzles
+
+
+def _results_or_run(target, corpus, args):
+    # compare 的参数既可以是已有的结果文件，也可以是引擎可执行文件
+    if target.lower().endswith(".json"):
+        with open(target, "r", encoding="utf-8") as f:
+            return json.load(f)
+    print(f"== {target}", file=sys.stderr)
+    return run_benchmark(target, corpus(), args.engine_args, args.repeat, args.timeout,
+                         log=lambda s: print(s, file=sys.stderr))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="战舰引擎基准测试")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    def common(p):
+        p.add_argument("--repeat", type=int, default=1, help="每个谜题重复次数（取最短耗时）")
+        p.add_argument("--timeout", type=float, default=60.0, help="单次运行的超时秒数")
+        p.add_argument("--engine-args", type=shlex.split, default=[], help='传给引擎的参数，如 "--count-only"')
+        p.add_argument("--seed", type=int, default=DEFAULT_CORPUS_SEED, help="未给语料时生成默认语料的种子")
+
+    p_run = sub.add_parser("run", help="运行一个引擎并输出 JSON 结果")
+    p_run.add_argument("corpus", nargs="*", help="谜题目录或文件（默认：生成的默认语料）")
+    p_run.add_argument("--solver", default=default_solver_name(), help="引擎可执行文件路径")
+    p_run.add_argument("-o", "--output", default=None, help="结果 JSON 文件（默认输出到 stdout）")
+    common(p_run)
+
+    p_cmp = sub.add_parser("compare", help="比较两个引擎（或两份结果文件）并标记性能回退")
+    p_cmp.add_argument("base", help="基准：结果 JSON 或引擎可执行文件")
+    p_cmp.add_argument("new", help="新版本：结果 JSON 或引擎可执行文件")
+    p_cmp.add_argument("corpus", nargs="*", help="运行引擎时使用的谜题目录或文件（默认：生成的默认语料）")
+    p_cmp.add_argument("--threshold", type=float, default=0.10, help="判定为回退的相对变慢比例")
+    p_cmp.add_argument("--min-delta", type=float, default=0.05, help="判定为回退的最小变慢秒数")
+    common(p_cmp)
+
+    args = ap.parse_args(argv)
+
+    cached = []
+
+    def corpus():
+        if not cached:
+            cached.append(load_corpus(args.corpus, args.seed))
+        return cached[0]
+
+    if args.command == "run":
+        if not os.path.exists(args.solver):
+            print(f"未找到引擎可执行文件：{args.solver}", file=sys.stderr)
+            return 2
+        res = run_benchmark(args.solver, corpus(), args.engine_args, args.repeat, args.timeout,
+                            log=lambda s: print(s, file=sys.stderr))
+        text = json.dumps(res, ensure_ascii=False, indent=1)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+        return 0
+
+    for target in (args.base, args.new):
+        if not os.path.exists(target):
+            print(f"未找到：{target}", file=sys.stderr)
+            return 2
+    base = _results_or_run(args.base, corpus, args)
+    new = _results_or_run(args.new, corpus, args)
+    rows = compare_results(base, new, args.threshold, args.min_delta)
+    bad = 0
+    for pid, tb, tn, verdict in rows:
+        flag = "" if verdict in ("ok", "faster") else "  <==="
+        bad += bool(flag)
+        ratio = f"{tb / tn:6.2f}x" if tn and tb else "     -"
+        tn_text = f"{tn:9.3f}s" if tn is not None else "        -"
+        print(f"{pid:<24} {tb:9.3f}s {tn_text} {ratio}  {verdict}{flag}")
+    tb_sum = sum(r[1] for r in rows)
+    tn_sum = sum(r[2] or 0 for r in rows)
+    print(f"合计：基准 {tb_sum:.3f}s，新版本 {tn_sum:.3f}s；{bad} 个谜题需要关注", file=sys.stderr)
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
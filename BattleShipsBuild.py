@@ -0,0 +1,345 @@
+"""
+引擎构建管理：编译 BattleShips.cpp 的多个优化变体，按（源码、编译器、参数）的哈希缓存，源码不变时不再重新编译；
+用内置的小型基准在本机测速，选出最快的变体并记录在缓存目录的 manifest.json 中，界面启动时据此自动找到引擎。
+
+用法示例：
+    python BattleShipsBuild.py                            # 构建全部变体（已缓存的直接复用），测速并选出最快的
+    python BattleShipsBuild.py --variants O2 --no-select  # 只构建 -O2 版本
+    python BattleShipsBuild.py --list                     # 列出缓存中的引擎与当前选中的版本
+    python BattleShipsBuild.py --library                  # 构建共享库（默认 native 变体），供 BattleShipsNative.py 使用
+
+变体：
+    O2      -O2（与原先“编译引擎”按钮相同）
+    native  -O3 -march=native（只适合在本机运行）
+    pgo     -O3 -march=native 加上基于剖析的优化：先编译插桩版本，在固定种子生成的训练语料上运行，再按剖析数据重新编译
+测速使用另一组固定种子的谜题，各变体解的数量必须一致，不一致的变体不会被选中。
+共享库（--library）以 -DBATTLESHIPS_LIBRARY -shared -fPIC 编译，只导出 bs_* 接口；pgo 变体只用于可执行文件。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import subprocess
+
+from BattleShipsBench import engine_digest, run_benchmark, run_engine_once
+from BattleShipsGen import generate_corpus
+
+DEFAULT_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "BattleShips.cpp")
+DEFAULT_COMPILER = "g++"
+BASE_FLAGS = ("-std=c++17", "-pthread")
+# 变体名 -> (编译参数, 是否使用剖析优化)
+VARIANTS = {
+    "O2": (("-O2",), False),
+    "native": (("-O3", "-march=native"), False),
+    "pgo": (("-O3", "-march=native"), True),
+}
+# 剖析训练：固定种子的语料，每个谜题按几种常用输出方式各运行一次；--time-limit 保证插桩引擎正常退出并写出剖析数据
+PGO_CORPUS = dict(sizes=(8, 10, 12, 14, 16), ks=(3, 4), densities=(0.1, 0.2, 0.3), count=1, seed=0)
+PGO_RUNS = ((), ("--count-only",), ("--heatmap",))
+PGO_TIME_LIMIT = "2"
+# 选择变体时的测速语料：与训练语料种子不同，只取耗时较长的 K=4、低揭示密度谜题（当前引擎合计约 0.5 秒）
+SELECT_CORPUS = dict(sizes=(10, 12, 14), ks=(4,), densities=(0.1,), count=4, seed=1)
+SELECT_REPEAT = 3
+SELECT_TIMEOUT = 60.0
+# 共享库：同一份源码，不含 main()，只导出 bs_* 接口
+LIBRARY_FLAGS = ("-shared", "-fPIC", "-fvisibility=hidden", "-DBATTLESHIPS_LIBRARY")
+DEFAULT_LIBRARY_VARIANT = "native"
+MANIFEST_NAME = "manifest.json"
+
+
+def default_build_dir():
+    return os.path.join(os.path.expanduser("~"), ".battleships", "engines")
+
+
+def _exe_suffix():
+    return ".exe" if os.name == "nt" else ""
+
+
+def _library_name(stem):
+    if os.name == "nt":
+        return stem + ".dll"
+    if sys.platform == "darwin":
+        return f"lib{stem}.dylib"
+    return f"lib{stem}.so"
+
+
+class EngineBuilder:
+    """
+    在缓存目录中构建与选择引擎。每个构建由键（源码、编译器版本、参数与训练方式的 sha256）命名，
+    文件存在即视为已构建；manifest.json 记录每个构建的参数以及每份源码选中的变体。
+    """
+
+    def __init__(self, source=DEFAULT_SOURCE, cache_dir=None, compiler=DEFAULT_COMPILER, log=None):
+        self.source = os.path.abspath(source)
+        self.cache_dir = cache_dir or default_build_dir()
+        self.compiler = compiler
+        self.log = log or (lambda s: None)
+        self._compiler_version = None
+
+    # ---- 键与路径 ----
+    def compiler_version(self):
+        if self._compiler_version is None:
+            try:
+                proc = subprocess.run([self.compiler, "--version"], capture_output=True, text=True)
+            except OSError as e:
+                raise RuntimeError(f"找不到编译器 {self.compiler}：{e}")
+            lines = proc.stdout.splitlines()
+            self._compiler_version = lines[0].strip() if lines else ""
+        return self._compiler_version
+
+    def source_digest(self):
+        return engine_digest(self.source)
+
+    def _flags(self, variant, library):
+        flags, pgo = VARIANTS[variant]
+        if library and pgo:
+            raise ValueError(f"{variant} 变体只能构建可执行文件")
+        return BASE_FLAGS + flags + (LIBRARY_FLAGS if library else ()), pgo
+
+    def build_key(self, variant, library=False):
+        flags, pgo = self._flags(variant, library)
+        h = hashlib.sha256()
+        h.update(self.source_digest().encode())
+        h.update(self.compiler_version().encode())
+        h.update(" ".join(flags).encode())
+        if pgo:
+            h.update(json.dumps([PGO_CORPUS, PGO_RUNS, PGO_TIME_LIMIT], sort_keys=True).encode())
+        return h.hexdigest()[:16]
+
+    def path_for(self, variant, library=False):
+        key = self.build_key(variant, library)
+        if library:
+            return os.path.join(self.cache_dir, _library_name(f"battleships-{variant}-{key}"))
+        return os.path.join(self.cache_dir, f"battleship_solver-{variant}-{key}{_exe_suffix()}")
+
+    # ---- manifest ----
+    def load_manifest(self):
+        return load_manifest(self.cache_dir)
+
+    def _update_manifest(self, update):
+        manifest = self.load_manifest()
+        update(manifest)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # 先写临时文件再替换，避免中断时留下半个文件
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, os.path.join(self.cache_dir, MANIFEST_NAME))
+
+    # ---- 构建 ----
+    def _compile(self, args):
+        cmd = [self.compiler] + list(args)
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"命令: {' '.join(cmd)}\n\nstderr:\n{proc.stderr}")
+
+    def build(self, variant, library=False):
+        """构建一个变体（library 时为共享库）并返回文件路径；缓存中已有时直接返回"""
+        if variant not in VARIANTS:
+            raise ValueError(f"未知的变体：{variant}（可选 {', '.join(VARIANTS)}）")
+        out = self.path_for(variant, library)
+        if os.path.exists(out):
+            self.log(f"{variant}: 使用缓存 {out}")
+            return out
+        all_flags, pgo = self._flags(variant, library)
+        flags = VARIANTS[variant][0]
+        os.makedirs(self.cache_dir, exist_ok=True)
+        t0 = time.perf_counter()
+        work = tempfile.mkdtemp(prefix="build-", dir=self.cache_dir)
+        try:
+            tmp_out = os.path.join(work, os.path.basename(out))
+            if pgo:
+                self._build_pgo(flags, work, tmp_out)
+            else:
+                self.log(f"{variant}: 编译{'共享库' if library else ''} {' '.join(flags)}")
+                self._compile(list(all_flags) + ["-o", tmp_out, self.source])
+            os.replace(tmp_out, out)
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+        seconds = round(time.perf_counter() - t0, 3)
+        self.log(f"{variant}: 完成（{seconds:.1f}s）{out}")
+        key = self.build_key(variant, library)
+        entry = {"variant": variant, "path": out, "source": self.source, "source_sha256": self.source_digest(),
+                 "compiler": self.compiler_version(), "flags": list(all_flags), "pgo": pgo, "library": library,
+                 "build_seconds": seconds, "built_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+        self._update_manifest(lambda m: m.setdefault("builds", {}).__setitem__(key, entry))
+        return out
+
+    def _build_pgo(self, flags, work, out):
+        # 编译与链接分开，使两次编译的目标文件同名：剖析数据（.gcda）按目标文件路径存放与查找
+        obj = os.path.join(work, "engine.o")
+        train = os.path.join(work, "train" + _exe_suffix())
+        common = list(BASE_FLAGS + flags)
+        self.log(f"pgo: 编译插桩版本 {' '.join(flags)}")
+        self._compile(common + ["-fprofile-generate", "-fprofile-update=atomic", "-c", "-o", obj, self.source])
+        self._compile(common + ["-fprofile-generate", "-o", train, obj])
+        puzzles = generate_corpus(**PGO_CORPUS)[0]
+        self.log(f"pgo: 在 {len(puzzles)} 个谜题上训练")
+        for pid, text in puzzles:
+            for args in PGO_RUNS:
+                rec = run_engine_once(train, text, list(args) + ["--time-limit", PGO_TIME_LIMIT])
+                if rec["status"] != "ok":
+                    raise RuntimeError(f"插桩引擎在训练谜题 {pid} 上运行失败（{rec['status']}）")
+        self.log("pgo: 按剖析数据重新编译")
+        self._compile(common + ["-fprofile-use", "-fprofile-correction", "-Wno-missing-profile",
+                                "-c", "-o", obj, self.source])
+        self._compile(common + ["-o", out, obj])
+
+    # ---- 选择 ----
+    def select(self, variants=None, puzzles=None, repeat=SELECT_REPEAT, timeout=SELECT_TIMEOUT):
+        """
+        构建给定的变体（默认全部）并在测速语料上比较，返回选中的记录 {"variant", "path", "totals", ...}，
+        同时写入 manifest。构建失败的变体（如编译器不支持 -march=native）跳过；全部失败时抛出 RuntimeError。
+        """
+        variants = list(variants or VARIANTS)
+        if puzzles is None:
+            puzzles = generate_corpus(**SELECT_CORPUS)[0]
+        built = {}
+        errors = {}
+        for v in variants:
+            try:
+                built[v] = self.build(v)
+            except RuntimeError as e:
+                errors[v] = str(e)
+                self.log(f"{v}: 构建失败，跳过\n{e}")
+        if not built:
+            raise RuntimeError("没有可用的引擎变体：\n\n" + "\n\n".join(f"[{v}] {e}" for v, e in errors.items()))
+
+        totals = {}
+        reference = None
+        for v, path in built.items():
+            res = run_benchmark(path, puzzles, repeat=repeat, timeout=timeout)
+            counts = [(r["id"], r["status"], r["solutions"]) for r in res["results"]]
+            if reference is None:
+                reference = counts
+            elif counts != reference:
+                self.log(f"{v}: 解的数量与 {next(iter(built))} 不一致，不参与选择")
+                continue
+            if any(r["status"] != "ok" for r in res["results"]):
+                self.log(f"{v}: 有谜题未正常完成，不参与选择")
+                continue
+            totals[v] = round(sum(r["wall_time"] for r in res["results"]), 6)
+            self.log(f"{v}: 测速合计 {totals[v]:.3f}s")
+        if not totals:
+            raise RuntimeError("所有变体都未通过测速")
+
+        best = min(totals, key=totals.get)
+        record = {"variant": best, "path": built[best], "key": self.build_key(best), "source": self.source,
+                  "totals": totals, "puzzles": len(puzzles), "repeat": repeat,
+                  "machine": {"platform": platform.platform(), "cpu_count": os.cpu_count()},
+                  "selected_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+        digest = self.source_digest()
+        self._update_manifest(lambda m: (m.setdefault("selected", {}).__setitem__(digest, record),
+                                         m.__setitem__("last_selected", digest)))
+        self.log(f"选中 {best}：{built[best]}")
+        return record
+
+
+def load_manifest(cache_dir=None):
+    path = os.path.join(cache_dir or default_build_dir(), MANIFEST_NAME)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def find_cached_engine(source=DEFAULT_SOURCE, cache_dir=None):
+    """
+    返回缓存中可用的引擎路径，找不到时返回 None。
+    优先取与当前源码对应的选中变体，其次取该源码的任一构建；源码不存在时取最近一次选中的引擎。
+    """
+    manifest = load_manifest(cache_dir)
+    selected = manifest.get("selected", {})
+    if os.path.exists(source):
+        digest = engine_digest(source)
+        rec = selected.get(digest)
+        if rec and os.path.exists(rec["path"]):
+            return rec["path"]
+        for entry in manifest.get("builds", {}).values():
+            if entry.get("source_sha256") == digest and not entry.get("library") and os.path.exists(entry["path"]):
+                return entry["path"]
+        return None
+    rec = selected.get(manifest.get("last_selected"))
+    if rec and os.path.exists(rec["path"]):
+        return rec["path"]
+    return None
+
+
+def find_cached_library(source=DEFAULT_SOURCE, cache_dir=None):
+    """
+    返回缓存中与当前源码对应的共享库路径（优先 DEFAULT_LIBRARY_VARIANT），找不到时返回 None；
+    源码不存在时取最近构建的共享库。
+    """
+    builds = [e for e in load_manifest(cache_dir).get("builds", {}).values()
+              if e.get("library") and os.path.exists(e["path"])]
+    if os.path.exists(source):
+        digest = engine_digest(source)
+        builds = [e for e in builds if e.get("source_sha256") == digest]
+    if not builds:
+        return None
+    builds.sort(key=lambda e: (e["variant"] == DEFAULT_LIBRARY_VARIANT, e.get("built_at", "")))
+    return builds[-1]["path"]
+
+
+def _list(cache_dir):
+    manifest = load_manifest(cache_dir)
+    builds = manifest.get("builds", {})
+    if not builds:
+        print("缓存中没有引擎", file=sys.stderr)
+        return 0
+    chosen = {rec["path"] for rec in manifest.get("selected", {}).values()}
+    for key, entry in sorted(builds.items(), key=lambda kv: kv[1].get("built_at", "")):
+        mark = "*" if entry["path"] in chosen else " "
+        exists = "" if os.path.exists(entry["path"]) else "（文件已删除）"
+        kind = "lib" if entry.get("library") else "exe"
+        print(f"{mark} {entry['variant']:<7} {kind} {entry['built_at']}  {entry['source_sha256'][:12]}  {entry['path']}{exists}")
+    return 0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="构建、缓存并选择战舰引擎")
+    ap.add_argument("source", nargs="?", default=DEFAULT_SOURCE, help="引擎源码（默认：同目录的 BattleShips.cpp）")
+    ap.add_argument("--variants", default=None,
+                    help=f"要构建的变体，逗号分隔（可选 {', '.join(VARIANTS)}；默认全部，--library 时为 "
+                         f"{DEFAULT_LIBRARY_VARIANT}）")
+    ap.add_argument("--compiler", default=DEFAULT_COMPILER, help="C++ 编译器")
+    ap.add_argument("--cache-dir", default=None, help=f"缓存目录（默认 {default_build_dir()}）")
+    ap.add_argument("--repeat", type=int, default=SELECT_REPEAT, help="测速时每个谜题的重复次数（取最短耗时）")
+    ap.add_argument("--no-select", action="store_true", help="只构建，不测速选择")
+    ap.add_argument("--library", action="store_true", help="构建共享库（BattleShipsNative.py 使用），不测速选择")
+    ap.add_argument("--list", action="store_true", help="列出缓存中的引擎（* 为选中的版本）")
+    args = ap.parse_args(argv)
+
+    if args.list:
+        return _list(args.cache_dir)
+    if not os.path.exists(args.source):
+        print(f"未找到源码：{args.source}", file=sys.stderr)
+        return 2
+    if args.variants is None:
+        args.variants = DEFAULT_LIBRARY_VARIANT if args.library else ",".join(VARIANTS)
+    variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+    for v in variants:
+        if v not in VARIANTS:
+            print(f"未知的变体：{v}（可选 {', '.join(VARIANTS)}）", file=sys.stderr)
+            return 2
+    builder = EngineBuilder(args.source, args.cache_dir, args.compiler, log=lambda s: print(s, file=sys.stderr))
+    try:
+        if args.no_select or args.library:
+            for v in variants:
+                print(builder.build(v, args.library))
+        else:
+            print(builder.select(variants, repeat=args.repeat)["path"])
+    except (RuntimeError, ValueError) as e:
+        print(f"构建失败：{e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
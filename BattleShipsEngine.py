@@ -0,0 +1,1041 @@
+"""
+不依赖 Tk 的谜题模型与引擎交互工具：PuzzleModel、引擎输出解析、常驻引擎进程（--server 模式）与进程池。
+
+协议见 BattleShips.cpp 中 run_server() 的注释：
+    请求  SOLVE <id> <行数> [参数...] + 引擎输入文本；CANCEL <id>；STOP <id>；QUIT
+    响应  BEGIN <id>，--stream 格式的输出（或 ERROR <信息>），END <id> ok|cancelled|error
+"""
+import os
+import json
+import mmap
+import zlib
+import struct
+import hashlib
+import itertools
+import threading
+import tempfile
+import subprocess
+import collections
+
+try:
+    import numpy  # 可选：解析 --binary 输出时一次取出全部记录
+except ImportError:
+    numpy = None
+
+# 右键循环值：包含 6（S 独舰），并以 -1 结束回到未知
+CYCLE_ORDER = [0, 2, 3, 4, 5, 6, -1]
+
+# 取消后等待引擎自行结束的秒数，超时则强制结束并重启该进程
+CANCEL_GRACE_SECONDS = 2.0
+# 每个引擎进程保留的 stderr 末尾字符数（用于报告崩溃原因）
+STDERR_TAIL_CHARS = 4000
+
+
+def default_solver_name():
+    if os.name == "nt":
+        return "battleship_solver.exe"
+    return "./battleship_solver"
+
+
+class PuzzleModel:
+    def __init__(self, n=10, K=4):
+        self.n = n
+        self.K = K
+        self.board = [[-1 for _ in range(n)] for __ in range(n)]  # -1/0/1/2/3/4/5/6
+        self.row_targets = [0 for _ in range(n)]
+        self.col_targets = [0 for _ in range(n)]
+
+    def resize(self, n_new):
+        old_n = self.n
+        old_board = self.board
+        old_row_t = self.row_targets
+        old_col_t = self.col_targets
+
+        # 保留左上角 lim×lim 的内容：整行切片复制，新增的格子为未知、目标为 0
+        lim = min(old_n, n_new)
+        pad = n_new - lim
+        self.n = n_new
+        self.board = [old_board[r][:lim] + [-1] * pad for r in range(lim)]
+        self.board += [[-1] * n_new for _ in range(pad)]
+        self.row_targets = list(old_row_t[:lim]) + [0] * (n_new - len(old_row_t[:lim]))
+        self.col_targets = list(old_col_t[:lim]) + [0] * (n_new - len(old_col_t[:lim]))
+
+    def toggle_left(self, r, c):
+        # 左键：未知 <-> 海水
+        if self.board[r][c] == -1:
+            self.board[r][c] = 1
+        elif self.board[r][c] == 1:
+            self.board[r][c] = -1
+
+    def cycle_right(self, r, c):
+        cur = self.board[r][c]
+        # 水(1)不在循环内，从循环首开始
+        if cur == 1:
+            nxt = CYCLE_ORDER[0]
+        else:
+            try:
+                idx = CYCLE_ORDER.index(cur)
+                nxt = CYCLE_ORDER[(idx + 1) % len(CYCLE_ORDER)]
+            except ValueError:
+                nxt = CYCLE_ORDER[0]
+        self.board[r][c] = nxt
+
+    def build_engine_matrix_lines(self):
+        """
+        生成引擎输入文本行（K在第一行，随后 (n+1)x(n+1) 矩阵）
+        内部格子允许值为：-1,0,1,2,3,4,5,6
+        """
+        lines = []
+        lines.append(str(int(self.K)))
+        # 第一行：-1, col_targets...
+        top = [-1] + [int(max(0, t)) for t in self.col_targets]
+        lines.append(" ".join(map(str, top)))
+        # 接下来 n 行：每行 row_target + n 个格子
+        for r in range(self.n):
+            row = [int(max(0, self.row_targets[r]))]
+            for c in range(self.n):
+                v = int(self.board[r][c])
+                if v not in (-1, 0, 1, 2, 3, 4, 5, 6):
+                    v = -1
+                row.append(v)
+            lines.append(" ".join(map(str, row)))
+        return lines
+
+    @staticmethod
+    def parse_solutions_from_output(text, n):
+        text = text.strip()
+        if "No solution" in text:
+            return []
+        # --symmetry orbits 的 Orbits: / Orbit: 行不属于盘面
+        lines = [ln.strip() for ln in text.splitlines() if ln.strip() != "" and not ln.strip().startswith("Orbit")]
+        sols = []
+        i = 0
+        if i < len(lines) and lines[i].startswith("Solutions:"):
+            i += 1
+        while i + n <= len(lines):
+            grid = []
+            ok = True
+            for r in range(n):
+                parts = lines[i + r].replace(",", " ").replace(";", " ").split()
+                if len(parts) != n:
+                    ok = False
+                    break
+                try:
+                    row = [int(x) for x in parts]
+                except:
+                    ok = False
+                    break
+                grid.append(row)
+            if ok:
+                sols.append(grid)
+            i += n
+        return sols
+
+    @staticmethod
+    def parse_engine_input_text(text):
+        """
+        解析引擎输入文本（第一行 K，其后 (n+1)x(n+1) 矩阵；支持空格/逗号/分号分隔）
+        返回 (K, n, col_targets, row_targets, board)，格式错误时抛出 ValueError
+        """
+        # 去掉 Solutions 块，只解析前 (1 + m) 行
+        raw_lines = [ln.strip() for ln in text.splitlines()]
+        # 过滤空行，并将 , ; 转为空格
+        lines = []
+        for ln in raw_lines:
+            if not ln.strip():
+                continue
+            ln = ln.replace(",", " ").replace(";", " ")
+            # 遇到 "Solutions:" 就停止（导入仅关心输入）
+            if ln.lower().startswith("solutions:"):
+                break
+            lines.append(ln)
+
+        if len(lines) < 2:
+            raise ValueError("缺少 K 或矩阵首行")
+
+        # 解析 K
+        try:
+            K = int(lines[0].split()[0])
+        except:
+            raise ValueError("第一行 K 解析失败")
+
+        # 解析矩阵第一行（长度 m = n+1）
+        try:
+            top = [int(x) for x in lines[1].split()]
+        except:
+            raise ValueError("矩阵首行解析失败")
+        m = len(top)
+        if m < 2:
+            raise ValueError("矩阵首行长度不足，应为 n+1")
+        # 需要再有 m-1 行
+        if len(lines) < 1 + m:
+            raise ValueError(f"矩阵行数不足，应至少有 {m} 行（包含首行）")
+
+        grid = [top]
+        for i in range(m - 1):
+            # 从 lines[2] 开始读取每一行
+            try:
+                row = [int(x) for x in lines[2 + i].split()]
+            except:
+                raise ValueError(f"矩阵第 {i+2} 行解析失败")
+            if len(row) != m:
+                raise ValueError(f"矩阵第 {i+2} 行长度应为 {m}，实际 {len(row)}")
+            grid.append(row)
+
+        # 生成 n、行列目标、棋盘
+        n = m - 1
+        col_targets = grid[0][1:]
+        row_targets = [grid[r][0] for r in range(1, m)]
+
+        # 校验值域
+        board = [[-1 for _ in range(n)] for __ in range(n)]
+        for r in range(n):
+            for c in range(n):
+                v = grid[r + 1][c + 1]
+                if v not in (-1, 0, 1, 2, 3, 4, 5, 6):
+                    raise ValueError(f"内部格子({r+1},{c+1})非法值 {v}（仅允许 -1/0/1/2/3/4/5/6）")
+                board[r][c] = v
+
+        # 非负目标
+        for idx, t in enumerate(row_targets, 1):
+            if t < 0:
+                raise ValueError(f"第 {idx} 行目标为负数：{t}")
+        for idx, t in enumerate(col_targets, 1):
+            if t < 0:
+                raise ValueError(f"第 {idx} 列目标为负数：{t}")
+
+        return K, n, col_targets, row_targets, board
+
+    @classmethod
+    def from_engine_text(cls, text):
+        K, n, col_targets, row_targets, board = cls.parse_engine_input_text(text)
+        model = cls(n=n, K=K)
+        model.col_targets = col_targets
+        model.row_targets = row_targets
+        model.board = board
+        return model
+
+
+def split_engine_inputs(text):
+    """
+    把包含多个谜题的文本切分为单个引擎输入（每个为 K 行 + (n+1) 行矩阵）。
+    谜题之间可有空行；以 # 开头的行视为注释。返回文本列表，格式错误时抛出 ValueError。
+    """
+    lines = []
+    for ln in text.splitlines():
+        ln = ln.strip()
+        if not ln or ln.startswith("#"):
+            continue
+        lines.append(ln)
+    puzzles = []
+    i = 0
+    while i < len(lines):
+        if i + 1 >= len(lines):
+            raise ValueError(f"第 {len(puzzles)+1} 个谜题缺少矩阵")
+        m = len(lines[i + 1].replace(",", " ").replace(";", " ").split())
+        if m < 2 or i + 1 + m > len(lines):
+            raise ValueError(f"第 {len(puzzles)+1} 个谜题矩阵行数不足")
+        puzzles.append("\n".join(lines[i:i + 1 + m]) + "\n")
+        i += 1 + m
+    return puzzles
+
+
+class SolutionStreamParser:
+    """
+    逐行解析引擎 --stream 输出：每个解为 n 行数字，解之间以空行分隔；
+    最后一行为 "Solutions: N" 或 "No solution"。
+    同时记录 --unique / --limit 的附加行（Unique:、Diff:、Stopped:），
+    搜索被 --time-limit / --node-limit / STOP 截断时的部分结果（Deduced:、Agreed: 各 n 行，-1 为未确定），
+    --deduce 的推理结果（"Deduce: ok|solved|contradiction [规则]"，随后为 Deduced: 块），
+    以及 --heatmap 的热力图块（"Heatmap: 已统计的解数" + n 行每格为舰体的解数，求解中会多次输出）、
+    --symmetry orbits 的对称类信息（每个解之前的 "Orbit: 该解的对称类大小"，结尾行之前的 "Orbits: 对称类数"）
+    和 --stats / --progress 的统计行与进度行（"STATS " / "PROGRESS " + JSON，server 模式下在输出中，
+    命令行模式下在 stderr）。
+    """
+    def __init__(self, n):
+        self.n = n
+        self.total = None       # 引擎报告的解总数（读到结尾行后才有）
+        self.finished = False
+        self.unique = None      # --unique：yes / no / none
+        self.diff = []          # --unique 且不唯一：两个解不同的格子 (r, c)，0 起
+        self.limited = False    # 是否因 --limit 提前停止
+        self.stopped = None     # 搜索被截断的原因：time / nodes / request（未截断为 None）
+        self.deduced = None     # 截断时：根节点传播即可确定的格子（n×n，0 舰体，1 海水，-1 未确定）
+        self.agreed = None      # 截断时：已找到的解中取值一致的格子（无解时同 deduced）
+        self.deduce = None      # --deduce：ok / solved / contradiction（deduced 为传播确定的格子，矛盾时为 None）
+        self.deduce_rule = None # --deduce 矛盾时引擎报告的规则（row、hint、final_fleet 等，可能为 None）
+        self.heatmap = None     # --heatmap：最近一次收到的 n×n 计数
+        self.heat_total = 0     # 该热力图统计过的解数
+        self.heat_version = 0   # 每收到一个完整的热力图块加 1
+        self.stats = None       # --stats：引擎报告的搜索统计（dict）
+        self.progress = None    # --progress：最近一次进度（nodes、solutions、explored、elapsed_ms）
+        self.progress_version = 0
+        self.orbits = []        # --symmetry orbits：每个解（对称类代表）所在对称类的解数，与解一一对应
+        self.orbit_total = None # --symmetry orbits：对称类数（total 仍为全部解数）
+        self._rows = []
+        self._block = None      # 正在读取的 n 行块：[名称, 标题行中的数, 已读的行]
+
+    def feed(self, line):
+        """喂入一行；凑满 n 行时返回该解（n×n 列表），否则返回 None"""
+        s = line.strip()
+        if not s:
+            self._rows = []
+            return None
+        if s.startswith("Solutions:"):
+            try:
+                self.total = int(s.split(":", 1)[1])
+            except ValueError:
+                pass
+            self.finished = True
+            return None
+        if "No solution" in s:
+            self.total = 0
+            self.finished = True
+            return None
+        if s.startswith("Unique:"):
+            self.unique = s.split(":", 1)[1].strip()
+            return None
+        if s.startswith("Diff:"):
+            for tok in s.split(":", 1)[1].split():
+                r, c = tok.split(",")
+                self.diff.append((int(r) - 1, int(c) - 1))
+            return None
+        if s.startswith("Stopped:"):
+            reason = s.split(":", 1)[1].strip()
+            if reason == "limit":
+                self.limited = True
+            else:
+                self.stopped = reason
+            return None
+        if s.startswith("Orbit:") or s.startswith("Orbits:"):
+            try:
+                value = int(s.split(":", 1)[1])
+            except ValueError:
+                return None
+            if s.startswith("Orbit:"):
+                self.orbits.append(value)
+            else:
+                self.orbit_total = value
+            return None
+        if s.startswith("Deduce:"):
+            parts = s.split(":", 1)[1].split()
+            self.deduce = parts[0] if parts else None
+            self.deduce_rule = parts[1] if len(parts) > 1 else None
+            return None
+        if s.startswith("STATS "):
+            try:
+                self.stats = json.loads(s[6:])
+            except ValueError:
+                pass
+            return None
+        if s.startswith("PROGRESS "):
+            try:
+                self.progress = json.loads(s[9:])
+                self.progress_version += 1
+            except ValueError:
+                pass
+            return None
+        if s.startswith(("Heatmap:", "Deduced:", "Agreed:")):
+            name, value = s.split(":", 1)
+            try:
+                self._block = [name, int(value) if value.strip() else 0, []]
+            except ValueError:
+                self._block = None
+            return None
+        parts = s.replace(",", " ").replace(";", " ").split()
+        if len(parts) != self.n:
+            self._rows = []
+            self._block = None
+            return None
+        try:
+            row = [int(x) for x in parts]
+        except ValueError:
+            self._rows = []
+            self._block = None
+            return None
+        if self._block is not None:
+            name, value, rows = self._block
+            rows.append(row)
+            if len(rows) == self.n:
+                self._block = None
+                if name == "Heatmap":
+                    self.heatmap = rows
+                    self.heat_total = value
+                    self.heat_version += 1
+                elif name == "Deduced":
+                    self.deduced = rows
+                else:
+                    self.agreed = rows
+            return None
+        self._rows.append(row)
+        if len(self._rows) == self.n:
+            grid = self._rows
+            self._rows = []
+            return grid
+        return None
+
+
+class SolutionStore:
+    """
+    n×n 解的紧凑存储：每个解打包为 n² 位（第 r*n+c 位为 1 表示舰体、0 表示海水，按字节小端排列），
+    首尾相接存放在一块缓冲区中，第 i 个解可直接按偏移读取。
+    - 缓冲区超过 max_memory_bytes 后转存到 spill_dir 下的临时文件并做内存映射，之后的解直接写入映射区；
+    - store[i] 只在取出时把该解解包为 n×n 列表；
+    - pack() 为静态方法：可在解析线程里先打包，再在界面线程用 extend_packed() 批量追加。
+    """
+    def __init__(self, n, max_memory_bytes=64_000_000, spill_dir=None):
+        self.n = n
+        self.record_bytes = (n * n + 7) // 8
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_dir = spill_dir
+        self._count = 0
+        self._used = 0              # 已使用的字节数
+        self._buf = bytearray()     # 转存前的内存缓冲区
+        self._file = None           # 转存后的临时文件
+        self._map = None            # 临时文件的内存映射（长度按倍增预留）
+
+    @staticmethod
+    def pack(board):
+        """n×n 解 -> n² 位的 bytes（值为 0 的格子记为舰体）"""
+        n = len(board)
+        bits = "".join("1" if v == 0 else "0" for row in reversed(board) for v in reversed(row))
+        return int(bits, 2).to_bytes((n * n + 7) // 8, "little")
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def spilled(self):
+        """是否已转存到临时文件"""
+        return self._map is not None
+
+    @property
+    def nbytes(self):
+        return self._used
+
+    def append(self, board):
+        self.extend_packed([self.pack(board)])
+
+    def extend_packed(self, records):
+        """批量追加 pack() 得到的解"""
+        self.extend_bytes(b"".join(records))
+
+    def extend_bytes(self, data):
+        """追加首尾相接的若干个打包解（如引擎 --binary 输出中的记录）"""
+        if len(data) % self.record_bytes:
+            raise ValueError(f"解的大小与 {self.n}×{self.n} 的存储不一致")
+        end = self._used + len(data)
+        if self._map is None and end > self.max_memory_bytes:
+            self._spill(end)
+        if self._map is not None:
+            if end > len(self._map):
+                self._remap(max(end, 2 * len(self._map)))
+            self._map[self._used:end] = data
+        else:
+            self._buf += data
+        self._used = end
+        self._count += len(data) // self.record_bytes
+
+    def packed(self, i):
+        """第 i 个解的打包形式"""
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(f"解的序号超出范围：{i}")
+        off = i * self.record_bytes
+        src = self._map if self._map is not None else self._buf
+        return bytes(src[off:off + self.record_bytes])
+
+    def __getitem__(self, i):
+        n = self.n
+        bits = format(int.from_bytes(self.packed(i), "little"), f"0{n * n}b")[::-1]
+        return [[0 if b == "1" else 1 for b in bits[r * n:(r + 1) * n]] for r in range(n)]
+
+    def close(self):
+        """释放缓冲区与临时文件（之后存储为空）"""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._buf = bytearray()
+        self._count = 0
+        self._used = 0
+
+    def _spill(self, need):
+        self._file = tempfile.TemporaryFile(prefix="battleships-solutions-", dir=self.spill_dir)
+        self._file.write(self._buf)
+        self._buf = bytearray()
+        self._remap(max(need, 2 * self._used))
+
+    def _remap(self, size):
+        if self._map is not None:
+            self._map.close()
+        self._file.flush()
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+
+# 引擎 --binary 输出（格式见 BattleShips.cpp 中 put_le() 之前的注释），整数均为小端
+BINARY_MAGIC = b"BSB1"
+BINARY_HEADER = struct.Struct("<4sIIQ")     # 魔数、n、K、解数（--stream 时为 BINARY_UNKNOWN_COUNT）
+BINARY_LENGTH = struct.Struct("<I")         # 每个记录前的字节数；0 表示记录结束，其后为文件尾
+BINARY_TRAILER = struct.Struct("<QI")       # 解数、标志
+BINARY_UNKNOWN_COUNT = 2 ** 64 - 1
+BINARY_FLAG_LIMITED = 1                     # 因 --limit 提前停止
+
+
+class BinaryOutput:
+    """引擎 --binary 输出的解析结果；solutions 为 SolutionStore，解保持打包形式"""
+    def __init__(self, n, K, solutions):
+        self.n = n
+        self.K = K
+        self.count = None       # 引擎报告的解总数（--count-only 时没有记录，只有总数）
+        self.limited = False
+        self.solutions = solutions
+
+
+def _binary_output_for(head, store):
+    if len(head) < BINARY_HEADER.size:
+        raise ValueError("引擎二进制输出不完整：缺少文件头")
+    magic, n, K, _count = BINARY_HEADER.unpack_from(head)
+    if magic != BINARY_MAGIC:
+        raise ValueError("不是引擎的二进制输出（文件头不是 BSB1）")
+    if store is not None and store.n != n:
+        raise ValueError(f"解的大小 {n}×{n} 与存储不一致")
+    return BinaryOutput(n, K, store if store is not None else SolutionStore(n))
+
+
+def parse_binary_output(data, store=None):
+    """
+    解析完整的引擎 --binary 输出（bytes / bytearray / memoryview），返回 BinaryOutput。
+    记录等长，解直接按打包形式拷入 SolutionStore，不逐格转换：有 NumPy 时用 frombuffer 一次取出全部记录，
+    否则逐个记录切片 memoryview。
+    """
+    mv = memoryview(data)
+    out = _binary_output_for(mv, store)
+    rb = out.solutions.record_bytes
+    stride = BINARY_LENGTH.size + rb
+    start = BINARY_HEADER.size
+    body = len(mv) - start - BINARY_LENGTH.size - BINARY_TRAILER.size
+    if body < 0 or body % stride:
+        raise ValueError("引擎二进制输出不完整")
+    k = body // stride
+    end = start + k * stride
+    if k and numpy is not None:
+        rec = numpy.frombuffer(mv, dtype=numpy.dtype([("len", "<u4"), ("bits", "u1", (rb,))]), count=k, offset=start)
+        if (rec["len"] != rb).any():
+            raise ValueError(f"引擎二进制输出的记录长度与 n={out.n} 不符")
+        out.solutions.extend_bytes(rec["bits"].tobytes())
+    elif k:
+        for off in range(start, end, stride):
+            if BINARY_LENGTH.unpack_from(mv, off)[0] != rb:
+                raise ValueError(f"引擎二进制输出的记录长度与 n={out.n} 不符")
+        out.solutions.extend_bytes(b"".join(mv[off + BINARY_LENGTH.size:off + stride]
+                                            for off in range(start, end, stride)))
+    if BINARY_LENGTH.unpack_from(mv, end)[0] != 0:
+        raise ValueError("引擎二进制输出缺少结束标记")
+    out.count, flags = BINARY_TRAILER.unpack_from(mv, end + BINARY_LENGTH.size)
+    out.limited = bool(flags & BINARY_FLAG_LIMITED)
+    return out
+
+
+def _read_exact(stream, size):
+    buf = stream.read(size)
+    if len(buf) != size:
+        raise ValueError("引擎二进制输出意外结束")
+    return buf
+
+
+def read_binary_output(stream, store=None, on_solution=None):
+    """
+    从二进制文件对象（如 `solver --binary --stream` 的 stdout）逐个读取记录，返回 BinaryOutput；
+    每读到一个解调用一次 on_solution(packed)，packed 与 SolutionStore.pack() 的结果格式相同。
+    """
+    out = _binary_output_for(_read_exact(stream, BINARY_HEADER.size), store)
+    rb = out.solutions.record_bytes
+    while True:
+        (length,) = BINARY_LENGTH.unpack(_read_exact(stream, BINARY_LENGTH.size))
+        if length == 0:
+            break
+        if length != rb:
+            raise ValueError(f"引擎二进制输出的记录长度 {length} 与 n={out.n} 不符")
+        packed = _read_exact(stream, rb)
+        out.solutions.extend_bytes(packed)
+        if on_solution is not None:
+            on_solution(packed)
+    out.count, flags = BINARY_TRAILER.unpack(_read_exact(stream, BINARY_TRAILER.size))
+    out.limited = bool(flags & BINARY_FLAG_LIMITED)
+    return out
+
+
+def run_engine_binary(solver_path, input_text, args=(), store=None):
+    """以 --binary 运行一次引擎（非常驻进程）并解析输出；引擎报错时抛出 RuntimeError"""
+    proc = subprocess.run([solver_path, "--binary"] + list(args), input=input_text.encode("utf-8"),
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.decode("utf-8", errors="replace").strip() or "引擎异常退出")
+    return parse_binary_output(proc.stdout, store)
+
+
+def default_cache_dir():
+    return os.path.join(os.path.expanduser("~"), ".battleships", "cache")
+
+
+def canonical_engine_text(text):
+    """引擎输入的规范文本（统一分隔符与空白），用作缓存键；格式错误时抛出 ValueError"""
+    model = PuzzleModel.from_engine_text(text)
+    return "\n".join(model.build_engine_matrix_lines()) + "\n"
+
+
+class SolutionCache:
+    """
+    引擎输出缓存：键为 (引擎可执行文件的 sha256, 影响输出的参数, 规范化的引擎输入) 的 sha256，
+    值为该请求 BEGIN/END 之间的全部输出行（只缓存 status 为 ok 的结果）。
+    - 内存中按 LRU 保留，总字符数不超过 max_memory_chars；
+    - cache_dir 不为 None 时另存一份 zlib 压缩文件 <键>.z，总大小超过 max_disk_bytes 时删除最久未用的文件；
+    - 超过 max_entry_chars 的输出不缓存。
+    可从多个线程并发使用。
+    """
+    # 不影响输出内容的引擎参数 -> 其后跟随的值个数（不计入缓存键）
+    NEUTRAL_ARGS = {"--threads": 1}
+    # 结果取决于运行时长或线程调度的参数：带这些参数的请求不缓存
+    UNCACHED_ARGS = ("--time-limit", "--node-limit")
+
+    def __init__(self, cache_dir=None, max_memory_chars=32_000_000, max_disk_bytes=256_000_000,
+                 max_entry_chars=None):
+        self.cache_dir = cache_dir
+        self.max_memory_chars = max_memory_chars
+        self.max_disk_bytes = max_disk_bytes
+        self.max_entry_chars = max_entry_chars or max(1, max_memory_chars // 8)
+        self.hits = 0
+        self.misses = 0
+        self._memory = collections.OrderedDict()  # 键 -> 输出行元组，末尾为最近使用
+        self._memory_chars = 0
+        self._disk_bytes = None                   # 首次写盘时统计
+        self._engine_digests = {}                 # (路径, mtime, 大小) -> sha256
+        self._lock = threading.Lock()
+
+    def key(self, solver_path, input_text, args=()):
+        """计算缓存键；引擎文件不存在、输入无法解析或参数含 UNCACHED_ARGS 时返回 None（不缓存）"""
+        if any(a in self.UNCACHED_ARGS for a in args):
+            return None
+        try:
+            st = os.stat(solver_path)
+            canon = canonical_engine_text(input_text)
+        except (OSError, ValueError):
+            return None
+        stamp = (os.path.abspath(solver_path), st.st_mtime_ns, st.st_size)
+        engine = self._engine_digests.get(stamp)
+        if engine is None:
+            h = hashlib.sha256()
+            try:
+                with open(solver_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        h.update(chunk)
+            except OSError:
+                return None
+            engine = self._engine_digests[stamp] = h.hexdigest()
+        kept = []
+        skip = 0
+        for a in args:
+            if skip:
+                skip -= 1
+            elif a in self.NEUTRAL_ARGS:
+                skip = self.NEUTRAL_ARGS[a]
+            else:
+                kept.append(a)
+        h = hashlib.sha256()
+        h.update("\0".join([engine, " ".join(kept), canon]).encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key):
+        """返回缓存的输出行列表，未命中返回 None；同时更新命中统计"""
+        with self._lock:
+            lines = self._memory.get(key)
+            if lines is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return list(lines)
+        lines = self._load(key)
+        with self._lock:
+            if lines is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, tuple(lines))
+        return lines
+
+    def put(self, key, lines):
+        chars = sum(len(ln) for ln in lines)
+        if chars > self.max_entry_chars:
+            return
+        with self._lock:
+            self._remember(key, tuple(lines))
+        self._store(key, "".join(lines))
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate,
+                    "entries": len(self._memory), "memory_chars": self._memory_chars}
+
+    def _remember(self, key, lines):
+        # 调用方持有 self._lock
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_chars -= sum(len(ln) for ln in old)
+        self._memory[key] = lines
+        self._memory_chars += sum(len(ln) for ln in lines)
+        while self._memory_chars > self.max_memory_chars and len(self._memory) > 1:
+            _, dropped = self._memory.popitem(last=False)
+            self._memory_chars -= sum(len(ln) for ln in dropped)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".z")
+
+    def _load(self, key):
+        if self.cache_dir is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                text = zlib.decompress(f.read()).decode("utf-8")
+            os.utime(path)  # 以修改时间作为磁盘 LRU 依据
+        except (OSError, zlib.error, UnicodeDecodeError):
+            return None
+        return text.splitlines(keepends=True)
+
+    def _store(self, key, text):
+        if self.cache_dir is None:
+            return
+        data = zlib.compress(text.encode("utf-8"), 6)
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            return  # 磁盘缓存只是加速手段，写失败时仅保留内存缓存
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+            else:
+                self._disk_bytes += len(data)
+            if self._disk_bytes <= self.max_disk_bytes:
+                return
+            for mtime, size, p in sorted(self._disk_entries()):
+                if self._disk_bytes <= self.max_disk_bytes * 0.9:
+                    break
+                try:
+                    os.remove(p)
+                    self._disk_bytes -= size
+                except OSError:
+                    pass
+
+    def _disk_entries(self):
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith(".z"):
+                continue
+            p = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        return entries
+
+
+class EngineJob:
+    """
+    一次求解请求。
+    - on_line：每收到一行引擎输出（BEGIN/END 之间）就回调一次，在运行该请求的线程中调用；
+    - 结束后 status 为 ok / cancelled / error / crashed，error 为错误信息；
+    - cached 为 True 表示结果直接取自 SolutionCache，未经过引擎进程。
+    """
+    def __init__(self, job_id, input_text, args=(), on_line=None):
+        self.id = str(job_id)
+        self.input_text = input_text
+        self.args = list(args)
+        self.on_line = on_line
+        self.status = None
+        self.error = ""
+        self.cached = False
+        self.worker = None
+        self._cancelled = False
+        self._stop_requested = False
+        self._done = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def stop_requested(self):
+        return self._stop_requested
+
+    def stop(self):
+        # 提前结束搜索但仍然回答：引擎输出 "Stopped: request" 与部分结果，status 为 ok
+        self._stop_requested = True
+        worker = self.worker
+        if worker is not None:
+            worker.stop(self)
+
+    def cancel(self):
+        # 只取消当前请求，不结束引擎进程
+        self._cancelled = True
+        worker = self.worker
+        if worker is not None:
+            worker.cancel(self)
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+class EngineWorker:
+    """一个常驻的 `solver --server` 进程，一次只处理一个请求"""
+    def __init__(self, solver_path):
+        self.solver_path = solver_path
+        self.restarts = 0
+        self.stderr_tail = ""
+        self._proc = None
+        self._write_lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        self._proc = subprocess.Popen(
+            [self.solver_path, "--server"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors="replace",  # 引擎的中文错误信息可能与本机编码不一致
+            bufsize=1
+        )
+        proc = self._proc
+        threading.Thread(target=self._drain_stderr, args=(proc,), daemon=True).start()
+
+    def _drain_stderr(self, proc):
+        for line in proc.stderr:
+            self.stderr_tail = (self.stderr_tail + line)[-STDERR_TAIL_CHARS:]
+
+    def alive(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def kill(self):
+        proc = self._proc
+        if proc is None:
+            return
+        try:
+            proc.kill()
+        except Exception:
+            pass
+
+    def restart(self):
+        self.kill()
+        if self._proc is not None:
+            try:
+                self._proc.wait(timeout=CANCEL_GRACE_SECONDS)
+            except Exception:
+                pass
+        self.restarts += 1
+        self.start()
+
+    def close(self):
+        proc = self._proc
+        if proc is None:
+            return
+        try:
+            with self._write_lock:
+                proc.stdin.write("QUIT\n")
+                proc.stdin.close()
+            proc.wait(timeout=CANCEL_GRACE_SECONDS)
+        except Exception:
+            self.kill()
+        self._proc = None
+
+    def _send(self, text):
+        with self._write_lock:
+            self._proc.stdin.write(text)
+            self._proc.stdin.flush()
+
+    def run(self, job):
+        """在当前线程阻塞执行 job，逐行回调 job.on_line，返回 job.status"""
+        if not self.alive():
+            self.restart()
+        job.worker = self
+        status = "cancelled"
+        if not job.cancelled:
+            lines = job.input_text.rstrip("\n").split("\n")
+            header = " ".join(["SOLVE", job.id, str(len(lines))] + job.args)
+            try:
+                self._send(header + "\n" + "\n".join(lines) + "\n")
+                if job.cancelled:
+                    # 发送期间被取消：补发 CANCEL
+                    self.cancel(job)
+                elif job.stop_requested:
+                    self.stop(job)
+                status = self._read_response(job)
+            except (OSError, ValueError):
+                status = "crashed"
+            if status == "crashed":
+                # 进程崩溃，或取消后迟迟不结束而被强制结束：重启以保持进程池可用
+                if job.cancelled:
+                    status = "cancelled"
+                else:
+                    job.error = job.error or (self.stderr_tail.strip() or "引擎进程意外退出")
+                self.restart()
+        job.status = status
+        job.worker = None
+        job._done.set()
+        return status
+
+    def _read_response(self, job):
+        out = self._proc.stdout
+        begin = f"BEGIN {job.id}"
+        for line in out:
+            if line.rstrip("\n") == begin:
+                break
+        else:
+            return "crashed"
+        for line in out:
+            s = line.rstrip("\n")
+            if s.startswith("END "):
+                parts = s.split()
+                if len(parts) >= 3 and parts[1] == job.id:
+                    return parts[2]
+            if s.startswith("ERROR "):
+                job.error = s[len("ERROR "):]
+                continue
+            if job.on_line is not None:
+                job.on_line(line)
+        return "crashed"
+
+    def cancel(self, job):
+        try:
+            self._send(f"CANCEL {job.id}\n")
+        except (OSError, ValueError, AttributeError):
+            pass
+        timer = threading.Timer(CANCEL_GRACE_SECONDS, self._kill_if_stuck, args=(job,))
+        timer.daemon = True
+        timer.start()
+
+    def stop(self, job):
+        try:
+            self._send(f"STOP {job.id}\n")
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def _kill_if_stuck(self, job):
+        if not job.done and job.worker is self:
+            self.kill()
+
+
+class EnginePool:
+    """
+    保持最多 size 个常驻引擎进程（用到时才启动），把请求交给空闲的进程执行。
+    run() 在调用线程中阻塞执行，可从多个线程并发调用。
+    给定 cache（SolutionCache）时先查缓存：命中则直接回放输出行，不占用引擎进程。
+    """
+    def __init__(self, solver_path, size=None, cache=None):
+        self.solver_path = solver_path
+        self.size = max(1, size or os.cpu_count() or 1)
+        self.cache = cache
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._workers = []
+        self._idle = []
+        self._closed = False
+
+    def create_job(self, input_text, args=(), on_line=None):
+        return EngineJob(next(self._ids), input_text, args, on_line)
+
+    def run(self, job):
+        key = None
+        if self.cache is not None and not job.cancelled:
+            key = self.cache.key(self.solver_path, job.input_text, job.args)
+            lines = self.cache.get(key) if key is not None else None
+            if lines is not None:
+                return self._replay(job, lines)
+
+        recorded = []
+        if key is not None:
+            # 边转发边记录输出，成功结束后写入缓存
+            on_line = job.on_line
+
+            def record(line):
+                recorded.append(line)
+                if on_line is not None:
+                    on_line(line)
+            job.on_line = record
+
+        worker = self._acquire()
+        try:
+            status = worker.run(job)
+        finally:
+            self._release(worker)
+        if key is not None and status == "ok" and not job.error and not job.stop_requested:
+            self.cache.put(key, recorded)
+        return status
+
+    def _replay(self, job, lines):
+        for line in lines:
+            if job.cancelled:
+                break
+            if job.on_line is not None:
+                job.on_line(line)
+        job.status = "cancelled" if job.cancelled else "ok"
+        job.cached = True
+        job._done.set()
+        return job.status
+
+    def solve(self, input_text, args=(), on_line=None):
+        job = self.create_job(input_text, args, on_line)
+        self.run(job)
+        return job
+
+    def _acquire(self):
+        with self._cond:
+            while not self._idle and len(self._workers) >= self.size:
+                if self._closed:
+                    raise RuntimeError("引擎进程池已关闭")
+                self._cond.wait()
+            if self._closed:
+                raise RuntimeError("引擎进程池已关闭")
+            if not self._idle:
+                worker = EngineWorker(self.solver_path)
+                self._workers.append(worker)
+                return worker
+            return self._idle.pop()
+
+    def _release(self, worker):
+        with self._cond:
+            self._idle.append(worker)
+            self._cond.notify()
+
+    @property
+    def restarts(self):
+        return sum(w.restarts for w in self._workers)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for w in self._workers:
+            w.close()
@@ -0,0 +1,279 @@
+"""
+可复现的谜题生成器：按随机种子摆放舰队，生成引擎输入文本（行/列目标 + 按密度揭示的格子）。
+--unique 时改为生成唯一解谜题：从全部揭示开始，借助引擎贪心地去掉提示，直到剩下的每个提示都不可缺少。
+
+用法示例：
+    python BattleShipsGen.py -o corpus/ --sizes 8,12,16,20,30,40 --ks 3,4 --densities 0.1,0.2,0.3 --count 2 --seed 1
+    python BattleShipsGen.py --sizes 10 --ks 4 --densities 0.2      # 只有一个谜题且未指定 -o 时输出到 stdout
+    python BattleShipsGen.py --unique -o unique/ --sizes 10 --ks 4 --count 300 --solver ./battleship_solver -j 8
+    python BattleShipsGen.py --unique -o unique/ --sizes 10 --ks 4 --count 300 --native   # 进程内检查（共享库）
+
+揭示的格子使用引擎的编码：海水 1；舰首/舰尾 U/D/L/R = 2/3/4/5（指向舰身的另一格）；单格舰 S = 6；舰身中段 0。
+同一组参数（种子、n、K、密度、序号）总是生成同一个谜题，与生成顺序及其他参数无关。
+"""
+import os
+import sys
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from BattleShipsEngine import EnginePool, PuzzleModel, SolutionStreamParser, default_solver_name
+from BattleShipsNative import NativeLibrary, NativeSolver
+
+DEFAULT_SIZES = (8, 12, 16, 20, 30, 40)
+DEFAULT_KS = (3, 4)
+DEFAULT_DENSITIES = (0.1, 0.2, 0.3)
+# 唯一性检查：找到第二个解即停止，只计数
+UNIQUE_CHECK_ARGS = ("--count-only", "--limit", "2")
+# 去提示时一次尝试去掉的格子数
+UNIQUE_CHUNK = 8
+
+
+def fleet(K):
+    """K 型舰队的舰长列表（长度 L 的舰 K-L+1 艘），从长到短"""
+    return [L for L in range(K, 0, -1) for _ in range(K - L + 1)]
+
+
+def place_fleet(n, K, rng, attempts=200):
+    """
+    随机摆放整支舰队（舰与舰之间含对角都不接触），返回 n×n 盘面（0 舰体，1 海水）。
+    从长到短依次在所有合法位置中随机选一个，摆不下时从头重来；attempts 次都失败则抛出 ValueError。
+    """
+    for _ in range(attempts):
+        board = [[1] * n for _ in range(n)]
+        blocked = [[False] * n for _ in range(n)]  # 舰体及其周围 8 格
+        for L in fleet(K):
+            spots = []
+            for r in range(n):
+                for c in range(n):
+                    if c + L <= n and not any(blocked[r][c + i] for i in range(L)):
+                        spots.append((r, c, 0, 1))
+                    if L > 1 and r + L <= n and not any(blocked[r + i][c] for i in range(L)):
+                        spots.append((r, c, 1, 0))
+            if not spots:
+                break
+            r, c, dr, dc = rng.choice(spots)
+            for i in range(L):
+                rr, cc = r + dr * i, c + dc * i
+                board[rr][cc] = 0
+                for nr in range(max(0, rr - 1), min(n, rr + 2)):
+                    for nc in range(max(0, cc - 1), min(n, cc + 2)):
+                        blocked[nr][nc] = True
+        else:
+            return board
+    raise ValueError(f"{n}×{n} 的棋盘摆不下 K={K} 的舰队")
+
+
+def hint_value(board, r, c):
+    """揭示格子 (r, c) 时写入引擎输入的值"""
+    n = len(board)
+    if board[r][c] != 0:
+        return 1
+    up = r > 0 and board[r - 1][c] == 0
+    down = r + 1 < n and board[r + 1][c] == 0
+    left = c > 0 and board[r][c - 1] == 0
+    right = c + 1 < n and board[r][c + 1] == 0
+    if up and not down:
+        return 2
+    if down and not up:
+        return 3
+    if left and not right:
+        return 4
+    if right and not left:
+        return 5
+    if not (up or down or left or right):
+        return 6
+    return 0
+
+
+def make_puzzle(n, K, density, rng):
+    """生成一个谜题，返回 (PuzzleModel, 生成时摆放的盘面)；该盘面一定是谜题的解之一"""
+    solution = place_fleet(n, K, rng)
+    model = PuzzleModel(n=n, K=K)
+    model.row_targets = [row.count(0) for row in solution]
+    model.col_targets = [sum(1 for r in range(n) if solution[r][c] == 0) for c in range(n)]
+    for r in range(n):
+        for c in range(n):
+            if rng.random() < density:
+                model.board[r][c] = hint_value(solution, r, c)
+    return model, solution
+
+
+def puzzle_id(n, K, density, index):
+    return f"n{n}_K{K}_d{round(density * 100):02d}_{index}"
+
+
+def unique_puzzle_id(n, K, index):
+    return f"n{n}_K{K}_u_{index}"
+
+
+def engine_text(model):
+    return "\n".join(model.build_engine_matrix_lines()) + "\n"
+
+
+def is_unique(pool, model):
+    """检查谜题是否恰有一个解；pool 为常驻引擎进程池（EnginePool）或共享库（NativeLibrary，进程内求解）"""
+    if isinstance(pool, NativeLibrary):
+        with NativeSolver(model, pool) as solver:
+            return solver.is_unique()
+    parser = SolutionStreamParser(model.n)
+    job = pool.solve(engine_text(model), UNIQUE_CHECK_ARGS, parser.feed)
+    if job.status != "ok" or job.error:
+        raise RuntimeError(job.error or f"引擎未正常结束（{job.status}）")
+    return parser.total == 1
+
+
+def make_unique_puzzle(n, K, rng, pool, chunk=UNIQUE_CHUNK):
+    """
+    生成唯一解谜题，返回 (PuzzleModel, 解)。
+    先揭示全部格子，再按随机顺序去掉提示：每次尝试去掉 chunk 个，解仍唯一就保留这次删除，
+    否则恢复并对半拆开再试，直到单个格子。因为提示越少解只会越多，最后剩下的每个提示单独去掉都会使解不唯一。
+    """
+    solution = place_fleet(n, K, rng)
+    model = PuzzleModel(n=n, K=K)
+    model.row_targets = [row.count(0) for row in solution]
+    model.col_targets = [sum(1 for r in range(n) if solution[r][c] == 0) for c in range(n)]
+    model.board = [[hint_value(solution, r, c) for c in range(n)] for r in range(n)]
+    cells = [(r, c) for r in range(n) for c in range(n)]
+    rng.shuffle(cells)
+
+    def try_remove(group):
+        saved = [model.board[r][c] for r, c in group]
+        for r, c in group:
+            model.board[r][c] = -1
+        if is_unique(pool, model):
+            return
+        for (r, c), v in zip(group, saved):
+            model.board[r][c] = v
+        if len(group) > 1:
+            half = len(group) // 2
+            try_remove(group[:half])
+            try_remove(group[half:])
+
+    for i in range(0, len(cells), chunk):
+        try_remove(cells[i:i + chunk])
+    return model, solution
+
+
+def generate_corpus(sizes=DEFAULT_SIZES, ks=DEFAULT_KS, densities=DEFAULT_DENSITIES, count=1, seed=0):
+    """
+    按 sizes × ks × densities × count 生成谜题，返回 ([(puzzle_id, 引擎输入文本)], [摆不下舰队而跳过的 puzzle_id])。
+    每个谜题使用独立的随机数生成器，种子由 (seed, n, K, 密度, 序号) 决定。
+    """
+    puzzles = []
+    skipped = []
+    for n in sizes:
+        for K in ks:
+            for d in densities:
+                for i in range(1, count + 1):
+                    pid = puzzle_id(n, K, d, i)
+                    rng = random.Random(f"{seed}:{pid}")
+                    try:
+                        model, _ = make_puzzle(n, K, d, rng)
+                    except ValueError:
+                        skipped.append(pid)
+                        continue
+                    puzzles.append((pid, "\n".join(model.build_engine_matrix_lines()) + "\n"))
+    return puzzles, skipped
+
+
+def generate_unique_corpus(solver, sizes=(10,), ks=(4,), count=1, seed=0, jobs=None, log=None):
+    """
+    按 sizes × ks × count 生成唯一解谜题，返回 ([(puzzle_id, 引擎输入文本)], [摆不下舰队而跳过的 puzzle_id])。
+    多个谜题同时生成，共用 jobs 个常驻引擎进程；solver 为 NativeLibrary 时改为在 jobs 个线程中进程内检查。
+    每个谜题的随机数生成器与检查顺序固定，结果与并发度无关。
+    """
+    specs = [(n, K, i) for n in sizes for K in ks for i in range(1, count + 1)]
+    results = {}
+    skipped = []
+    native = isinstance(solver, NativeLibrary)
+    pool = solver if native else EnginePool(solver, size=jobs)
+    workers = (jobs or os.cpu_count() or 1) if native else pool.size
+
+    def build(n, K, i):
+        pid = unique_puzzle_id(n, K, i)
+        try:
+            model, _ = make_unique_puzzle(n, K, random.Random(f"{seed}:{pid}"), pool)
+        except ValueError:
+            return pid, None
+        return pid, engine_text(model)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            futures = [ex.submit(build, *spec) for spec in specs]
+            for fut in as_completed(futures):
+                pid, text = fut.result()
+                if text is None:
+                    skipped.append(pid)
+                else:
+                    results[pid] = text
+                if log is not None:
+                    log(len(results) + len(skipped), len(specs))
+    finally:
+        if not native:
+            pool.close()
+    order = [unique_puzzle_id(n, K, i) for n, K, i in specs]
+    return [(pid, results[pid]) for pid in order if pid in results], [pid for pid in order if pid in skipped]
+
+
+def _int_list(text):
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def _float_list(text):
+    return [float(x) for x in text.split(",") if x.strip()]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="生成可复现的战舰谜题语料")
+    ap.add_argument("-o", "--output", default=None, help="输出目录（每个谜题一个 <id>.txt）")
+    ap.add_argument("--sizes", type=_int_list, default=list(DEFAULT_SIZES), help="棋盘大小列表，如 8,12,16")
+    ap.add_argument("--ks", type=_int_list, default=list(DEFAULT_KS), help="K 的列表，如 3,4")
+    ap.add_argument("--densities", type=_float_list, default=list(DEFAULT_DENSITIES),
+                    help="揭示格子的比例列表，如 0.1,0.2")
+    ap.add_argument("--count", type=int, default=1, help="每组参数生成的谜题数")
+    ap.add_argument("--seed", type=int, default=0, help="随机种子")
+    ap.add_argument("--unique", action="store_true", help="生成唯一解谜题（忽略 --densities，需要引擎）")
+    ap.add_argument("--solver", default=default_solver_name(), help="--unique：引擎可执行文件路径")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="--unique：并行引擎进程数")
+    ap.add_argument("--native", nargs="?", const="", default=None, metavar="LIB",
+                    help="--unique：用共享库在进程内检查（默认使用 BattleShipsBuild.py --library 构建的共享库）")
+    args = ap.parse_args(argv)
+
+    if args.unique:
+        if args.native is not None:
+            try:
+                args.solver = NativeLibrary(args.native or None)
+            except OSError as e:
+                print(f"无法加载引擎共享库：{e}", file=sys.stderr)
+                return 2
+        elif not os.path.exists(args.solver):
+            print(f"未找到引擎可执行文件：{args.solver}", file=sys.stderr)
+            return 2
+
+        def log(done, total):
+            print(f"\r已生成 {done}/{total}", end="\n" if done == total else "", file=sys.stderr, flush=True)
+        puzzles, skipped = generate_unique_corpus(args.solver, args.sizes, args.ks, args.count, args.seed,
+                                                  args.jobs, log)
+    else:
+        puzzles, skipped = generate_corpus(args.sizes, args.ks, args.densities, args.count, args.seed)
+    for pid in skipped:
+        print(f"跳过 {pid}：棋盘摆不下该舰队", file=sys.stderr)
+
+    if args.output is None:
+        if len(puzzles) != 1:
+            print("生成多个谜题时需要用 -o 指定输出目录", file=sys.stderr)
+            return 2
+        sys.stdout.write(puzzles[0][1])
+        return 0
+
+    os.makedirs(args.output, exist_ok=True)
+    for pid, text in puzzles:
+        with open(os.path.join(args.output, pid + ".txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+    print(f"已生成 {len(puzzles)} 个谜题到 {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+进程内求解：通过 ctypes 调用共享库版本的引擎（BattleShips.cpp 以 -DBATTLESHIPS_LIBRARY 编译，
+接口见其中 bs_create() 之前的注释），直接传入 PuzzleModel 的盘面，不经过进程启动、输入文本生成与输出解析。
+
+用法示例：
+    python BattleShipsBuild.py --library                 # 构建共享库（按源码哈希缓存）
+    lib = NativeLibrary()                                # 默认加载缓存中为当前源码构建的共享库
+    with NativeSolver(model, lib) as s:
+        s.count()                                        # 解的数量，同 --count-only
+        store = s.solutions(limit=100)                   # SolutionStore，解保持打包形式
+        boards = s.solve()                               # n×n 列表（0 舰体，1 海水），同 parse_solutions_from_output
+
+调用期间释放 GIL：不同的 NativeSolver 可以在多个线程中同时求解；cancel() 可从其他线程调用。
+"""
+import ctypes
+
+from BattleShipsEngine import SolutionStore
+
+BS_ERROR = -1
+BS_CANCELLED = -2
+
+SOLUTION_FN = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.POINTER(ctypes.c_ubyte), ctypes.c_void_p)
+
+
+def _decode_error(raw):
+    # 源码以 GBK 保存，错误信息按编译时的字节原样返回
+    raw = raw or b""
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("gbk", errors="replace")
+
+
+class NativeLibrary:
+    """加载好的共享库；path 为 None 时使用 BattleShipsBuild 缓存中为当前源码构建的共享库"""
+    def __init__(self, path=None):
+        if path is None:
+            from BattleShipsBuild import find_cached_library
+            path = find_cached_library()
+            if path is None:
+                raise FileNotFoundError("缓存中没有引擎共享库，请先运行 python BattleShipsBuild.py --library")
+        self.path = path
+        lib = ctypes.CDLL(path)
+        lib.bs_create.restype = ctypes.c_void_p
+        lib.bs_create.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_int)]
+        lib.bs_free.restype = None
+        lib.bs_free.argtypes = [ctypes.c_void_p]
+        lib.bs_size.restype = ctypes.c_int
+        lib.bs_size.argtypes = [ctypes.c_void_p]
+        lib.bs_last_error.restype = ctypes.c_char_p
+        lib.bs_last_error.argtypes = []
+        lib.bs_cancel.restype = None
+        lib.bs_cancel.argtypes = [ctypes.c_void_p]
+        lib.bs_solve.restype = ctypes.c_longlong
+        lib.bs_solve.argtypes = [ctypes.c_void_p, ctypes.c_longlong, SOLUTION_FN, ctypes.c_void_p]
+        lib.bs_solve_into.restype = ctypes.c_longlong
+        lib.bs_solve_into.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_longlong]
+        lib.bs_count.restype = ctypes.c_longlong
+        lib.bs_count.argtypes = [ctypes.c_void_p, ctypes.c_longlong]
+        self.lib = lib
+
+    def last_error(self):
+        return _decode_error(self.lib.bs_last_error())
+
+
+class NativeSolver:
+    """
+    一个谜题的进程内求解器：创建时读入 PuzzleModel 的 K、行/列目标与盘面，之后可多次求解或计数。
+    盘面无效时抛出 ValueError（信息同命令行引擎）。被 cancel() 中断的调用返回 None。
+    """
+    def __init__(self, model, library=None):
+        self._h = None
+        self._lib = library if library is not None else NativeLibrary()
+        self.n = model.n
+        n = model.n
+        matrix = [-1] + [int(max(0, t)) for t in model.col_targets]
+        for r in range(n):
+            matrix.append(int(max(0, model.row_targets[r])))
+            matrix.extend(int(v) if v in (-1, 0, 1, 2, 3, 4, 5, 6) else -1 for v in model.board[r])
+        buf = (ctypes.c_int * len(matrix))(*matrix)
+        self._h = self._lib.lib.bs_create(int(model.K), n, buf)
+        if not self._h:
+            raise ValueError(self._lib.last_error())
+
+    def _check(self, result):
+        if result == BS_ERROR:
+            raise RuntimeError(self._lib.last_error())
+        if result == BS_CANCELLED:
+            return None
+        return result
+
+    def count(self, limit=None):
+        """解的数量（最多 limit 个）"""
+        return self._check(self._lib.lib.bs_count(self._h, -1 if limit is None else int(limit)))
+
+    def is_unique(self):
+        """是否恰有一个解（找到第二个解即停止）"""
+        count = self.count(2)
+        return None if count is None else count == 1
+
+    def solutions(self, limit=None, store=None):
+        """
+        按命令行引擎的顺序求出最多 limit 个解，追加到 store（默认新建 SolutionStore）并返回它。
+        给定 limit 时解直接写入预先分配的缓冲区，否则每个解回调一次。
+        """
+        if limit is not None and limit < 0:
+            raise ValueError("limit 不能为负（不限数量请传 None）")
+        if store is None:
+            store = SolutionStore(self.n)
+        rb = store.record_bytes
+        if limit is not None:
+            out = ctypes.create_string_buffer(max(1, int(limit)) * rb)
+            got = self._check(self._lib.lib.bs_solve_into(self._h, out, int(limit)))
+            if got is None:
+                return None
+            store.extend_bytes(out.raw[:got * rb])
+            return store
+        records = []
+
+        def on_solution(board, _user):
+            records.append(ctypes.string_at(board, rb))
+            return 1
+        got = self._check(self._lib.lib.bs_solve(self._h, -1, SOLUTION_FN(on_solution), None))
+        if got is None:
+            return None
+        store.extend_packed(records)
+        return store
+
+    def solve(self, limit=None):
+        """解的 n×n 列表（0 舰体，1 海水）"""
+        store = self.solutions(limit)
+        if store is None:
+            return None
+        try:
+            return [store[i] for i in range(len(store))]
+        finally:
+            store.close()
+
+    def cancel(self):
+        """中断正在进行的调用（可从其他线程调用）；调用之间的 cancel 会中断下一次调用"""
+        if self._h:
+            self._lib.lib.bs_cancel(self._h)
+
+    def close(self):
+        if self._h:
+            self._lib.lib.bs_free(self._h)
+            self._h = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self.close()
@@ -1,11 +1,12 @@
 import os
+import queue
 import threading
-import subprocess
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 
-# 右键循环值：包含 6（S 独舰），并以 -1 结束回到未知
-CYCLE_ORDER = [0, 2, 3, 4, 5, 6, -1]
+from BattleShipsEngine import (EnginePool, PuzzleModel, SolutionCache, SolutionStore, SolutionStreamParser,
+                               default_cache_dir, default_solver_name)
+from BattleShipsBuild import DEFAULT_SOURCE, EngineBuilder, find_cached_engine
 
 # 单元格显示
 VALUE_TEXT = {
@@ -47,10 +48,95 @@ KEY_TO_VALUE = {
     "s": 6, "S": 6,     # 独舰
 }
 
-def default_solver_name():
-    if os.name == "nt":
-        return "battleship_solver.exe"
-    return "./battleship_solver"
+# 流式求解：Tk 线程每隔 SOLUTION_POLL_MS 毫秒从队列取一批解，每批最多 SOLUTION_BATCH_MAX 个
+SOLUTION_POLL_MS = 50
+SOLUTION_BATCH_MAX = 5000
+# “查看引擎输出”最多保留的 stdout 字符数（流式输出可能非常大）
+STDOUT_KEEP_CHARS = 200000
+
+# 求解模式：显示名 -> 引擎参数（N 取自“N:”输入框）
+SOLVE_MODES = {
+    "全部解": lambda n: [],
+    "前 N 个解": lambda n: ["--limit", str(n)],
+    "仅计数": lambda n: ["--count-only"],
+    "唯一性检查": lambda n: ["--unique"],
+    "热力图": lambda n: ["--heatmap"],
+    "对称去重": lambda n: ["--symmetry", "orbits"],
+}
+# 唯一性检查时，两个解不同的格子的配色（舰体 / 海水）
+DIFF_BG = {0: "#b02020", 1: "#ffb3b3"}
+# 热力图：必为舰体 / 必为海水的格子 (bg, fg)；其余格子按为舰体的比例在 HEAT_LOW 与 HEAT_HIGH 之间插值
+HEAT_FORCED_SHIP = ("#000000", "#ffd700")
+HEAT_FORCED_WATER = ("#a6c8ff", "#113355")
+HEAT_LOW = (0xff, 0xf3, 0xb0)
+HEAT_HIGH = (0xd7, 0x30, 0x1f)
+# 搜索被截断（时限已到 / 停止分析）时的部分结果 (text, bg, fg)：
+# 根节点传播即可确定的格子、只在已找到的解中取值一致的格子、未确定的格子
+PARTIAL_DEDUCED = {0: ("0", "#1d4d2f", "#ffffff"), 1: ("1", "#9fd8b0", "#0d3318")}
+PARTIAL_AGREED = {0: ("0", "#7a6a2a", "#ffffff"), 1: ("1", "#f0e2a8", "#4a3d00")}
+PARTIAL_UNKNOWN = ("?", "#f5f5f5", "#999999")
+STOP_REASONS = {"time": "时限已到", "nodes": "搜索节点数已达上限", "request": "已停止"}
+# 引擎 --stats 统计项的显示名称（未列出的键按原样显示）
+STATS_LABELS = {
+    "nodes": "搜索节点", "backtracks": "回溯", "decisions": "分支尝试", "solutions": "解",
+    "max_trail_depth": "最大赋值深度", "propagation": "传播规则（触发 / 冲突）",
+    "row": "行", "col": "列", "diagonal": "对角", "hint": "方向提示", "straight": "直线", "fleet": "舰队",
+    "fires": "触发", "conflicts": "冲突", "final_check": "终检", "calls": "调用", "rejected": "拒绝",
+    "counts": "行/列计数", "time_ms": "耗时（毫秒）", "total": "总计", "propagate": "传播",
+    "choose_var": "选择变量", "fleet_fits": "舰队容量检查", "threads": "线程数",
+    "memo": "置换表", "probes": "查询", "hits": "命中", "stores": "写入", "row_states": "逐行计数轮廓",
+    "symmetry_prunes": "对称剪枝",
+}
+
+# 棋盘格子的边长（像素）、字体与键盘焦点边框颜色
+CELL_PX = 34
+CELL_FONT = ("Segoe UI", 10, "bold")
+FOCUS_OUTLINE = "#ff8800"
+# 解显示区的空白格
+SOL_EMPTY = ("", "#f5f5f5", "#000000")
+# 键盘修改棋盘大小时，停止输入这么久（毫秒）之后才调整网格
+RESIZE_DEBOUNCE_MS = 300
+# 实时推理：编辑停顿这么久（毫秒）之后，在后台只做根节点传播（引擎 --deduce，不搜索）
+DEDUCE_DEBOUNCE_MS = 150
+# 实时推理确定的未知格子在编辑盘上的 (text, bg, fg)：舰体 / 海水，比手动设置的颜色浅
+DEDUCE_FORCED = {0: ("■", "#9a9a9a", "#ffffff"), 1: ("·", "#dbe8ff", "#5577aa")}
+DEDUCE_TEXT_FG = "#1d4d2f"
+DEDUCE_CONTRADICTION_FG = "#c00000"
+# 引擎报告的矛盾规则（终检拒绝为 final_<原因>）
+DEDUCE_RULES = {
+    "row": "行目标", "col": "列目标", "diagonal": "对角相邻", "hint": "方向提示", "straight": "舰体弯折",
+    "fleet": "舰队构成", "counts": "行/列计数",
+}
+
+def heat_cell_style(count, total):
+    """热力图格子的 (text, bg, fg)：文字为该格是舰体的解所占的百分比"""
+    if count >= total:
+        return ("100",) + HEAT_FORCED_SHIP
+    if count <= 0:
+        return ("0",) + HEAT_FORCED_WATER
+    p = count / total
+    rgb = tuple(round(lo + (hi - lo) * p) for lo, hi in zip(HEAT_LOW, HEAT_HIGH))
+    return str(max(1, min(99, round(p * 100)))), "#%02x%02x%02x" % rgb, "#ffffff" if p > 0.6 else "#000000"
+
+
+def format_duration(seconds):
+    s = int(seconds + 0.5)
+    if s < 60:
+        return f"{s} 秒"
+    if s < 3600:
+        return f"{s // 60} 分 {s % 60} 秒"
+    return f"{s // 3600} 小时 {s % 3600 // 60} 分"
+
+
+def progress_text(progress):
+    """引擎 PROGRESS 记录的显示文本：已探索比例、节点速率与按已探索比例外推的剩余时间"""
+    elapsed = progress["elapsed_ms"] / 1000.0
+    explored = progress["explored"]
+    rate = progress["nodes"] / elapsed if elapsed > 0 else 0
+    text = f"已探索 {explored:.1%}，{progress['nodes']:,} 节点（{rate:,.0f}/秒），{progress['solutions']} 个解"
+    if explored > 0:
+        text += "，预计剩余 " + format_duration(elapsed * (1 - explored) / explored)
+    return text
 
 
 class ScrollableArea(ttk.Frame):
@@ -130,103 +216,106 @@ class ScrollableArea(ttk.Frame):
         self.canvas.unbind_all("<Button-5>")
 
 
-class PuzzleModel:
-    def __init__(self, n=10, K=4):
-        self.n = n
-        self.K = K
-        self.board = [[-1 for _ in range(n)] for __ in range(n)]  # -1/0/1/2/3/4/5/6
-        self.row_targets = [0 for _ in range(n)]
-        self.col_targets = [0 for _ in range(n)]
-
-    def resize(self, n_new):
-        old_n = self.n
-        old_board = self.board
-        old_row_t = self.row_targets
-        old_col_t = self.col_targets
-
-        self.n = n_new
-        self.board = [[-1 for _ in range(n_new)] for __ in range(n_new)]
-        self.row_targets = [0 for _ in range(n_new)]
-        self.col_targets = [0 for _ in range(n_new)]
-
-        lim = min(old_n, n_new)
-        for r in range(lim):
-            for c in range(lim):
-                self.board[r][c] = old_board[r][c]
-        for r in range(min(lim, len(old_row_t))):
-            self.row_targets[r] = old_row_t[r]
-        for c in range(min(lim, len(old_col_t))):
-            self.col_targets[c] = old_col_t[c]
-
-    def toggle_left(self, r, c):
-        # 左键：未知 <-> 海水
-        if self.board[r][c] == -1:
-            self.board[r][c] = 1
-        elif self.board[r][c] == 1:
-            self.board[r][c] = -1
-
-    def cycle_right(self, r, c):
-        cur = self.board[r][c]
-        # 水(1)不在循环内，从循环首开始
-        if cur == 1:
-            nxt = CYCLE_ORDER[0]
-        else:
-            try:
-                idx = CYCLE_ORDER.index(cur)
-                nxt = CYCLE_ORDER[(idx + 1) % len(CYCLE_ORDER)]
-            except ValueError:
-                nxt = CYCLE_ORDER[0]
-        self.board[r][c] = nxt
-
-    def build_engine_matrix_lines(self):
+class BoardCanvas(tk.Canvas):
+    """
+    用一个 Canvas 绘制 n×n 棋盘：每格一个矩形 + 一个文字项，点击位置按坐标换算为 (r, c)。
+    - margin：左侧与上方预留的像素（编辑盘在这里放行/列目标输入框）；
+    - paint() 只重新配置外观有变化的格子，重绘整盘的开销与变化的格子数成正比；
+    - 第 k 圈（max(r, c) == k）的画布项共用标签 ring<k>：resize() 扩大时只创建或重新显示新增的圈，
+      缩小时只隐藏多出的圈，开销与大小的变化量成正比。
+    """
+    def __init__(self, master, margin=0, outline="#555555", bg="#ffffff"):
+        super().__init__(master, bg=bg, highlightthickness=0, width=1, height=1)
+        self.margin = margin
+        self.outline = outline
+        self.n = 0          # 当前显示的大小
+        self._cap = 0       # 已创建画布项的大小（>= n）
+        self._rects = []    # [r][c] -> 矩形项
+        self._texts = []    # [r][c] -> 文字项
+        self._styles = []   # [r][c] -> 当前 (text, bg, fg)
+        self._focus_rect = None
+
+    def build(self, n, style, on_new_ring=None):
+        """丢弃全部画布项并重建 n×n 的格子；style(r, c) 给出每格初始的 (text, bg, fg)"""
+        self.delete("cell")
+        self._focus_rect = None
+        self.n = self._cap = 0
+        self._rects = []
+        self._texts = []
+        self._styles = []
+        self.resize(n, style, on_new_ring)
+
+    def resize(self, n, style, on_new_ring=None):
         """
-        生成引擎输入文本行（K在第一行，随后 (n+1)x(n+1) 矩阵）
-        内部格子允许值为：-1,0,1,2,3,4,5,6
+        改为显示 n×n：隐藏 n 之外的圈，重新显示（并按 style 重绘）以前建过的圈，只为从未建过的圈创建画布项。
+        on_new_ring(k) 在创建第 k 圈之后调用，调用方可为该圈添加带 ring<k> 标签的画布项。
         """
-        lines = []
-        lines.append(str(int(self.K)))
-        # 第一行：-1, col_targets...
-        top = [-1] + [int(max(0, t)) for t in self.col_targets]
-        lines.append(" ".join(map(str, top)))
-        # 接下来 n 行：每行 row_target + n 个格子
-        for r in range(self.n):
-            row = [int(max(0, self.row_targets[r]))]
-            for c in range(self.n):
-                v = int(self.board[r][c])
-                if v not in (-1, 0, 1, 2, 3, 4, 5, 6):
-                    v = -1
-                row.append(v)
-            lines.append(" ".join(map(str, row)))
-        return lines
+        old = self.n
+        for k in range(n, old):
+            self.itemconfigure(f"ring{k}", state="hidden")
+        for k in range(old, min(n, self._cap)):
+            self.itemconfigure(f"ring{k}", state="normal")
+            for r, c in self._ring_cells(k):
+                self.paint(r, c, *style(r, c))
+        for k in range(self._cap, n):
+            self._create_ring(k, style)
+            self._cap = k + 1
+            if on_new_ring is not None:
+                on_new_ring(k)
+        self.n = n
+        size = self.margin + n * CELL_PX + 1
+        self.configure(width=size, height=size)
 
     @staticmethod
-    def parse_solutions_from_output(text, n):
-        text = text.strip()
-        if "No solution" in text:
-            return []
-        lines = [ln.strip() for ln in text.splitlines() if ln.strip() != ""]
-        sols = []
-        i = 0
-        if i < len(lines) and lines[i].startswith("Solutions:"):
-            i += 1
-        while i + n <= len(lines):
-            grid = []
-            ok = True
-            for r in range(n):
-                parts = lines[i + r].replace(",", " ").replace(";", " ").split()
-                if len(parts) != n:
-                    ok = False
-                    break
-                try:
-                    row = [int(x) for x in parts]
-                except:
-                    ok = False
-                    break
-                grid.append(row)
-            if ok:
-                sols.append(grid)
-            i += n
-        return sols
+    def _ring_cells(k):
+        return [(k, c) for c in range(k + 1)] + [(r, k) for r in range(k)]
+
+    def _create_ring(self, k, style):
+        for row in (self._rects, self._texts, self._styles):
+            for r in range(k):
+                row[r].append(None)
+            row.append([None] * (k + 1))
+        half = CELL_PX // 2
+        tags = ("cell", f"ring{k}")
+        for r, c in self._ring_cells(k):
+            x, y = self.cell_origin(r, c)
+            text, bg, fg = s = style(r, c)
+            self._rects[r][c] = self.create_rectangle(x + 1, y + 1, x + CELL_PX - 1, y + CELL_PX - 1,
+                                                      outline=self.outline, fill=bg, tags=tags)
+            self._texts[r][c] = self.create_text(x + half, y + half, text=text, fill=fg, font=CELL_FONT, tags=tags)
+            self._styles[r][c] = s
+
+    def cell_origin(self, r, c):
+        return self.margin + c * CELL_PX, self.margin + r * CELL_PX
+
+    def cell_at(self, x, y):
+        """画布坐标 -> (r, c)；不在格子上时返回 None"""
+        r = (y - self.margin) // CELL_PX
+        c = (x - self.margin) // CELL_PX
+        if x < self.margin or y < self.margin or r >= self.n or c >= self.n:
+            return None
+        return int(r), int(c)
+
+    def paint(self, r, c, text, bg, fg):
+        style = (text, bg, fg)
+        if self._styles[r][c] == style:
+            return
+        self._styles[r][c] = style
+        self.itemconfigure(self._rects[r][c], fill=bg)
+        self.itemconfigure(self._texts[r][c], text=text, fill=fg)
+
+    def show_focus(self, r, c):
+        # 键盘输入作用的格子：画一个高亮边框
+        x, y = self.cell_origin(r, c)
+        if self._focus_rect is None:
+            self._focus_rect = self.create_rectangle(0, 0, 0, 0, outline=FOCUS_OUTLINE, width=2, tags="cell")
+        self.itemconfigure(self._focus_rect, state="normal")
+        self.coords(self._focus_rect, x + 1, y + 1, x + CELL_PX - 1, y + CELL_PX - 1)
+        self.tag_raise(self._focus_rect)
+
+    def hide_focus(self):
+        if self._focus_rect is not None:
+            self.itemconfigure(self._focus_rect, state="hidden")
 
 
 class BattleshipUI(tk.Tk):
@@ -234,26 +323,53 @@ class BattleshipUI(tk.Tk):
         super().__init__()
         self.title("战舰解谜 UI（适配 C++ 引擎）")
         self.model = PuzzleModel(n=10, K=4)
-        self.solver_path = tk.StringVar(value=default_solver_name())
+        # 优先使用构建缓存中为当前源码选中的引擎
+        self.solver_path = tk.StringVar(value=find_cached_engine() or default_solver_name())
+        self.collect_stats = tk.BooleanVar(value=False)  # 求解时附加 --stats
+        self.live_deduce = tk.BooleanVar(value=False)    # 编辑时在后台推理并叠加显示
 
-        self._cell_labels = []   # 编辑盘格子 Label
         self._row_entries = []   # 行目标 Entry
         self._col_entries = []   # 列目标 Entry
+        self._focus_cell = None  # 键盘输入作用的编辑盘格子 (r, c)
+        self._resize_job = None  # 修改棋盘大小的防抖 after 任务
 
-        self._sol_labels = []    # 解盘格子 Label
-        self._solutions = []
+        self._solutions = SolutionStore(self.model.n)  # 按位打包的解，显示时才解包
         self._sol_index = 0
         self._sol_status = tk.StringVar(value="尚未求解")
+        self._sol_note = ""              # 附加在解状态后的说明（如唯一性结果）
+        self._diff_cells = set()         # 唯一性检查：两个解不同的格子
+        self._heat = None                # 热力图模式：(已统计的解数, n×n 每格为舰体的解数)
+        self._heat_box = [None]          # 当前请求的工作线程收到的最新热力图，Tk 线程轮询时读取
+        self._progress = None            # 已显示的引擎进度（--progress 的 PROGRESS 记录）
+        self._progress_box = [None]      # 同 _heat_box：工作线程收到的最新进度
+        self._progress_text = tk.StringVar(value="")
+        self._partial = None             # 搜索被截断时的部分结果：(原因, deduced, agreed, 已找到的解数)，见 SolutionStreamParser
+        self._show_partial = False       # 解显示区是否显示部分结果（翻页后显示已找到的解）
+        self._orbits = []                # 对称去重：每个解所在对称类的解数（与 self._solutions 对应）
+        self._time_limit = 0             # 本次求解的时限（秒），0 为不限
 
         # 调试视图
         self._last_input = ""
         self._last_stdout = ""
         self._last_stderr = ""
+        self._last_stats = None          # 最近一次求解的搜索统计（--stats）
 
         # 求解过程控制
-        self._proc = None               # subprocess.Popen 对象
+        self._pool = None               # 常驻引擎进程池（EnginePool）
+        self._cache = SolutionCache(default_cache_dir())  # 引擎输出缓存，重复求解同一谜题时不再启动引擎
+        self._job = None                # 当前求解请求（EngineJob）
         self._solver_thread = None      # 运行引擎的线程
         self._stopping = False          # 是否正在停止
+        self._sol_queue = queue.Queue() # 工作线程 -> Tk 线程的流式解队列
+        self._poll_job = None           # 轮询队列的 after 任务
+
+        # 实时推理
+        self._deduce_pool = None        # 推理专用的常驻引擎进程（EnginePool，1 个进程），不占用求解的进程
+        self._deduce_job = None         # 正在进行的推理请求（EngineJob）
+        self._deduce_after = None       # 防抖 after 任务
+        self._deduce_gen = 0            # 每次编辑加 1，只采用最新一次编辑之后发起的推理结果
+        self._deduced = None            # 叠加显示的推理结果（n×n，0 舰体，1 海水，-1 未确定），None 为不叠加
+        self._deduce_text = tk.StringVar(value="")
 
         self._build_widgets()
         self._rebuild_grids()
@@ -271,7 +387,7 @@ class BattleshipUI(tk.Tk):
         self.entry_K.set(str(self.model.K))
         self.entry_K.pack(side=tk.LEFT, padx=(4, 12))
         # K 键入也更新
-        self.entry_K.bind("<KeyRelease>", lambda e: self._sync_from_entries())
+        self.entry_K.bind("<KeyRelease>", lambda e: (self._sync_from_entries(), self._schedule_deduce()))
 
         ttk.Label(ctrl, text="网格大小 n:").pack(side=tk.LEFT)
         self.entry_n = ttk.Spinbox(ctrl, from_=2, to=80, width=5, command=self._on_n_change)
@@ -279,8 +395,8 @@ class BattleshipUI(tk.Tk):
         self.entry_n.pack(side=tk.LEFT, padx=(4, 12))
         # 键盘输入即时更新地图大小（有效整数时）
         self.entry_n.bind("<KeyRelease>", self._on_n_change_event)
-        self.entry_n.bind("<FocusOut>", self._on_n_change_event)
-        self.entry_n.bind("<Return>", self._on_n_change_event)
+        self.entry_n.bind("<FocusOut>", lambda _ev: self._on_n_change())
+        self.entry_n.bind("<Return>", lambda _ev: self._on_n_change())
 
         ttk.Button(ctrl, text="清空棋盘", command=self._clear_board).pack(side=tk.LEFT, padx=4)
         ttk.Button(ctrl, text="未知全设为海水", command=self._fill_unknown_as_water).pack(side=tk.LEFT, padx=4)
@@ -292,7 +408,8 @@ class BattleshipUI(tk.Tk):
         ttk.Label(engine, text="引擎路径:").pack(side=tk.LEFT)
         ttk.Entry(engine, textvariable=self.solver_path, width=42).pack(side=tk.LEFT, padx=4)
         ttk.Button(engine, text="浏览", command=self._browse_solver).pack(side=tk.LEFT, padx=4)
-        ttk.Button(engine, text="编译引擎(BattleShips.cpp)", command=self._compile_engine).pack(side=tk.LEFT, padx=8)
+        self.btn_compile = ttk.Button(engine, text="编译引擎(BattleShips.cpp)", command=self._compile_engine)
+        self.btn_compile.pack(side=tk.LEFT, padx=8)
         self.btn_solve = ttk.Button(engine, text="求解", command=self._solve)
         self.btn_solve.pack(side=tk.LEFT, padx=4)
         self.btn_stop = ttk.Button(engine, text="停止分析", command=self._stop_solver, state="disabled")
@@ -300,15 +417,25 @@ class BattleshipUI(tk.Tk):
         ttk.Button(engine, text="导入引擎文本", command=self._open_import_dialog).pack(side=tk.LEFT, padx=4)
         ttk.Button(engine, text="查看引擎输入", command=self._show_last_input).pack(side=tk.LEFT, padx=4)
         ttk.Button(engine, text="查看引擎输出", command=self._show_last_output).pack(side=tk.LEFT, padx=4)
+        ttk.Checkbutton(engine, text="搜索统计", variable=self.collect_stats).pack(side=tk.LEFT, padx=4)
+        ttk.Checkbutton(engine, text="实时推理", variable=self.live_deduce,
+                        command=self._on_live_deduce_toggle).pack(side=tk.LEFT, padx=4)
 
         # 编辑棋盘（带居中与滚动区域）
         self.board_group = ttk.LabelFrame(self, text="编辑棋盘（左键：未知↔海水，右键：0→2→3→4→5→6→-1，键盘：W=水，U=未知，S=独舰）")
         self.board_group.pack(side=tk.TOP, padx=8, pady=8, fill=tk.BOTH, expand=True)
+        self.lbl_deduce = ttk.Label(self.board_group, textvariable=self._deduce_text, foreground=DEDUCE_TEXT_FG)
+        self.lbl_deduce.pack(side=tk.TOP, anchor="w", padx=4)
         self.board_sa = ScrollableArea(self.board_group, width=900, height=420, bg="#ffffff")
         self.board_sa.pack(fill=tk.BOTH, expand=True, padx=4, pady=4)
-        # 实际表格容器放在可滚动区域的 frame 中
-        self.board_frame = ttk.Frame(self.board_sa.frame)
-        self.board_frame.pack()  # 由 ScrollableArea 居中
+        # 编辑盘画布放在可滚动区域的 frame 中；左侧/上方一格宽放行/列目标输入框
+        self.board_canvas = BoardCanvas(self.board_sa.frame, margin=CELL_PX)
+        self.board_canvas.pack()  # 由 ScrollableArea 居中
+        self.board_canvas.bind("<Button-1>", self._on_canvas_left)
+        self.board_canvas.bind("<Button-3>", self._on_canvas_right)
+        self.board_canvas.bind("<Button-2>", self._on_canvas_right)  # mac 某些触控板
+        # 键盘（S 直接设置独舰），作用于最近点击的格子
+        self.board_canvas.bind("<Key>", self._on_canvas_key)
 
         # 解显示（带居中与滚动区域）
         sol_ctrl = ttk.Frame(self)
@@ -316,47 +443,70 @@ class BattleshipUI(tk.Tk):
         ttk.Button(sol_ctrl, text="上一解", command=self._prev_solution).pack(side=tk.LEFT, padx=4)
         ttk.Button(sol_ctrl, text="下一解", command=self._next_solution).pack(side=tk.LEFT, padx=4)
         ttk.Label(sol_ctrl, textvariable=self._sol_status).pack(side=tk.LEFT, padx=10)
+        self.progress_bar = ttk.Progressbar(sol_ctrl, length=160, maximum=1.0, mode="determinate")
+        self.progress_bar.pack(side=tk.LEFT, padx=4)
+        ttk.Label(sol_ctrl, textvariable=self._progress_text).pack(side=tk.LEFT, padx=4)
+        self.entry_limit = ttk.Spinbox(sol_ctrl, from_=1, to=10**9, width=8)
+        self.entry_limit.set("100")
+        self.entry_limit.pack(side=tk.RIGHT, padx=(4, 0))
+        ttk.Label(sol_ctrl, text="N:").pack(side=tk.RIGHT)
+        self.combo_mode = ttk.Combobox(sol_ctrl, values=list(SOLVE_MODES), state="readonly", width=10)
+        self.combo_mode.set("全部解")
+        self.combo_mode.pack(side=tk.RIGHT, padx=(4, 12))
+        ttk.Label(sol_ctrl, text="求解模式:").pack(side=tk.RIGHT)
+        self.entry_time_limit = ttk.Spinbox(sol_ctrl, from_=0, to=10**6, width=6)
+        self.entry_time_limit.set("0")
+        self.entry_time_limit.pack(side=tk.RIGHT, padx=(4, 12))
+        ttk.Label(sol_ctrl, text="时限(秒，0=不限):").pack(side=tk.RIGHT)
 
         self.solution_group = ttk.LabelFrame(self, text="求解结果（0=战舰，1=海水）")
         self.solution_group.pack(side=tk.TOP, padx=8, pady=(0, 8), fill=tk.BOTH, expand=True)
         self.solution_sa = ScrollableArea(self.solution_group, width=900, height=300, bg="#ffffff")
         self.solution_sa.pack(fill=tk.BOTH, expand=True, padx=4, pady=4)
-        self.solution_frame = ttk.Frame(self.solution_sa.frame)
-        self.solution_frame.pack()  # 由 ScrollableArea 居中
+        self.sol_canvas = BoardCanvas(self.solution_sa.frame, outline="#999999")
+        self.sol_canvas.pack()  # 由 ScrollableArea 居中
 
     def _set_running_state(self, running: bool):
         if running:
             self.btn_solve.configure(state="disabled")
             self.btn_stop.configure(state="normal")
-            self._sol_status.set("求解中（无超时限制）...")
+            if self._time_limit:
+                self._sol_status.set(f"求解中（时限 {self._time_limit:g} 秒）...")
+            else:
+                self._sol_status.set("求解中（无超时限制）...")
         else:
             self.btn_solve.configure(state="normal")
             self.btn_stop.configure(state="disabled")
+            self.progress_bar.configure(value=0)
+            self._progress_text.set("")
 
     def _on_n_change_event(self, _ev=None):
-        # 键盘实时变化：当输入为合法整数时立刻重建网格
-        try:
-            n_new = int(self.entry_n.get())
-        except:
-            return
-        if n_new != self.model.n:
-            self._on_n_change()
+        # 键盘输入：输入停顿 RESIZE_DEBOUNCE_MS 后再调整，连续敲 "1"、"5" 时不会先缩到 1 再扩到 15
+        if self._resize_job is not None:
+            self.after_cancel(self._resize_job)
+        self._resize_job = self.after(RESIZE_DEBOUNCE_MS, self._on_n_change)
 
     def _on_n_change(self):
+        # 微调按钮、回车与失去焦点立即生效，并取消尚未执行的防抖任务
+        if self._resize_job is not None:
+            self.after_cancel(self._resize_job)
+            self._resize_job = None
         try:
             n_new = int(self.entry_n.get())
         except:
             return
         n_new = max(2, min(80, n_new))
         if n_new != self.model.n:
+            self._sync_from_entries()
             self.model.resize(n_new)
-            self._rebuild_grids()
+            self._resize_grids()
 
     def _clear_board(self):
         for r in range(self.model.n):
             for c in range(self.model.n):
                 self.model.board[r][c] = -1
         self._refresh_board()
+        self._schedule_deduce()
 
     def _fill_unknown_as_water(self):
         for r in range(self.model.n):
@@ -364,6 +514,7 @@ class BattleshipUI(tk.Tk):
                 if self.model.board[r][c] == -1:
                     self.model.board[r][c] = 1
         self._refresh_board()
+        self._schedule_deduce()
 
     def _recalc_targets_from_board(self):
         # 把当前棋盘上“被认为是舰体的格子”（0/2/3/4/5/6）计入行/列目标
@@ -379,6 +530,7 @@ class BattleshipUI(tk.Tk):
         self.model.row_targets = row
         self.model.col_targets = col
         self._refresh_targets()
+        self._schedule_deduce()
 
     def _browse_solver(self):
         path = filedialog.askopenfilename(title="选择引擎可执行文件")
@@ -386,96 +538,146 @@ class BattleshipUI(tk.Tk):
             self.solver_path.set(path)
 
     def _compile_engine(self):
-        cpp_path = filedialog.askopenfilename(title="选择 BattleShips.cpp 源文件", filetypes=[("C++ Source", "*.cpp"), ("All files", "*.*")])
+        cpp_path = filedialog.askopenfilename(title="选择 BattleShips.cpp 源文件", filetypes=[("C++ Source", "*.cpp"), ("All files", "*.*")],
+                                              initialdir=os.path.dirname(DEFAULT_SOURCE), initialfile=os.path.basename(DEFAULT_SOURCE))
         if not cpp_path:
             return
-        out_exe = default_solver_name()
-        cmd = ["g++", "-std=c++17", "-O2", "-o", out_exe, cpp_path]
-        try:
-            proc = subprocess.run(cmd, capture_output=True, text=True)
-            if proc.returncode != 0:
-                messagebox.showerror("编译失败", f"命令: {' '.join(cmd)}\n\nstderr:\n{proc.stderr}")
+        # 只编译 -O2 很快；优化变体（-O3 -march=native 与剖析优化）需要约一分钟，之后按源码哈希缓存
+        tune = messagebox.askyesno("编译引擎", "是否同时构建优化版本（-O3 -march=native、剖析优化）并测速选出最快的？\n"
+                                           "首次需要约一分钟，源码不变时之后直接使用缓存。")
+        builder = EngineBuilder(cpp_path)
+        self.btn_compile.configure(state="disabled", text="编译中…")
+
+        def run_build():
+            try:
+                if tune:
+                    rec = builder.select()
+                    path = rec["path"]
+                    detail = "\n".join(f"{v}: {t:.3f}s" for v, t in rec["totals"].items())
+                    msg = f"已选中 {rec['variant']}：{path}\n\n测速合计：\n{detail}"
+                else:
+                    path = builder.build("O2")
+                    msg = f"已生成: {path}"
+                result = (path, msg, None)
+            except Exception as e:
+                result = (None, None, str(e))
+            self.after(0, lambda: finish(*result))
+
+        def finish(path, msg, error):
+            self.btn_compile.configure(state="normal", text="编译引擎(BattleShips.cpp)")
+            if error is not None:
+                messagebox.showerror("编译失败", error)
                 return
-            self.solver_path.set(os.path.abspath(out_exe))
-            messagebox.showinfo("编译成功", f"已生成: {self.solver_path.get()}")
-        except Exception as e:
-            messagebox.showerror("编译异常", str(e))
+            self.solver_path.set(path)
+            # 常驻进程仍在运行旧引擎，下次求解时重新启动
+            if self._pool is not None and self._job is None:
+                self._pool.close()
+                self._pool = None
+            messagebox.showinfo("编译成功", msg)
+
+        threading.Thread(target=run_build, daemon=True).start()
 
     def _rebuild_grids(self):
-        # 清空编辑棋盘与解显示
-        for w in self.board_frame.winfo_children():
-            w.destroy()
-        for w in self.solution_frame.winfo_children():
-            w.destroy()
-        self._cell_labels.clear()
+        # 清空编辑棋盘的行/列目标输入框
+        for e in self._row_entries + self._col_entries:
+            e.destroy()
         self._row_entries.clear()
         self._col_entries.clear()
-        self._sol_labels.clear()
+        self._focus_cell = None
 
+        # 格子与顶部列目标、左侧行目标（左上角留空）按圈创建
         n = self.model.n
+        self._drop_deduced()
+        self.board_canvas.build(n, self._cell_style, self._add_target_entries)
 
-        # 编辑棋盘：左上角隐藏（原本是显示 -1 的位置，这里留空）
-        corner = ttk.Label(self.board_frame, text="", width=4, anchor="center")
-        corner.grid(row=0, column=0, padx=1, pady=1, sticky="nsew")
-
-        # 顶部列目标
-        for c in range(n):
-            e = ttk.Entry(self.board_frame, width=4, justify="center")
-            e.insert(0, str(self.model.col_targets[c]))
-            e.grid(row=0, column=c+1, padx=1, pady=1, sticky="nsew")
-            self._col_entries.append(e)
+        # 解显示区域
+        self.sol_canvas.build(n, lambda r, c: SOL_EMPTY)
 
-        # 行目标 + 单元格
-        for r in range(n):
-            e = ttk.Entry(self.board_frame, width=4, justify="center")
-            e.insert(0, str(self.model.row_targets[r]))
-            e.grid(row=r+1, column=0, padx=1, pady=1, sticky="nsew")
-            self._row_entries.append(e)
+        # 刷新并居中滚动区域
+        self.board_sa.recenter()
+        self.solution_sa.recenter()
 
-            row_labels = []
-            for c in range(n):
-                lbl = tk.Label(self.board_frame, width=4, height=2, bd=1, relief="solid")
-                self._style_cell(lbl, self.model.board[r][c])
-                lbl.grid(row=r+1, column=c+1, padx=1, pady=1, sticky="nsew")
-                # 鼠标
-                lbl.bind("<Button-1>", lambda ev, rr=r, cc=c: (self._on_left_click(rr, cc), ev.widget.focus_set()))
-                lbl.bind("<Button-3>", lambda ev, rr=r, cc=c: self._on_right_click(rr, cc))
-                lbl.bind("<Button-2>", lambda ev, rr=r, cc=c: self._on_right_click(rr, cc))  # mac 某些触控板
-                # 键盘（S 直接设置独舰）
-                lbl.bind("<Key>", lambda ev, rr=r, cc=c: self._on_key(rr, cc, ev))
-                row_labels.append(lbl)
-            self._cell_labels.append(row_labels)
+        self._update_solution_view()
 
-        # 解显示区域
-        for r in range(n):
-            row_labels = []
-            for c in range(n):
-                lbl = tk.Label(self.solution_frame, width=4, height=2, bd=1, relief="ridge", bg="#f5f5f5")
-                lbl.grid(row=r, column=c, padx=1, pady=1, sticky="nsew")
-                row_labels.append(lbl)
-            self._sol_labels.append(row_labels)
+    def _add_target_entries(self, k):
+        # 棋盘扩大到第 k 圈时创建第 k 列、第 k 行的目标输入框，与该圈的格子共用 ring<k> 标签一起隐藏/显示
+        canvas = self.board_canvas
+        tags = ("cell", f"ring{k}")
+        e = ttk.Entry(canvas, width=4, justify="center")
+        e.insert(0, str(self.model.col_targets[k]))
+        x, _ = canvas.cell_origin(0, k)
+        canvas.create_window(x + 1, 1, window=e, anchor="nw", width=CELL_PX - 2, height=CELL_PX - 2, tags=tags)
+        self._col_entries.append(e)
+        e = ttk.Entry(canvas, width=4, justify="center")
+        e.insert(0, str(self.model.row_targets[k]))
+        _, y = canvas.cell_origin(k, 0)
+        canvas.create_window(1, y + 1, window=e, anchor="nw", width=CELL_PX - 2, height=CELL_PX - 2, tags=tags)
+        self._row_entries.append(e)
+        for e in (self._col_entries[-1], e):
+            e.bind("<KeyRelease>", lambda _ev: self._schedule_deduce())
+
+    def _resize_grids(self):
+        # 增量调整：复用已创建的格子与输入框，只处理增加或减少的行列
+        n = self.model.n
+        old = self.board_canvas.n
+        self._drop_deduced()
+        self.board_canvas.resize(n, self._cell_style, self._add_target_entries)
+        # 重新显示的输入框里还是缩小前的旧值，按模型（新增部分为 0）重写
+        for k in range(old, min(n, len(self._row_entries))):
+            for e, v in ((self._row_entries[k], self.model.row_targets[k]),
+                         (self._col_entries[k], self.model.col_targets[k])):
+                e.delete(0, tk.END)
+                e.insert(0, str(v))
+        if self._focus_cell is not None and max(self._focus_cell) >= n:
+            self._focus_cell = None
+            self.board_canvas.hide_focus()
+
+        self.sol_canvas.resize(n, lambda r, c: SOL_EMPTY)
 
-        # 刷新并居中滚动区域
         self.board_sa.recenter()
         self.solution_sa.recenter()
 
         self._update_solution_view()
+        self._schedule_deduce()
+
+    def _cell_style(self, r, c):
+        v = self.model.board[r][c]
+        if v == -1 and self._deduced is not None and self._deduced[r][c] in DEDUCE_FORCED:
+            return DEDUCE_FORCED[self._deduced[r][c]]
+        return VALUE_TEXT.get(v, "?"), VALUE_BG.get(v, "#cccccc"), VALUE_FG.get(v, "#000000")
+
+    def _style_cell(self, r, c):
+        self.board_canvas.paint(r, c, *self._cell_style(r, c))
+
+    def _on_canvas_left(self, ev):
+        rc = self.board_canvas.cell_at(ev.x, ev.y)
+        if rc is None:
+            return
+        self._on_left_click(*rc)
+        self._focus_cell = rc
+        self.board_canvas.show_focus(*rc)
+        self.board_canvas.focus_set()
+
+    def _on_canvas_right(self, ev):
+        rc = self.board_canvas.cell_at(ev.x, ev.y)
+        if rc is not None:
+            self._on_right_click(*rc)
 
-    def _style_cell(self, lbl, v):
-        lbl.config(text=VALUE_TEXT.get(v, "?"),
-                   bg=VALUE_BG.get(v, "#cccccc"),
-                   fg=VALUE_FG.get(v, "#000000"),
-                   font=("Segoe UI", 10, "bold"))
+    def _on_canvas_key(self, ev):
+        if self._focus_cell is not None:
+            self._on_key(*self._focus_cell, ev)
 
     def _on_left_click(self, r, c):
         self._sync_from_entries()
         self.model.toggle_left(r, c)
-        self._style_cell(self._cell_labels[r][c], self.model.board[r][c])
+        self._style_cell(r, c)
+        self._schedule_deduce()
 
     def _on_right_click(self, r, c):
         self._sync_from_entries()
         self.model.cycle_right(r, c)
-        self._style_cell(self._cell_labels[r][c], self.model.board[r][c])
+        self._style_cell(r, c)
+        self._schedule_deduce()
 
     def _on_key(self, r, c, ev):
         ch = ev.char
@@ -484,19 +686,119 @@ class BattleshipUI(tk.Tk):
         if ch in KEY_TO_VALUE:
             self._sync_from_entries()
             self.model.board[r][c] = KEY_TO_VALUE[ch]
-            self._style_cell(self._cell_labels[r][c], self.model.board[r][c])
+            self._style_cell(r, c)
+            self._schedule_deduce()
 
     def _refresh_board(self):
+        # 只有值发生变化的格子会被重新配置
         for r in range(self.model.n):
             for c in range(self.model.n):
-                self._style_cell(self._cell_labels[r][c], self.model.board[r][c])
+                self._style_cell(r, c)
         self.board_sa.recenter()
 
+    # ===== 实时推理 =====
+    def _on_live_deduce_toggle(self):
+        if self.live_deduce.get():
+            self._schedule_deduce()
+            return
+        if self._deduce_after is not None:
+            self.after_cancel(self._deduce_after)
+            self._deduce_after = None
+        self._deduce_gen += 1
+        if self._deduce_job is not None:
+            self._deduce_job.cancel()
+            self._deduce_job = None
+        self._show_deduced(None, "")
+
+    def _drop_deduced(self):
+        # 棋盘大小变化：旧的推理结果与正在进行的推理都作废（重绘之前调用）
+        self._deduce_gen += 1
+        self._deduced = None
+
+    def _schedule_deduce(self):
+        # 每次编辑都使尚未返回的推理作废；输入停顿 DEDUCE_DEBOUNCE_MS 后再推理最新的盘面
+        if not self.live_deduce.get():
+            return
+        self._deduce_gen += 1
+        if self._deduce_job is not None:
+            self._deduce_job.cancel()
+            self._deduce_job = None
+        if self._deduce_after is not None:
+            self.after_cancel(self._deduce_after)
+        self._deduce_after = self.after(DEDUCE_DEBOUNCE_MS, self._run_deduce)
+
+    def _run_deduce(self):
+        self._deduce_after = None
+        solver = self.solver_path.get().strip()
+        if not solver or not os.path.exists(solver):
+            self._show_deduced(None, "实时推理：未找到引擎可执行文件", error=True)
+            return
+        self._sync_from_entries()
+        input_text = "\n".join(self.model.build_engine_matrix_lines()) + "\n"
+        if self._deduce_pool is not None and self._deduce_pool.solver_path != solver:
+            # 关闭旧进程可能要等它退出，放到后台线程
+            threading.Thread(target=self._deduce_pool.close, daemon=True).start()
+            self._deduce_pool = None
+        if self._deduce_pool is None:
+            self._deduce_pool = EnginePool(solver, size=1)
+        pool = self._deduce_pool
+        parser = SolutionStreamParser(self.model.n)
+        job = pool.create_job(input_text, args=["--deduce"], on_line=parser.feed)
+        self._deduce_job = job
+        gen = self._deduce_gen
+
+        def run_deduce():
+            try:
+                pool.run(job)
+            except Exception as e:
+                job.status, job.error = "error", str(e)
+            try:
+                self.after(0, lambda: self._on_deduce_done(gen, job, parser))
+            except (RuntimeError, tk.TclError):
+                pass  # 窗口已关闭
+
+        threading.Thread(target=run_deduce, daemon=True).start()
+
+    def _on_deduce_done(self, gen, job, parser):
+        if gen != self._deduce_gen or not self.live_deduce.get():
+            return  # 之后又有编辑，结果已过时
+        self._deduce_job = None
+        if job.status == "cancelled":
+            return
+        if job.status != "ok" or job.error:
+            # 引擎拒绝的输入（如已知舰体超出行目标）同样是矛盾
+            self._show_deduced(None, f"推理：矛盾 —— {(job.error or '引擎异常退出').strip()}", error=True)
+        elif parser.deduce == "contradiction":
+            rule = parser.deduce_rule or ""
+            name = ("终检：" + DEDUCE_RULES.get(rule[6:], rule[6:])) if rule.startswith("final_") \
+                else DEDUCE_RULES.get(rule, rule)
+            self._show_deduced(None, "推理：矛盾" + (f"（{name}）" if name else ""), error=True)
+        elif parser.deduced is not None and len(parser.deduced) == self.model.n:
+            n = self.model.n
+            forced = sum(1 for r in range(n) for c in range(n)
+                         if self.model.board[r][c] == -1 and parser.deduced[r][c] in DEDUCE_FORCED)
+            if parser.deduce == "solved":
+                text = f"推理：仅靠传播即可解出（唯一解），确定 {forced} 个未知格子"
+            else:
+                text = f"推理：可确定 {forced} 个未知格子"
+            self._show_deduced(parser.deduced, text)
+
+    def _show_deduced(self, cells, text, error=False):
+        self._deduced = cells
+        self._deduce_text.set(text)
+        self.lbl_deduce.configure(foreground=DEDUCE_CONTRADICTION_FG if error else DEDUCE_TEXT_FG)
+        # 只有外观变化的格子会被重新配置
+        for r in range(self.model.n):
+            for c in range(self.model.n):
+                self._style_cell(r, c)
+
     def _refresh_targets(self):
-        for i, e in enumerate(self._row_entries):
+        # 缩小后多出的输入框只是被隐藏，只处理前 n 个
+        n = self.model.n
+        for i, e in enumerate(self._row_entries[:n]):
             e.delete(0, tk.END)
             e.insert(0, str(self.model.row_targets[i]))
-        for i, e in enumerate(self._col_entries):
+        for i, e in enumerate(self._col_entries[:n]):
             e.delete(0, tk.END)
             e.insert(0, str(self.model.col_targets[i]))
         self.board_sa.recenter()
@@ -510,14 +812,15 @@ class BattleshipUI(tk.Tk):
         except:
             pass
         # 同步目标值
+        n = self.model.n
         row = []
-        for e in self._row_entries:
+        for e in self._row_entries[:n]:
             try:
                 row.append(max(0, int(e.get())))
             except:
                 row.append(0)
         col = []
-        for e in self._col_entries:
+        for e in self._col_entries[:n]:
             try:
                 col.append(max(0, int(e.get())))
             except:
@@ -528,7 +831,7 @@ class BattleshipUI(tk.Tk):
             self.model.col_targets = col
 
     def _solve(self):
-        if self._proc is not None:
+        if self._job is not None:
             messagebox.showinfo("提示", "引擎正在运行，可点击“停止分析”后再开始。")
             return
 
@@ -545,123 +848,343 @@ class BattleshipUI(tk.Tk):
             messagebox.showwarning("提示", f"未找到引擎可执行文件：{solver}")
             return
 
-        self._solutions = []
-        self._sol_index = 0
+        mode = self.combo_mode.get()
+        try:
+            limit = max(1, int(self.entry_limit.get()))
+        except ValueError:
+            limit = 1
+        args = SOLVE_MODES.get(mode, SOLVE_MODES["全部解"])(limit)
+        if self.collect_stats.get():
+            args = args + ["--stats"]
+        args = args + ["--progress"]
+        try:
+            self._time_limit = max(0.0, float(self.entry_time_limit.get()))
+        except ValueError:
+            self._time_limit = 0
+        if self._time_limit:
+            args = args + ["--time-limit", f"{self._time_limit:g}"]
+
+        n = self.model.n
+        self._reset_solutions(n)
+        self._sol_note = ""
+        self._diff_cells = set()
+        self._sol_queue = queue.Queue()
+        self._progress = None
+        self._progress_box = [None]
         self._update_solution_view()
         self._set_running_state(True)
         self._stopping = False
+        sol_queue = self._sol_queue
+
+        try:
+            pool = self._get_pool(solver)
+        except Exception as e:
+            self._set_running_state(False)
+            messagebox.showerror("引擎启动失败", str(e))
+            return
+
+        # 逐行解析引擎输出，解析出的解交给 Tk 线程分批取走
+        parser = SolutionStreamParser(n)
+        stdout_head = []
+        stdout_len = [0]
+        heat_seen = [0]
+        heat_box = self._heat_box
+        progress_seen = [0]
+        progress_box = self._progress_box
+
+        def on_line(line):
+            sol = parser.feed(line)
+            if parser.progress_version != progress_seen[0]:
+                # 进度行只用于进度条，不计入“查看引擎输出”
+                progress_seen[0] = parser.progress_version
+                progress_box[0] = parser.progress
+                return
+            if stdout_len[0] < STDOUT_KEEP_CHARS:
+                stdout_head.append(line)
+                stdout_len[0] += len(line)
+            if sol is not None:
+                sol_queue.put(SolutionStore.pack(sol))  # 在工作线程里打包，队列中只有紧凑的字节串
+            elif parser.heat_version != heat_seen[0]:
+                # 热力图只需要最新的一份，直接替换
+                heat_seen[0] = parser.heat_version
+                heat_box[0] = (parser.heat_total, parser.heatmap)
+
+        job = pool.create_job(input_text, args=args, on_line=on_line)
+        self._job = job
 
         def run_solver():
             try:
-                # 用 Popen 以便可中断
-                self._proc = subprocess.Popen(
-                    [solver],
-                    stdin=subprocess.PIPE,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-                stdout, stderr = self._proc.communicate(input=input_text)
-                rc = self._proc.returncode
-                # 清理句柄
-                self._last_stdout = stdout or ""
-                self._last_stderr = stderr or ""
+                # 交给常驻引擎进程执行；停止时只取消本次请求
+                pool.run(job)
+                status = job.status
+                self._last_stderr = job.error
             except Exception as e:
-                self._last_stdout = ""
+                status = "error"
                 self._last_stderr = str(e)
-                rc = -999
-            finally:
-                # 线程安全地清理状态
-                def finish():
-                    self._proc = None
-                    self._solver_thread = None
-                    if rc == 0 and not self._stopping:
-                        sols = PuzzleModel.parse_solutions_from_output(self._last_stdout, self.model.n)
-                        self._on_solver_done(sols, None)
-                    else:
-                        if self._stopping:
-                            # 用户主动停止
-                            self._on_solver_done([], "已停止")
-                        else:
-                            msg = (self._last_stderr.strip() or "引擎返回非零退出码")
-                            self._on_solver_done([], f"引擎错误: {msg}")
-                    self._set_running_state(False)
-                    self._stopping = False
-                self.after(0, finish)
+            self._last_stdout = "".join(stdout_head)
+            self._last_stats = parser.stats
+            if stdout_len[0] >= STDOUT_KEEP_CHARS:
+                self._last_stdout += "\n...（输出过长，已截断）\n"
+
+            # 线程安全地清理状态
+            def finish():
+                self._job = None
+                self._solver_thread = None
+                self._drain_solution_queue()
+                self._apply_pending_heat()
+                # 停止分析时引擎仍会回答（部分结果），除非随后又被取消
+                if status == "ok" and (not self._stopping or parser.finished):
+                    self._on_solver_done(None, parser)
+                    if job.cached:
+                        self._sol_status.set(self._sol_status.get()
+                                             + f"（来自缓存，命中率 {self._cache.hit_rate:.0%}）")
+                elif self._stopping or status == "cancelled":
+                    # 用户主动停止
+                    self._on_solver_done("已停止")
+                else:
+                    msg = (self._last_stderr.strip() or "引擎异常退出")
+                    self._on_solver_done(f"引擎错误: {msg}")
+                self._set_running_state(False)
+                self._stopping = False
+            self.after(0, finish)
 
         self._solver_thread = threading.Thread(target=run_solver, daemon=True)
         self._solver_thread.start()
+        self._poll_job = self.after(SOLUTION_POLL_MS, self._poll_solution_queue)
+
+    def _drain_solution_queue(self, max_items=None):
+        # 从队列中取出一批解并追加到 self._solutions；返回是否还有剩余
+        batch = []
+        try:
+            while max_items is None or len(batch) < max_items:
+                batch.append(self._sol_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if batch:
+            self._on_solutions_batch(batch)
+        return not self._sol_queue.empty()
+
+    def _poll_solution_queue(self):
+        self._poll_job = None
+        more = self._drain_solution_queue(SOLUTION_BATCH_MAX)
+        self._apply_pending_heat()
+        self._apply_pending_progress()
+        if self._solver_thread is not None:
+            self._poll_job = self.after(1 if more else SOLUTION_POLL_MS, self._poll_solution_queue)
+
+    def _apply_pending_heat(self):
+        heat = self._heat_box[0]
+        if heat is not None and heat is not self._heat:
+            self._heat = heat
+            self._update_solution_view()
+
+    def _apply_pending_progress(self):
+        progress = self._progress_box[0]
+        if progress is not None and progress is not self._progress:
+            self._progress = progress
+            self.progress_bar.configure(value=min(1.0, progress["explored"]))
+            self._progress_text.set(progress_text(progress))
+
+    def _on_solutions_batch(self, batch):
+        first = not self._solutions
+        self._solutions.extend_packed(batch)
+        if first:
+            self._sol_index = 0
+            self._update_solution_view()
+        else:
+            self._sol_status.set(self._solution_status_text())
+
+    def _get_pool(self, solver):
+        # 引擎路径不变时复用已启动的常驻进程
+        if self._pool is not None and self._pool.solver_path != solver:
+            self._pool.close()
+            self._pool = None
+        if self._pool is None:
+            self._pool = EnginePool(solver, size=1, cache=self._cache)
+        return self._pool
 
     def _stop_solver(self):
-        if self._proc is None:
+        if self._job is None:
+            return
+        if self._stopping:
+            # 再次点击：不再等待部分结果，直接取消
+            self._job.cancel()
             return
         self._stopping = True
-        try:
-            self._proc.terminate()
-        except Exception:
-            pass
+        # 请引擎提前结束搜索并报告已确定的格子；引擎进程保留以供下次求解
+        self._job.stop()
 
     def _on_close(self):
-        # 窗口关闭：若引擎仍在运行，立刻终止
-        if self._proc is not None:
-            try:
-                self._proc.terminate()
-            except Exception:
-                pass
-        # 不等待线程自然结束，直接销毁窗口（子进程已被终止）
+        # 窗口关闭：取消当前请求并关闭常驻引擎进程
+        if self._job is not None:
+            self._job.cancel()
+        if self._deduce_job is not None:
+            self._deduce_job.cancel()
+        for pool in (self._pool, self._deduce_pool):
+            if pool is not None:
+                try:
+                    pool.close()
+                except Exception:
+                    pass
+        self._solutions.close()
+        # 不等待线程自然结束，直接销毁窗口
         try:
             self.destroy()
         except Exception:
             pass
 
-    def _on_solver_done(self, solutions, err_msg):
+    def _on_solver_done(self, err_msg, parser=None):
+        # 解已在求解过程中流式追加到 self._solutions；parser 携带计数/唯一性等结果
+        if self._poll_job is not None:
+            self.after_cancel(self._poll_job)
+            self._poll_job = None
         if err_msg and err_msg != "已停止":
+            self._reset_solutions(self.model.n)
+            self._update_solution_view()
             self._sol_status.set(err_msg)
             messagebox.showerror("求解失败", err_msg)
-            self._solutions = []
-        else:
-            self._solutions = solutions
-            if err_msg == "已停止":
-                self._sol_status.set("已停止")
-            elif not solutions:
-                self._sol_status.set("无解")
-            else:
-                self._sol_status.set(f"共 {len(solutions)} 个解，当前显示第 1 个")
-        self._sol_index = 0
+            return
+        if parser is not None:
+            if parser.unique == "yes":
+                self._sol_note = "（唯一解）"
+            elif parser.unique == "no":
+                self._diff_cells = set(parser.diff)
+                self._sol_note = f"（解不唯一：前两个解有 {len(parser.diff)} 个格子不同，已标红）"
+            elif parser.limited:
+                self._sol_note = "（已达到数量上限）"
+            if parser.orbits and len(parser.orbits) == len(self._solutions):
+                # 对称去重：每个解代表它的整个对称类
+                self._orbits = parser.orbits
+                self._sol_note = f"（对称去重：共 {parser.total} 个解）" + self._sol_note
+            if parser.stopped and parser.deduced and parser.agreed:
+                reason = STOP_REASONS.get(parser.stopped, parser.stopped)
+                self._partial = (reason, parser.deduced, parser.agreed, parser.total or 0)
+                self._show_partial = True
+                self._sol_note = f"（{reason}，搜索未完成）"
         self._update_solution_view()
+        if err_msg == "已停止" and self._heat is not None:
+            self._sol_status.set(f"已停止（热力图已统计 {self._heat[0]} 个解）")
+        elif err_msg == "已停止":
+            self._sol_status.set(f"已停止（已找到 {len(self._solutions)} 个解）")
+        elif self._heat is not None or self._show_partial:
+            pass  # 状态已由热力图 / 部分结果视图给出
+        elif parser is not None and parser.total and not self._solutions:
+            # 仅计数模式：只有总数，没有盘面
+            self._sol_status.set(f"共 {parser.total} 个解（仅计数）" + ("（已达到数量上限）" if parser.limited else ""))
+        elif not self._solutions:
+            self._sol_status.set("无解")
+
+    def _reset_solutions(self, n):
+        # 释放旧的解（包括转存的临时文件），换成空的 n×n 存储
+        self._solutions.close()
+        self._solutions = SolutionStore(n)
+        self._sol_index = 0
+        self._heat = None
+        self._heat_box = [None]
+        self._partial = None
+        self._show_partial = False
+        self._orbits = []
+
+    def _solution_status_text(self):
+        total = len(self._solutions)
+        if self._solver_thread is not None:
+            return f"求解中... 已找到 {total} 个解，当前显示第 {self._sol_index+1} 个"
+        if self._orbits:
+            return (f"共 {total} 个对称类，当前显示第 {self._sol_index+1} 个"
+                    f"（代表 {self._orbits[self._sol_index]} 个对称的解）{self._sol_note}")
+        return f"共 {total} 个解，当前显示第 {self._sol_index+1} 个{self._sol_note}"
 
     def _update_solution_view(self):
         n = self.model.n
-        # 清屏
+        canvas = self.sol_canvas
+        if self._heat is not None and len(self._heat[1]) == n:
+            self._paint_heatmap()
+            return
+        if self._show_partial and self._partial is not None and len(self._partial[1]) == n:
+            self._paint_partial()
+            return
+        # 显示当前解（无解时清空）；画布只重绘与上一次显示不同的格子
+        # 只解包当前显示的一个解；调整棋盘大小后，旧的解不再对应当前盘面
+        sol = None
+        if self._solutions and self._solutions.n == n:
+            sol = self._solutions[self._sol_index]
         for r in range(n):
             for c in range(n):
-                lbl = self._sol_labels[r][c]
-                lbl.config(text="", bg="#f5f5f5", fg="#000000")
-        # 显示当前解
-        if self._solutions:
-            sol = self._solutions[self._sol_index]
-            for r in range(n):
-                for c in range(n):
-                    v = sol[r][c]
-                    if v == 0:
-                        self._sol_labels[r][c].config(text="0", bg="#2e2e2e", fg="#ffffff")
-                    elif v == 1:
-                        self._sol_labels[r][c].config(text="1", bg="#a6c8ff", fg="#113355")
-                    else:
-                        self._sol_labels[r][c].config(text=str(v), bg="#dddddd", fg="#000000")
-            self._sol_status.set(f"共 {len(self._solutions)} 个解，当前显示第 {self._sol_index+1} 个")
+                if sol is None:
+                    canvas.paint(r, c, *SOL_EMPTY)
+                    continue
+                v = sol[r][c]
+                if (r, c) in self._diff_cells and v in DIFF_BG:
+                    canvas.paint(r, c, str(v), DIFF_BG[v], "#ffffff" if v == 0 else "#113355")
+                elif v == 0:
+                    canvas.paint(r, c, "0", "#2e2e2e", "#ffffff")
+                elif v == 1:
+                    canvas.paint(r, c, "1", "#a6c8ff", "#113355")
+                else:
+                    canvas.paint(r, c, str(v), "#dddddd", "#000000")
+        if sol is not None:
+            self._sol_status.set(self._solution_status_text())
         # 居中显示
         self.solution_sa.recenter()
 
+    def _paint_heatmap(self):
+        # 热力图：每格显示为舰体的解所占百分比，必为舰体 / 必为海水的格子单独配色
+        total, counts = self._heat
+        n = self.model.n
+        forced_ship = forced_water = 0
+        for r in range(n):
+            for c in range(n):
+                k = counts[r][c]
+                forced_ship += k == total
+                forced_water += k == 0
+                self.sol_canvas.paint(r, c, *heat_cell_style(k, total))
+        if self._solver_thread is not None:
+            self._sol_status.set(f"求解中... 热力图已统计 {total} 个解（必为舰体 {forced_ship} 格，必为海水 {forced_water} 格）")
+        else:
+            self._sol_status.set(f"热力图：共 {total} 个解，必为舰体 {forced_ship} 格，必为海水 {forced_water} 格"
+                                 f"{self._sol_note}")
+        self.solution_sa.recenter()
+
+    def _paint_partial(self):
+        # 部分结果：根节点即可确定的格子与只在已找到的解中一致的格子分别配色，其余显示为 ?
+        reason, deduced, agreed, found = self._partial
+        n = self.model.n
+        proven = shared = 0
+        for r in range(n):
+            for c in range(n):
+                d, a = deduced[r][c], agreed[r][c]
+                if d in PARTIAL_DEDUCED:
+                    proven += 1
+                    self.sol_canvas.paint(r, c, *PARTIAL_DEDUCED[d])
+                elif a in PARTIAL_AGREED:
+                    shared += 1
+                    self.sol_canvas.paint(r, c, *PARTIAL_AGREED[a])
+                else:
+                    self.sol_canvas.paint(r, c, *PARTIAL_UNKNOWN)
+        text = (f"{reason}，搜索未完成：已找到 {found} 个解；根节点确定 {proven} 格（深绿），"
+                f"已找到的解一致 {shared} 格（黄褐）")
+        if self._solutions:
+            text += "；点“上一解/下一解”查看已找到的解"
+        self._sol_status.set(text)
+        self.solution_sa.recenter()
+
     def _prev_solution(self):
         if not self._solutions:
             return
+        if self._show_partial:
+            self._show_partial = False
+            self._update_solution_view()
+            return
         self._sol_index = (self._sol_index - 1) % len(self._solutions)
         self._update_solution_view()
 
     def _next_solution(self):
         if not self._solutions:
             return
+        if self._show_partial:
+            self._show_partial = False
+            self._update_solution_view()
+            return
         self._sol_index = (self._sol_index + 1) % len(self._solutions)
         self._update_solution_view()
 
@@ -704,7 +1227,7 @@ class BattleshipUI(tk.Tk):
     def _import_parse_and_apply(self, text_widget, win_to_close=None):
         text = text_widget.get("1.0", tk.END)
         try:
-            K, n, col_targets, row_targets, board = self._parse_engine_input_text(text)
+            K, n, col_targets, row_targets, board = PuzzleModel.parse_engine_input_text(text)
         except Exception as e:
             messagebox.showerror("解析失败", f"{e}")
             return
@@ -723,81 +1246,14 @@ class BattleshipUI(tk.Tk):
         self.model.row_targets = row_targets
         self.model.board = board
 
-        self._rebuild_grids()
+        # 复用已有的格子与输入框：调整大小后按新盘面重绘
+        self._resize_grids()
+        self._refresh_board()
+        self._refresh_targets()
         if win_to_close:
             win_to_close.destroy()
         messagebox.showinfo("导入成功", f"已导入：K={K}, n={n}")
 
-    def _parse_engine_input_text(self, text):
-        # 去掉 Solutions 块，只解析前 (1 + m) 行
-        raw_lines = [ln.strip() for ln in text.splitlines()]
-        # 过滤空行，并将 , ; 转为空格
-        lines = []
-        for ln in raw_lines:
-            if not ln.strip():
-                continue
-            ln = ln.replace(",", " ").replace(";", " ")
-            # 遇到 "Solutions:" 就停止（导入仅关心输入）
-            if ln.lower().startswith("solutions:"):
-                break
-            lines.append(ln)
-
-        if len(lines) < 2:
-            raise ValueError("缺少 K 或矩阵首行")
-
-        # 解析 K
-        try:
-            K = int(lines[0].split()[0])
-        except:
-            raise ValueError("第一行 K 解析失败")
-
-        # 解析矩阵第一行（长度 m = n+1）
-        try:
-            top = [int(x) for x in lines[1].split()]
-        except:
-            raise ValueError("矩阵首行解析失败")
-        m = len(top)
-        if m < 2:
-            raise ValueError("矩阵首行长度不足，应为 n+1")
-        # 需要再有 m-1 行
-        if len(lines) < 1 + m:
-            raise ValueError(f"矩阵行数不足，应至少有 {m} 行（包含首行）")
-
-        grid = [top]
-        for i in range(m - 1):
-            # 从 lines[2] 开始读取每一行
-            try:
-                row = [int(x) for x in lines[2 + i].split()]
-            except:
-                raise ValueError(f"矩阵第 {i+2} 行解析失败")
-            if len(row) != m:
-                raise ValueError(f"矩阵第 {i+2} 行长度应为 {m}，实际 {len(row)}")
-            grid.append(row)
-
-        # 生成 n、行列目标、棋盘
-        n = m - 1
-        col_targets = grid[0][1:]
-        row_targets = [grid[r][0] for r in range(1, m)]
-
-        # 校验值域
-        board = [[-1 for _ in range(n)] for __ in range(n)]
-        for r in range(n):
-            for c in range(n):
-                v = grid[r + 1][c + 1]
-                if v not in (-1, 0, 1, 2, 3, 4, 5, 6):
-                    raise ValueError(f"内部格子({r+1},{c+1})非法值 {v}（仅允许 -1/0/1/2/3/4/5/6）")
-                board[r][c] = v
-
-        # 非负目标
-        for idx, t in enumerate(row_targets, 1):
-            if t < 0:
-                raise ValueError(f"第 {idx} 行目标为负数：{t}")
-        for idx, t in enumerate(col_targets, 1):
-            if t < 0:
-                raise ValueError(f"第 {idx} 列目标为负数：{t}")
-
-        return K, n, col_targets, row_targets, board
-
     # ===== 调试显示 =====
 
     def _show_last_input(self):
@@ -811,7 +1267,34 @@ class BattleshipUI(tk.Tk):
             messagebox.showinfo("引擎输出", "尚未求解或无记录。")
             return
         text = "[STDOUT]\n" + (self._last_stdout or "") + "\n\n[STDERR]\n" + (self._last_stderr or "")
-        self._show_text_window("引擎输出", text)
+        win = self._show_text_window("引擎输出", text)
+        if self._last_stats:
+            self._add_stats_table(win, self._last_stats)
+
+    def _add_stats_table(self, win, stats):
+        # 在输出文本上方以树形表格显示 --stats 的统计
+        frame = ttk.LabelFrame(win, text="搜索统计")
+        frame.pack(side=tk.TOP, fill=tk.X, padx=4, pady=4, before=win.winfo_children()[0])
+        tree = ttk.Treeview(frame, columns=("value",), height=14)
+        tree.heading("#0", text="项目")
+        tree.heading("value", text="值")
+        tree.column("#0", width=260)
+        tree.column("value", width=160, anchor="e")
+        tree.pack(fill=tk.X)
+
+        def insert(parent, data):
+            for key, value in data.items():
+                label = STATS_LABELS.get(key, key)
+                if isinstance(value, dict):
+                    # 只有“触发 / 冲突”两项的规则压成一行
+                    if set(value) == {"fires", "conflicts"}:
+                        tree.insert(parent, "end", text=label, values=(f"{value['fires']} / {value['conflicts']}",))
+                    else:
+                        insert(tree.insert(parent, "end", text=label, open=True), value)
+                else:
+                    tree.insert(parent, "end", text=label, values=(value,))
+
+        insert("", stats)
 
     def _show_text_window(self, title, content):
         win = tk.Toplevel(self)
@@ -820,6 +1303,7 @@ class BattleshipUI(tk.Tk):
         txt.pack(fill=tk.BOTH, expand=True)
         txt.insert("1.0", content)
         txt.configure(state="disabled")
+        return win
 
 
 if __name__ == "__main__":
@@ -0,0 +1,46 @@
+"""
+测试共用：为当前的 BattleShips.cpp 构建（或复用缓存中的）-O2 引擎与共享库，并生成测试用谜题。
+缓存目录默认为系统临时目录下的 battleships-test-engines，可用环境变量 BATTLESHIPS_TEST_BUILD_DIR 指定；
+没有 C++ 编译器时相关测试跳过。
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from BattleShipsBuild import DEFAULT_COMPILER, EngineBuilder  # noqa: E402
+
+BUILD_DIR = os.environ.get("BATTLESHIPS_TEST_BUILD_DIR") or os.path.join(tempfile.gettempdir(), "battleships-test-engines")
+
+_builder = None
+
+
+def _get_builder():
+    global _builder
+    if shutil.which(DEFAULT_COMPILER) is None:
+        raise unittest.SkipTest(f"没有编译器 {DEFAULT_COMPILER}")
+    if _builder is None:
+        _builder = EngineBuilder(cache_dir=BUILD_DIR)
+    return _builder
+
+
+def engine_path():
+    """引擎可执行文件（按源码哈希缓存）"""
+    return _get_builder().build("O2")
+
+
+def library_path():
+    """引擎共享库（按源码哈希缓存）"""
+    return _get_builder().build("O2", library=True)
+
+
+def uniform_puzzle(n, target, K=0):
+    """每行每列提示均为 target、没有已知格子的 n×n 谜题（引擎输入文本）；K=0 时不校验舰队"""
+    lines = [str(K), " ".join(["-1"] + [str(target)] * n)]
+    lines += [" ".join([str(target)] + ["-1"] * n) for _ in range(n)]
+    return "\n".join(lines) + "\n"
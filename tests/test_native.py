@@ -0,0 +1,36 @@
+"""进程内求解（BattleShipsNative）：负的数量上限应报错，而不是写出缓冲区"""
+import ctypes
+import unittest
+
+from _engine import library_path
+from BattleShipsEngine import PuzzleModel
+from BattleShipsNative import BS_ERROR, NativeLibrary, NativeSolver
+
+
+def uniform_model(n, target):
+    model = PuzzleModel(n, K=0)
+    model.row_targets = [target] * n
+    model.col_targets = [target] * n
+    return model
+
+
+class NativeLimitTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.lib = NativeLibrary(library_path())
+
+    def test_solutions_negative_limit(self):
+        with NativeSolver(uniform_model(8, 2), self.lib) as s:
+            with self.assertRaises(ValueError):
+                s.solutions(limit=-1)
+            self.assertEqual(len(s.solutions(limit=3)), 3)
+
+    def test_solve_into_negative_capacity(self):
+        with NativeSolver(uniform_model(8, 2), self.lib) as s:
+            out = ctypes.create_string_buffer(1)
+            self.assertEqual(self.lib.lib.bs_solve_into(s._h, out, -1), BS_ERROR)
+            self.assertIn("capacity", self.lib.last_error())
+
+
+if __name__ == "__main__":
+    unittest.main()
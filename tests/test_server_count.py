@@ -0,0 +1,43 @@
+"""server 模式（EnginePool）下的 --count-only：逐行计数与置换表中的解数复用不应因 STOP 通道而失效"""
+import unittest
+
+from _engine import engine_path, uniform_puzzle
+from BattleShipsEngine import EnginePool, SolutionStreamParser
+
+# 10×10、每行每列 2 个舰体、不校验舰队：233819230 个解，逐行计数约 1 秒，逐个搜索则要数分钟
+ROWS_PUZZLE = uniform_puzzle(10, 2)
+ROWS_SOLUTIONS = 233819230
+
+
+def run_job(pool, text, args, n):
+    """在引擎进程池中运行一个请求，返回 (job, parser)"""
+    parser = SolutionStreamParser(n)
+    job = pool.solve(text, args=args, on_line=parser.feed)
+    return job, parser
+
+
+class ServerCountTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = EnginePool(engine_path(), size=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def test_count_method_rows(self):
+        job, parser = run_job(self.pool, ROWS_PUZZLE, ["--count-only", "--count-method", "rows", "--stats"], 10)
+        self.assertEqual(job.status, "ok", job.error)
+        self.assertEqual(parser.total, ROWS_SOLUTIONS)
+        self.assertGreater(parser.stats["row_states"], 0)
+        self.assertEqual(parser.stats["nodes"], 0)
+
+    def test_count_method_auto_switches_to_rows(self):
+        job, parser = run_job(self.pool, ROWS_PUZZLE, ["--count-only", "--stats"], 10)
+        self.assertEqual(job.status, "ok", job.error)
+        self.assertEqual(parser.total, ROWS_SOLUTIONS)
+        self.assertGreater(parser.stats["row_states"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+"""server 模式（EnginePool）下的 --count-only --count-method search：置换表应复用已数过的子树解数"""
+import unittest
+
+from _engine import engine_path, uniform_puzzle
+from BattleShipsEngine import EnginePool, SolutionStreamParser
+
+# 8×8、每行每列 2 个舰体、不校验舰队：21702 个解
+PUZZLE = uniform_puzzle(8, 2)
+SOLUTIONS = 21702
+
+
+class ServerMemoTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = EnginePool(engine_path(), size=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def solve(self, args):
+        parser = SolutionStreamParser(8)
+        job = self.pool.solve(PUZZLE, args=args + ["--count-method", "search", "--stats"], on_line=parser.feed)
+        self.assertEqual(job.status, "ok", job.error)
+        return parser
+
+    def test_count_reuses_memo(self):
+        count = self.solve(["--count-only"])
+        # --heatmap 要看每个解，置换表不能代替它们，只能逐个搜索
+        heatmap = self.solve(["--count-only", "--heatmap"])
+        self.assertEqual(count.total, SOLUTIONS)
+        self.assertEqual(heatmap.total, SOLUTIONS)
+        self.assertGreater(count.stats["memo"]["hits"], 0)
+        # 无解子树在两种请求中都会命中；只有复用解数时搜索的节点才会减少
+        self.assertLess(count.stats["nodes"], heatmap.stats["nodes"])
+
+
+if __name__ == "__main__":
+    unittest.main()